@@ -0,0 +1,158 @@
+"""
+Команды администратора, общие для синхронного (handlers.py) и асинхронного
+(async_handlers.py) ботов.
+
+Функции выполняют команду и возвращают текст ответа; отправку выполняет
+модуль обработчиков — через OutboundQueue или корутинами через AsyncOutbound.
+"""
+from collections import namedtuple
+
+from broadcast import parse_filters
+from logger import logger
+from profiling import profiler, PROFILE_FORMATS
+
+# Профиль, который нужно отправить администратору файлом
+ProfileDocument = namedtuple('ProfileDocument', ['file_name', 'data', 'caption', 'description'])
+
+
+def format_broadcast_report(report):
+    error = f"Прервана с ошибкой: {report['error']}\n" if report.get('error') else ""
+    return error + (
+        f"Получателей: {report['total']}\n"
+        f"Отправлено: {report['sent']}\n"
+        f"Заблокировали бота: {report['blocked']}\n"
+        f"Ошибки: {report['failed']}\n"
+        f"Пропущено (уже отправлялось): {report['skipped']}\n"
+        f"Не подтверждено до сбоя: {report['uncertain']}\n"
+        f"Время: {report['elapsed_s']} с, {report['per_second']} сообщ./с"
+    )
+
+
+def broadcast_finished(job, report):
+    """
+    Итог рассылки для администратора, запустившего её.
+
+    :param job: Задание рассылки
+    :param report: Отчёт Broadcast.report()
+    """
+    status = "прервана, продолжится после перезапуска" if report.get('error') else "завершена"
+    return f"Рассылка {job['id']} {status}.\n\n" + format_broadcast_report(report)
+
+
+def shards_status(dispatcher):
+    """
+    Глубина очередей диспетчера и задержка обработки.
+
+    :param dispatcher: ShardedDispatcher или None, если обновления обрабатываются без него
+    """
+    if dispatcher is None:
+        return "Диспетчер обновлений выключен (UPDATE_SHARDS = 0)."
+    lines = [
+        f"{s['shard']}: в очереди {s['depth']}, обработано {s['processed']}, "
+        f"задержка {s['last_lag_ms']:.0f}/{s['avg_lag_ms']:.0f}/{s['max_lag_ms']:.0f} мс"
+        for s in dispatcher.stats()
+    ]
+    return "Очереди (задержка: последняя/средняя/макс.):\n" + "\n".join(lines)
+
+
+def start_broadcast(broadcaster, user_id, message_text, on_finish):
+    """
+    Запускает рассылку. Формат: первая строка — /broadcast и фильтры
+    (например is_registered=1 is_payment_confirmed=0), остальные строки — текст в HTML.
+
+    :param broadcaster: Broadcast
+    :param user_id: Администратор, которому придёт итог
+    :param message_text: Текст сообщения с командой
+    :param on_finish: Функция, получающая задание и отчёт по завершении
+    """
+    command, _, text = message_text.partition('\n')
+    try:
+        filters = parse_filters(command.split()[1:])
+    except ValueError as e:
+        return str(e)
+    if not text.strip():
+        return "Укажите текст рассылки со второй строки:\n/broadcast is_registered=1\nТекст сообщения"
+    if not broadcaster.start(user_id, text.strip(), filters, on_finish=on_finish):
+        return "Другая рассылка ещё не завершена, см. /broadcast_status."
+    logger.info(f"Администратор {user_id} запустил рассылку с фильтрами {filters}.")
+    return "Рассылка запущена. Ход: /broadcast_status"
+
+
+def broadcast_status(broadcaster):
+    """
+    Ход текущей или последней рассылки.
+
+    :param broadcaster: Broadcast
+    """
+    report = broadcaster.report()
+    if report is None:
+        return "Рассылок ещё не было."
+    if report['running']:
+        status = "идёт"
+    else:
+        status = "прервана" if report.get('error') else "завершена"
+    return f"Рассылка {status}.\n\n" + format_broadcast_report(report)
+
+
+def profiles(user_id, message_text):
+    """
+    Список самых медленных профилей обновлений и управление профилированием.
+    Формат: /profiles, /profiles off, /profiles sample 0.05, /profiles threshold 300, /profiles clear.
+
+    :param user_id: Администратор
+    :param message_text: Текст сообщения с командой
+    """
+    args = message_text.split()[1:]
+    if args:
+        mode = args[0]
+        if mode == 'clear':
+            profiler.clear()
+            return "Сохранённые профили удалены."
+        try:
+            value = float(args[1]) if len(args) > 1 else None
+            if mode == 'sample':
+                profiler.configure(mode, sample_rate=value)
+            elif mode == 'threshold':
+                profiler.configure(mode, threshold_ms=value)
+            else:
+                profiler.configure(mode)
+        except ValueError as e:
+            return f"Не удалось изменить режим: {e}"
+        logger.info(f"Администратор {user_id} переключил профилирование: {' '.join(args)}.")
+
+    if profiler.mode == 'sample':
+        mode = f"sample, доля {profiler.sample_rate:g}"
+    elif profiler.mode == 'threshold':
+        mode = f"threshold, порог {profiler.threshold * 1000:.0f} мс"
+    else:
+        mode = "off"
+    lines = [f"Профилирование: {mode}."]
+    entries = profiler.profiles()
+    if entries:
+        lines.append("Самые медленные обновления (скачать: /profile <номер> [pstats|collapsed]):")
+        lines.extend(
+            f"{entry['id']}: {entry['label']}, {entry['elapsed_ms']:.0f} мс, {entry['captured_at']}"
+            for entry in entries
+        )
+    else:
+        lines.append("Профилей пока нет.")
+    return "\n".join(lines)
+
+
+def profile_document(message_text):
+    """
+    Профиль обновления для отправки файлом. Формат: /profile <номер> [pstats|collapsed].
+
+    :param message_text: Текст сообщения с командой
+    :return: (текст ответа, None), если профиль не найден, иначе (None, ProfileDocument)
+    """
+    args = message_text.split()[1:]
+    fmt = args[1] if len(args) > 1 else 'pstats'
+    if not args or not args[0].isdigit() or fmt not in PROFILE_FORMATS:
+        return "Формат: /profile <номер> [pstats|collapsed]. Номера: /profiles", None
+    entry = profiler.get(int(args[0]))
+    if entry is None:
+        return "Профиль не найден, список: /profiles", None
+    file_name, data = profiler.export(entry, fmt)
+    return None, ProfileDocument(file_name, data, f"{entry['label']}, {entry['elapsed_ms']:.0f} мс",
+                                 f"профиля {entry['id']}")
@@ -0,0 +1,54 @@
+import asyncio
+import atexit
+import signal
+
+from telebot import asyncio_filters
+
+import storage
+from async_handlers import (
+    bot, broadcast_outbound, broadcaster, outbound, payment_index, state_storage, send_broadcast_report
+)
+from config import METRICS_PORT, STATE_STORAGE_BACKEND
+from logger import logger
+from metrics import MetricsServer
+
+
+bot.add_custom_filter(asyncio_filters.StateFilter(bot))
+
+# При любом завершении записываем отложенные изменения пользователей
+atexit.register(storage.shutdown)
+if STATE_STORAGE_BACKEND == 'sqlite':
+    atexit.register(state_storage.stop)
+atexit.register(payment_index.stop)
+
+
+def handle_sigterm(polling):
+    logger.info("Получен SIGTERM, завершаем работу бота.")
+    # Отмена прерывает ожидание getUpdates; после выхода из asyncio.run выполняются обработчики atexit
+    polling.cancel()
+
+
+async def main():
+    if METRICS_PORT:
+        MetricsServer().start()
+    # Поток рассылки отправляет сообщения через этот цикл событий
+    broadcast_outbound.attach(asyncio.get_running_loop())
+    # Незавершённая до перезапуска рассылка продолжается без повторных отправок
+    broadcaster.resume(on_finish=send_broadcast_report)
+    # getUpdates не работает, пока зарегистрирован вебхук
+    await bot.delete_webhook()
+    polling = asyncio.create_task(bot.infinity_polling())
+    # Без обработчика SIGTERM завершает процесс сразу, и atexit не записывает отложенные изменения
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, handle_sigterm, polling)
+    try:
+        await polling
+    except asyncio.CancelledError:
+        pass
+    finally:
+        logger.info(f"Асинхронный бот остановлен, отправка: {outbound.stats()}")
+        await bot.close_session()
+
+
+# Асинхронный режим; синхронный по-прежнему запускается через bot.py
+if __name__ == "__main__":
+    asyncio.run(main())
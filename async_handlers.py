@@ -0,0 +1,429 @@
+"""
+Обработчики бота для асинхронного режима на AsyncTeleBot.
+
+Шаги регистрации и команды администратора общие с handlers.py
+(registration.py, admin.py); здесь только обращения к Telegram, которые
+выполняются корутинами, а работа с диском и сверка — в пулах потоков. Один процесс обслуживает тысячи одновременных
+пользователей без потока на каждый запрос.
+Запуск: python async_bot.py
+"""
+import asyncio
+import io
+
+from telebot import types
+from telebot.apihelper import ApiTelegramException
+from telebot.async_telebot import AsyncTeleBot
+from telebot.asyncio_storage import StateMemoryStorage
+
+from config import (API_TOKEN, TARGET_USER_ID, STATE_STORAGE_BACKEND, REPORT_DOCUMENT_THRESHOLD,
+                    REPORT_DOCUMENT_FORMAT)
+from logger import logger
+from media_cache import MediaCache
+from menus import MENU_PLANS, validate_menus
+from broadcast import Broadcast
+from metrics import format_summary, track_handler
+from models import User
+from outbound import AsyncOutbound, AsyncOutboundBridge
+from payments import PaymentIndex
+from reconciliation import submit_reconciliation
+import admin
+import registration
+from report import REPORT_CALLBACK_PREFIX, ReportPages, paginate, parse_page_callback, write_document
+from state_storage import AsyncSQLiteStateStorage
+from states import TicketPurchaseStates
+from storage import load_users
+
+if STATE_STORAGE_BACKEND == 'sqlite':
+    state_storage = AsyncSQLiteStateStorage()
+    state_storage.start_evictor()
+else:
+    state_storage = StateMemoryStorage()
+
+bot = AsyncTeleBot(API_TOKEN, state_storage=state_storage)
+outbound = AsyncOutbound()
+# Рассылка идёт в своём потоке и отправляет через цикл событий (цикл задаёт async_bot.main)
+broadcast_outbound = AsyncOutboundBridge(outbound, bot)
+broadcaster = Broadcast(broadcast_outbound)
+
+# Загрузка выполняется один раз до запуска цикла событий
+users = load_users()
+payment_index = PaymentIndex()
+payment_index.start_watcher()
+media_cache = MediaCache()
+report_pages = ReportPages()
+# Цикл событий хранит на задачи только слабые ссылки: без этого множества фоновая задача
+# может быть собрана сборщиком мусора до завершения
+background_tasks = set()
+logger.info("Асинхронный бот инициализирован и пользователи загружены.")
+
+def _finish_background_task(task):
+    background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Ошибка в фоновой задаче {task.get_name()}: {task.exception()}")
+
+
+def spawn(coro, name=None):
+    """
+    Запускает корутину в фоне, сохраняя ссылку на задачу до её завершения.
+
+    :return: asyncio.Task
+    """
+    task = asyncio.create_task(coro, name=name)
+    background_tasks.add(task)
+    task.add_done_callback(_finish_background_task)
+    return task
+
+
+def _read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def create_keyboard(menu_name):
+    keyboard = types.InlineKeyboardMarkup()
+    plan = MENU_PLANS.get(menu_name)
+    for text, callback_data in (plan.buttons if plan else ()):
+        keyboard.add(types.InlineKeyboardButton(text=text, callback_data=callback_data))
+    return keyboard
+
+
+async def send_message(user_id, text, description=None, **kwargs):
+    return await outbound.call(user_id, bot.send_message, user_id, text, description=description, **kwargs)
+
+
+async def _send_photo_group(user_id, photos, use_cache=True):
+    media_group = []
+    sent = []
+    uploads = []
+    for photo in photos:
+        try:
+            file_id = await asyncio.to_thread(media_cache.get, photo) if use_cache else None
+            if file_id:
+                media_group.append(types.InputMediaPhoto(file_id))
+                uploads.append(None)
+            else:
+                media_group.append(types.InputMediaPhoto(await asyncio.to_thread(_read_file, photo)))
+                uploads.append(photo)
+            sent.append(photo)
+        except FileNotFoundError:
+            logger.error(f"Файл {photo} не найден.")
+    if not media_group:
+        return
+
+    try:
+        messages = await bot.send_media_group(user_id, media=media_group)
+    except ApiTelegramException as e:
+        cached = [photo for photo, upload in zip(sent, uploads) if upload is None]
+        if not cached or e.error_code != 400:
+            raise
+        logger.warning(f"Не удалось отправить фотографии по file_id пользователю {user_id}: {e}")
+        await asyncio.to_thread(media_cache.invalidate, cached)
+        await _send_photo_group(user_id, photos, use_cache=False)
+        return
+    await asyncio.to_thread(media_cache.remember, uploads, messages)
+
+
+async def _send_cached_document(user_id, doc):
+    file_id = await asyncio.to_thread(media_cache.get, doc)
+    if file_id:
+        try:
+            await bot.send_document(user_id, file_id)
+            return
+        except ApiTelegramException as e:
+            if e.error_code != 400:
+                raise
+            await asyncio.to_thread(media_cache.invalidate, [doc])
+    message = await bot.send_document(user_id, await asyncio.to_thread(_read_file, doc))
+    await asyncio.to_thread(media_cache.remember, [doc], [message])
+
+
+async def send_menu(user_id, menu_name, user_data=None, custom_keyboard=None):
+    """
+    Отправляет меню пользователю по плану из MENU_PLANS.
+
+    :param user_id: Идентификатор пользователя
+    :param menu_name: Название меню из конфигурации MENUS
+    :param user_data: Дополнительные данные для форматирования текста
+    :param custom_keyboard: Пользовательская клавиатура (если есть)
+    """
+    plan = MENU_PLANS.get(menu_name)
+    if not plan:
+        logger.error(f"Меню '{menu_name}' не найдено в конфигурации.")
+        return
+
+    if plan.photos:
+        await outbound.call(user_id, _send_photo_group, user_id, plan.photos, cost=len(plan.photos),
+                            description=f"медиа-группы меню '{menu_name}'")
+    for doc in plan.documents:
+        await outbound.call(user_id, _send_cached_document, user_id, doc, description=f"документа '{doc}'")
+
+    text = plan.text.format(**user_data) if user_data else plan.text
+    await send_message(user_id, text, reply_markup=custom_keyboard or plan.keyboard, parse_mode='HTML',
+                       description=f"сообщения меню '{menu_name}'")
+    logger.debug("Отправлено меню '%s' пользователю %s.", menu_name, user_id)
+
+
+async def _send_report_file(user_id, path, caption):
+    # Файл открывается на каждую попытку: при повторе после 429 он читается с начала
+    with open(path, 'rb') as document:
+        return await bot.send_document(user_id, types.InputFile(document, file_name=f"сверка{path.suffix}"),
+                                       caption=caption)
+
+
+async def _deliver_report_document(user_id, report):
+    # Выгрузка в файл — блокирующая запись на диск, поэтому в отдельном потоке
+    path = await asyncio.to_thread(write_document, report, REPORT_DOCUMENT_FORMAT)
+    try:
+        await outbound.call(user_id, _send_report_file, user_id, path, "Схожести: отчёт слишком большой для сообщений",
+                            description='документа с результатом сверки')
+    finally:
+        path.unlink(missing_ok=True)
+
+
+async def _deliver_result(user_id, future):
+    try:
+        report = await asyncio.wrap_future(future)
+    except Exception as e:
+        logger.error(f"Ошибка при выполнении сверки для пользователя {user_id}: {e}")
+        await send_message(user_id, "Не удалось провести сверку. Попробуйте позже.")
+        return
+    if report.is_empty:
+        await send_message(user_id, '<b>Схожести:</b>\nВсе данные совпадают идеально!', parse_mode='HTML',
+                           description='результата сверки')
+    elif await asyncio.to_thread(report.text_length) > REPORT_DOCUMENT_THRESHOLD:
+        try:
+            await _deliver_report_document(user_id, report)
+        except Exception as e:
+            logger.error(f"Ошибка при выгрузке отчёта сверки в файл для пользователя {user_id}: {e}")
+            await send_message(user_id, "Не удалось подготовить файл с отчётом. Попробуйте позже.")
+            return
+    else:
+        report_id = report_pages.add(await asyncio.to_thread(list, paginate(report.sections())))
+        text, keyboard = report_pages.render(report_id, 0)
+        await send_message(user_id, text, parse_mode='HTML', reply_markup=keyboard, description='результата сверки')
+    logger.info(f"Результат сверки отправлен пользователю {user_id}.")
+
+
+async def handle_report_page(call):
+    if call.from_user.id not in TARGET_USER_ID:
+        await bot.answer_callback_query(call.id, "Недоступно.")
+        return
+    parsed = parse_page_callback(call.data)
+    if parsed is None:
+        await bot.answer_callback_query(call.id, "Неизвестная команда.")
+        return
+    report_id, index = parsed
+    if index is None:
+        # Кнопка с номером страницы ничего не меняет
+        await bot.answer_callback_query(call.id)
+        return
+    page = report_pages.render(report_id, index)
+    if page is None:
+        await bot.answer_callback_query(call.id, "Отчёт устарел, проведите сверку заново.")
+        return
+    await bot.answer_callback_query(call.id)
+    text, keyboard = page
+    chat_id = call.message.chat.id
+    await outbound.call(chat_id, bot.edit_message_text, text, chat_id, call.message.message_id, parse_mode='HTML',
+                        reply_markup=keyboard, description=f"страницы {index + 1} отчёта {report_id}")
+
+
+async def handle_send_result(call):
+    user_id = call.from_user.id
+    logger.debug("Пользователь %s инициировал сверку данных.", user_id)
+    # Сверка выполняется в её собственном пуле потоков, цикл событий только ждёт результат
+    future = submit_reconciliation()
+    await bot.answer_callback_query(call.id, "Сверка запущена…")
+    spawn(_deliver_result(user_id, future), name=f'reconciliation-result-{user_id}')
+
+
+async def apply_reply(user_id, reply, call=None, custom_keyboard=None):
+    """
+    Выполняет ответ шага регистрации (см. handlers.apply_reply).
+    """
+    if call is not None:
+        await bot.answer_callback_query(call.id, reply.alert)
+    elif reply.alert:
+        await send_message(user_id, reply.alert)
+
+    try:
+        if reply.delete_state:
+            await bot.delete_state(user_id)
+        elif reply.state is not None:
+            await bot.set_state(user_id, reply.state)
+    except Exception as e:
+        logger.error(f"Ошибка при смене состояния пользователя {user_id}: {e}")
+
+    if reply.text:
+        await send_message(user_id, reply.text, parse_mode=reply.parse_mode)
+    if reply.menu:
+        await send_menu(user_id, reply.menu, reply.user_data, custom_keyboard)
+
+
+async def handle_buy_ticket(call):
+    user_id = call.from_user.id
+    await apply_reply(user_id, registration.buy_ticket(user_id, users.get(user_id)), call)
+
+
+@bot.message_handler(state=TicketPurchaseStates.waiting_for_university)
+async def process_university(message):
+    user_id = message.from_user.id
+    with track_handler('state:waiting_for_university'):
+        await apply_reply(user_id, registration.enter_university(user_id, users.get(user_id), message.text))
+
+
+async def handle_faculty_selection(call):
+    user_id = call.from_user.id
+    await apply_reply(user_id, registration.choose_faculty(user_id, users.get(user_id), call.data), call)
+
+
+async def handle_info_source_selection(call):
+    user_id = call.from_user.id
+    await apply_reply(user_id, registration.choose_info_source(user_id, users.get(user_id), call.data), call)
+
+
+async def handle_confirmation(call):
+    user_id = call.from_user.id
+    await apply_reply(user_id, registration.confirm(user_id, users.get(user_id), call.data), call)
+
+
+@bot.message_handler(state=TicketPurchaseStates.waiting_for_name)
+async def process_name(message):
+    user_id = message.from_user.id
+    with track_handler('state:waiting_for_name'):
+        await apply_reply(user_id, registration.enter_name(user_id, users.get(user_id), message.text))
+
+
+async def handle_change_data(call):
+    user_id = call.from_user.id
+    await apply_reply(user_id, registration.change_data(user_id, users.get(user_id)), call)
+
+
+async def check_oplata(call):
+    user_id = call.from_user.id
+    # Журнал подтверждений пишется на диск — выносим из цикла событий
+    count = await asyncio.to_thread(payment_index.confirm, user_id)
+    await apply_reply(user_id, registration.payment_checked(user_id, count), call)
+
+
+async def handle_main_menu(call):
+    user_id = call.from_user.id
+    await apply_reply(user_id, registration.main_menu(user_id, users.get(user_id)), call)
+
+
+def _menu_handler(menu_name):
+    async def handler(call):
+        await send_menu(call.from_user.id, menu_name)
+    return handler
+
+
+# Словарь соответствия callback_data обработчикам (как в handlers.callback_handlers)
+callback_handlers = {
+    'buy_ticket': handle_buy_ticket,
+    'change_data': handle_change_data,
+    'confirm_yes': handle_confirmation,
+    'confirm_no': handle_confirmation,
+    'menu_osninfo': _menu_handler('menu_osninfo'),
+    'menu_pravila': _menu_handler('menu_pravila'),
+    'menu_bar': _menu_handler('menu_bar'),
+    'menu_loft': _menu_handler('menu_loft'),
+    'menu_main': handle_main_menu,
+    'send__result': handle_send_result,
+    'event_info': _menu_handler('event_info_menu'),
+    'check_payment': check_oplata,
+}
+callback_handlers.update({f'faculty_{key}': handle_faculty_selection for key in registration.FACULTIES})
+callback_handlers.update({f'info_source_{key}': handle_info_source_selection for key in registration.INFO_SOURCES})
+
+validate_menus(MENU_PLANS, callback_handlers, User.__slots__)
+
+
+@bot.callback_query_handler(func=lambda call: True)
+async def callback_query(call):
+    handler = callback_handlers.get(call.data)
+    label = call.data
+    if handler is None and call.data.startswith(REPORT_CALLBACK_PREFIX):
+        handler, label = handle_report_page, REPORT_CALLBACK_PREFIX.rstrip(':')
+    if handler is None:
+        logger.warning(f"Неизвестная команда callback_data: '{call.data}' от пользователя {call.from_user.id}.")
+        await bot.answer_callback_query(call.id, "Неизвестная команда.")
+        return
+    try:
+        with track_handler(label, kind='callback_query'):
+            await handler(call)
+    except Exception as e:
+        logger.error(f"Ошибка в обработчике '{call.data}' для пользователя {call.from_user.id}: {e}")
+        await bot.answer_callback_query(call.id, "Произошла ошибка при обработке запроса.")
+
+
+@bot.message_handler(commands=['start'])
+async def start(message):
+    user_id = message.from_user.id
+    logger.info(f"Пользователь {user_id} запустил команду /start.")
+    with track_handler('command:start'):
+        reply = registration.start(users, message.from_user)
+        keyboard = None
+        if user_id in TARGET_USER_ID:
+            keyboard = create_keyboard(reply.menu)
+            keyboard.add(types.InlineKeyboardButton(text='Провести сверку', callback_data='send__result'))
+        await apply_reply(user_id, reply, custom_keyboard=keyboard)
+
+
+@bot.message_handler(commands=['shards'], func=lambda message: message.from_user.id in TARGET_USER_ID)
+async def shards_stats(message):
+    # Обновления обрабатываются корутинами, диспетчера очередей в асинхронном режиме нет
+    with track_handler('command:shards'):
+        await send_message(message.chat.id, "Асинхронный бот обрабатывает обновления без диспетчера очередей.")
+
+
+def send_broadcast_report(job, report):
+    """
+    Отправляет администратору итог рассылки. Вызывается из потока рассылки.
+    """
+    broadcast_outbound.send_message(job['admin_id'], admin.broadcast_finished(job, report),
+                                    description='итога рассылки')
+
+
+@bot.message_handler(commands=['broadcast'], func=lambda message: message.from_user.id in TARGET_USER_ID)
+async def start_broadcast(message):
+    with track_handler('command:broadcast'):
+        # Запуск записывает задание рассылки на диск
+        text = await asyncio.to_thread(admin.start_broadcast, broadcaster, message.from_user.id, message.text,
+                                       send_broadcast_report)
+        await send_message(message.chat.id, text)
+
+
+@bot.message_handler(commands=['broadcast_status'], func=lambda message: message.from_user.id in TARGET_USER_ID)
+async def broadcast_status(message):
+    with track_handler('command:broadcast_status'):
+        await send_message(message.chat.id, admin.broadcast_status(broadcaster))
+
+
+@bot.message_handler(commands=['metrics'], func=lambda message: message.from_user.id in TARGET_USER_ID)
+async def metrics_summary(message):
+    with track_handler('command:metrics'):
+        await send_message(message.chat.id, format_summary())
+
+
+@bot.message_handler(commands=['profiles'], func=lambda message: message.from_user.id in TARGET_USER_ID)
+async def profiles_list(message):
+    with track_handler('command:profiles'):
+        await send_message(message.chat.id, admin.profiles(message.from_user.id, message.text))
+
+
+async def _send_profile_document(chat_id, document):
+    # Новый InputFile на каждую попытку: при повторе после 429 поток читается заново
+    return await bot.send_document(chat_id, types.InputFile(io.BytesIO(document.data), file_name=document.file_name),
+                                   caption=document.caption)
+
+
+@bot.message_handler(commands=['profile'], func=lambda message: message.from_user.id in TARGET_USER_ID)
+async def profile_download(message):
+    with track_handler('command:profile'):
+        # Выгрузка профиля читает и преобразует статистику cProfile
+        text, document = await asyncio.to_thread(admin.profile_document, message.text)
+        if document is None:
+            await send_message(message.chat.id, text)
+            return
+        await outbound.call(message.chat.id, _send_profile_document, message.chat.id, document,
+                            description=document.description)
@@ -0,0 +1,117 @@
+"""
+Бенчмарк нечеткого сопоставления имён при сверке.
+
+Сравнивает полный перебор DataMatcher.fuzzy_match_names с индексом FuzzyNameIndex
+на синтетических списках из 1k, 10k и 100k имён и проверяет, что совпадения одинаковые.
+Время обоих способов измеряется на выборке запросов и экстраполируется
+на все несовпавшие имена из таблицы.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_fuzzy_match.py
+    python benchmarks/bench_fuzzy_match.py --sizes 1000 10000 --brute-sample 20
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from data_matcher import DataMatcher, FUZZY_SIMILARITY_MIN, FUZZY_SIMILARITY_MAX  # noqa: E402
+from fuzzy_index import FuzzyNameIndex  # noqa: E402
+
+SYLLABLES = ['ба', 'во', 'га', 'де', 'жу', 'за', 'ки', 'ло', 'ми', 'но', 'пе', 'ра', 'са', 'ту', 'фе',
+             'ха', 'це', 'чу', 'ша', 'бор', 'вин', 'гор', 'дан', 'кор', 'лев', 'мор', 'нес', 'пол', 'рад', 'сем']
+SURNAME_ENDINGS = ['ов', 'ев', 'ин', 'ский', 'енко', 'ова', 'ева', 'ина', 'ская', 'ян']
+FIRST_NAMES = ['александр', 'дмитрий', 'максим', 'сергей', 'андрей', 'алексей', 'артем', 'илья',
+               'кирилл', 'михаил', 'никита', 'матвей', 'роман', 'егор', 'арсений', 'иван',
+               'анна', 'мария', 'елена', 'дарья', 'алина', 'ирина', 'екатерина', 'арина',
+               'полина', 'ольга', 'юлия', 'татьяна', 'наталья', 'виктория', 'елизавета', 'анастасия']
+MIDDLE_NAMES = ['александрович', 'дмитриевич', 'сергеевич', 'андреевич', 'алексеевич', 'иванович',
+                'михайлович', 'петрович', 'николаевич', 'владимирович', 'александровна', 'дмитриевна',
+                'сергеевна', 'андреевна', 'алексеевна', 'ивановна', 'михайловна', 'петровна']
+LETTERS = 'абвгдежзийклмнопрстуфхцчшщыэюя'
+
+
+def generate_names(size, rng):
+    names = set()
+    while len(names) < size:
+        surname = ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))) + rng.choice(SURNAME_ENDINGS)
+        names.add(f"{surname} {rng.choice(FIRST_NAMES)} {rng.choice(MIDDLE_NAMES)}")
+    return list(names)
+
+
+def with_typo(name, rng):
+    position = rng.randrange(len(name))
+    return name[:position] + rng.choice(LETTERS) + name[position + 1:]
+
+
+def make_sides(size, seed=0):
+    rng = random.Random(seed)
+    json_names = generate_names(size, rng)
+    sheet_names = []
+    for name in json_names:
+        roll = rng.random()
+        if roll < 0.8:
+            sheet_names.append(name)
+        elif roll < 0.95:
+            sheet_names.append(with_typo(name, rng))
+    sheet_names.extend(generate_names(size // 20, rng))
+    return json_names, list(dict.fromkeys(sheet_names))
+
+
+def run(size, brute_sample, index_sample):
+    json_names, sheet_names = make_sides(size)
+    json_normalized = dict.fromkeys(json_names)
+    unmatched = [name for name in sheet_names if name not in json_normalized]
+    matcher = DataMatcher(None, None, None, None)
+
+    started = time.perf_counter()
+    index = FuzzyNameIndex(json_normalized, FUZZY_SIMILARITY_MIN, FUZZY_SIMILARITY_MAX)
+    build_seconds = time.perf_counter() - started
+
+    index_queries = unmatched[:index_sample]
+    started = time.perf_counter()
+    indexed = [index.matches(name) for name in index_queries]
+    index_seconds = (time.perf_counter() - started) * len(unmatched) / max(len(index_queries), 1)
+
+    brute_queries = unmatched[:brute_sample]
+    started = time.perf_counter()
+    brute = [matcher.fuzzy_match_names(name, json_normalized) for name in brute_queries]
+    brute_seconds = (time.perf_counter() - started) * len(unmatched) / max(len(brute_queries), 1)
+
+    return {
+        'size': size,
+        'queries': len(unmatched),
+        'brute_queries_measured': len(brute_queries),
+        'brute_seconds': round(brute_seconds, 3),
+        'index_queries_measured': len(index_queries),
+        'index_build_seconds': round(build_seconds, 3),
+        'index_seconds': round(index_seconds, 3),
+        'speedup': round(brute_seconds / index_seconds, 1) if index_seconds else None,
+        'identical': brute == indexed[:len(brute_queries)],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000, 100_000])
+    parser.add_argument('--brute-sample', type=int, default=100,
+                        help='сколько запросов прогонять полным перебором')
+    parser.add_argument('--index-sample', type=int, default=2000,
+                        help='сколько запросов прогонять через индекс')
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        result = run(size, args.brute_sample, args.index_sample)
+        results.append(result)
+        print(json.dumps(result, ensure_ascii=False))
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""
+Бенчмарк влияния логирования на задержку обработчиков.
+
+Обработчики регистрации из handlers.py вызываются напрямую (без polling)
+для синтетических пользователей; время каждого вызова замеряется в режимах:
+    sync     — обработчики логгера вызываются в потоке обработчика (как до очереди);
+    queue    — QueueHandler, запись в файл и консоль в потоке QueueListener;
+    info     — очередь, но DEBUG отключён: отложенное форматирование не строит строки;
+    disabled — логирование отключено полностью.
+Исходящие сообщения уходят в MockBotAPI, данные и лог — во временный каталог,
+консольный вывод логгера — в /dev/null.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_logging.py
+    python benchmarks/bench_logging.py --users 2000
+"""
+import argparse
+import json
+import logging
+import logging.handlers
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from load_test import FIRST_USER_ID, isolate_data, isolate_log, summarize  # noqa: E402
+from mock_bot_api import BOT_USER, MockBotAPI  # noqa: E402
+
+MODES = ['sync', 'queue', 'info', 'disabled']
+
+
+def make_message(user_id, text):
+    from telebot import types
+
+    return types.Message.de_json({
+        'message_id': 1,
+        'date': int(time.time()),
+        'chat': {'id': user_id, 'type': 'private'},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}'},
+        'text': text,
+    })
+
+
+def make_call(user_id, data):
+    from telebot import types
+
+    return types.CallbackQuery.de_json({
+        'id': str(user_id),
+        'from': {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}'},
+        'chat_instance': str(user_id),
+        'data': data,
+        'message': {
+            'message_id': 1,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': BOT_USER,
+            'text': 'menu',
+        },
+    })
+
+
+def set_mode(mode, bot_logging, queue_handler):
+    logger = bot_logging.logger
+    logger.disabled = mode == 'disabled'
+    logger.setLevel(logging.INFO if mode == 'info' else logging.DEBUG)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    if mode == 'sync':
+        for handler in bot_logging.listener.handlers:
+            logger.addHandler(handler)
+    else:
+        logger.addHandler(queue_handler)
+
+
+def run(handlers, first_user_id, users):
+    steps = [
+        ('start', handlers.start, lambda user_id: make_message(user_id, '/start')),
+        ('buy_ticket', handlers.buy_ticket, lambda user_id: make_call(user_id, 'buy_ticket')),
+        ('name', handlers.process_name, lambda user_id: make_message(user_id, f'Иванов Иван {user_id}')),
+        ('university', handlers.process_university, lambda user_id: make_message(user_id, 'НИУ ВШЭ')),
+        ('faculty', handlers.handle_faculty_selection, lambda user_id: make_call(user_id, 'faculty_social_studies')),
+        ('info_source', handlers.handle_info_source_selection,
+         lambda user_id: make_call(user_id, 'info_source_friends')),
+        ('confirm', handlers.handle_confirmation, lambda user_id: make_call(user_id, 'confirm_yes')),
+    ]
+    latencies = []
+    for user_id in range(first_user_id, first_user_id + users):
+        for _, handler, make_update in steps:
+            update = make_update(user_id)
+            started = time.perf_counter()
+            handler(update)
+            latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=500, help='Пользователей на каждый режим')
+    args = parser.parse_args()
+
+    results = {'users': args.users}
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_dir = Path(tmp)
+        isolate_data(tmp_dir)
+        file_handler = isolate_log(tmp_dir)
+
+        import logger as bot_logging
+
+        devnull = open(os.devnull, 'w')
+        bot_logging.console_handler.setStream(devnull)
+        bot_logging.console_handler.setLevel(logging.INFO)
+        queue_handler = next(
+            handler for handler in bot_logging.logger.handlers
+            if isinstance(handler, logging.handlers.QueueHandler)
+        )
+
+        api = MockBotAPI()
+        api.start()
+        from telebot import apihelper
+        apihelper.API_URL = api.api_url
+
+        import handlers
+        import storage
+        from state_storage import SQLiteStateStorage
+
+        try:
+            for number, mode in enumerate(MODES):
+                set_mode(mode, bot_logging, queue_handler)
+                latencies = run(handlers, FIRST_USER_ID + number * args.users, args.users)
+                set_mode('queue', bot_logging, queue_handler)
+                file_handler.flush()
+                results[mode] = summarize([value * 1000 for value in latencies])
+        finally:
+            handlers.outbound.stop()
+            storage.shutdown()
+            handlers.payment_index.stop()
+            if isinstance(handlers.state_storage, SQLiteStateStorage):
+                handlers.state_storage.stop()
+            bot_logging.stop_logging()
+            api.stop()
+            devnull.close()
+
+    # Задержки в микросекундах на один вызов обработчика
+    print(json.dumps({'unit': 'us', **results}, ensure_ascii=False, indent=4))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Бенчмарк подготовки меню к отправке.
+
+Сравнивает процессорное время на одну отправку меню: прежний путь (сборка
+InlineKeyboardMarkup из MENUS, её сериализация, разбор медиа по расширениям
+и форматирование текста) и план из MENU_PLANS (поиск плана и одно форматирование).
+Сетевые вызовы не выполняются, измеряется только работа процесса.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_menu_render.py
+    python benchmarks/bench_menu_render.py --iterations 50000
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from telebot import types  # noqa: E402
+
+from config import MENUS  # noqa: E402
+from menus import MENU_PLANS  # noqa: E402
+
+USER_DATA = {
+    'first_name': 'Анна',
+    'name': 'Иванова Анна Сергеевна',
+    'university': 'НИУ ВШЭ',
+    'faculty': 'Социальные науки',
+    'info_source': 'От друзей',
+}
+
+
+def legacy_render(menu_name, user_data):
+    menu = MENUS.get(menu_name)
+    keyboard = types.InlineKeyboardMarkup()
+    for button in menu.get('buttons', []):
+        keyboard.add(types.InlineKeyboardButton(text=button['text'], callback_data=button['callback_data']))
+    media_photos = []
+    media_documents = []
+    for media_file in menu['media']:
+        if media_file.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp')):
+            media_photos.append(media_file)
+        elif media_file.lower().endswith(('.pdf', '.docx', '.txt')):
+            media_documents.append(media_file)
+    text = menu['text'].format(**user_data) if user_data else menu['text']
+    # telebot сериализует клавиатуру перед каждым запросом
+    return text, keyboard.to_json(), media_photos, media_documents
+
+
+def planned_render(menu_name, user_data):
+    plan = MENU_PLANS.get(menu_name)
+    text = plan.text.format(**user_data) if user_data else plan.text
+    return text, plan.keyboard, plan.photos, plan.documents
+
+
+def measure(render, iterations):
+    names = list(MENUS)
+    started = time.process_time()
+    for i in range(iterations):
+        render(names[i % len(names)], USER_DATA)
+    return (time.process_time() - started) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=20000, help='Количество отправок для каждого способа')
+    args = parser.parse_args()
+
+    for name in MENUS:
+        legacy = legacy_render(name, USER_DATA)
+        planned = planned_render(name, USER_DATA)
+        assert legacy[0] == planned[0] and json.loads(legacy[1]) == json.loads(planned[1]), name
+        assert tuple(legacy[2]) == planned[2] and tuple(legacy[3]) == planned[3], name
+
+    legacy_us = measure(legacy_render, args.iterations)
+    planned_us = measure(planned_render, args.iterations)
+    print(json.dumps({
+        'menus': len(MENUS),
+        'iterations': args.iterations,
+        'legacy_cpu_us_per_send': round(legacy_us, 2),
+        'planned_cpu_us_per_send': round(planned_us, 2),
+        'speedup': round(legacy_us / planned_us, 1) if planned_us else None,
+    }, ensure_ascii=False, indent=4))
+
+
+if __name__ == '__main__':
+    main()
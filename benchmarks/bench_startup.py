@@ -0,0 +1,140 @@
+"""
+Бенчмарк запуска бота: время импорта и память.
+
+В отдельном процессе с python -X importtime импортируется handlers.py
+(данные бота — во временном каталоге; импорт load_test, который их туда
+перенаправляет, в замеры не входит) и разбирается вывод importtime:
+суммарное время импорта, самые тяжёлые модули верхнего уровня и то,
+загрузились ли модули сверки (data_matcher, gspread, google.oauth2,
+fuzzywuzzy). Для сравнения замеряется режим eager — тот же импорт плюс
+data_matcher, как было до отложенной загрузки. Память — пиковый RSS
+дочернего процесса.
+
+С --check процесс завершается с кодом 1, если модули сверки загружаются
+при запуске бота. То же проверяет tests/test_startup.py.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --runs 5 --check
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+
+# Модули, которые нужны только сверке
+HEAVY_MODULES = ('data_matcher', 'gspread', 'google.oauth2', 'fuzzywuzzy')
+# Вспомогательный код бенчмарка, не относящийся к запуску бота
+EXCLUDED_MODULES = ('load_test',)
+
+CHILD_CODE = """
+import json, os, resource, sys, time
+sys.path[:0] = [{root!r}, {benchmarks!r}]
+started = time.perf_counter()
+# Зависимости бота, которые load_test импортирует сам, загружаются в замеряемой части
+import config, logger, telebot
+paused = time.perf_counter()
+# Импорт load_test и перенаправление данных в замер не входят
+from pathlib import Path
+from load_test import isolate_data, isolate_log
+isolate_data(Path({data_dir!r}))
+isolate_log(Path({data_dir!r}))
+started += time.perf_counter() - paused
+import handlers
+if {eager!r}:
+    import data_matcher
+elapsed = time.perf_counter() - started
+print(json.dumps({{
+    'import_seconds': elapsed,
+    'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    'heavy_loaded': sorted(name for name in {heavy!r} if name in sys.modules),
+}}))
+sys.stdout.flush()
+# Фоновые потоки бота и atexit не нужны
+os._exit(0)
+"""
+
+
+def parse_importtime(stderr, exclude=EXCLUDED_MODULES):
+    """
+    Разбирает вывод -X importtime.
+
+    :param exclude: Модули верхнего уровня, которые вместе с их импортами не учитываются
+    :return: (суммарное собственное время в мкс, {модуль верхнего уровня: накопленное время в мкс})
+    """
+    total_self = 0
+    top_level = {}
+    # Вложенные импорты выводятся перед модулем, который их загрузил
+    pending_self = 0
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        pending_self += int(self_us)
+        # Модули верхнего уровня выводятся без отступа
+        if not name.startswith('  '):
+            if name.strip() not in exclude:
+                total_self += pending_self
+                top_level[name.strip()] = int(cumulative_us)
+            pending_self = 0
+    return total_self, top_level
+
+
+def measure(eager):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        code = CHILD_CODE.format(root=str(ROOT_DIR), benchmarks=str(BENCHMARKS_DIR), data_dir=tmp_dir,
+                                 eager=eager, heavy=HEAVY_MODULES)
+        env = dict(os.environ, BOT_LOG_LEVEL='WARNING')
+        completed = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', code],
+            cwd=tmp_dir, env=env, capture_output=True, text=True, check=True
+        )
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    total_self, top_level = parse_importtime(completed.stderr)
+    result['importtime_total_ms'] = total_self / 1000
+    result['top_modules_ms'] = {
+        name: round(cumulative / 1000, 1)
+        for name, cumulative in sorted(top_level.items(), key=lambda item: item[1], reverse=True)[:10]
+    }
+    return result
+
+
+def summarize(runs):
+    return {
+        'import_ms': round(statistics.median(run['import_seconds'] for run in runs) * 1000, 1),
+        'importtime_total_ms': round(statistics.median(run['importtime_total_ms'] for run in runs), 1),
+        'max_rss_mb': round(statistics.median(run['max_rss_kb'] for run in runs) / 1024, 1),
+        'heavy_loaded': runs[-1]['heavy_loaded'],
+        'top_modules_ms': runs[-1]['top_modules_ms'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=3, help='Запусков на режим (берётся медиана)')
+    parser.add_argument('--check', action='store_true', help='Код 1, если модули сверки грузятся при запуске')
+    args = parser.parse_args()
+
+    results = {
+        'lazy': summarize([measure(eager=False) for _ in range(args.runs)]),
+        'eager': summarize([measure(eager=True) for _ in range(args.runs)]),
+    }
+    results['saved_ms'] = round(results['eager']['import_ms'] - results['lazy']['import_ms'], 1)
+    results['saved_rss_mb'] = round(results['eager']['max_rss_mb'] - results['lazy']['max_rss_mb'], 1)
+    print(json.dumps(results, ensure_ascii=False, indent=4))
+
+    if args.check and results['lazy']['heavy_loaded']:
+        print(f"Модули сверки загружаются при запуске: {', '.join(results['lazy']['heavy_loaded'])}",
+              file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
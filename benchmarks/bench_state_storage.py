@@ -0,0 +1,84 @@
+"""
+Бенчмарк хранилища состояний регистрации.
+
+Сравнивает пропускную способность set_state/get_state у StateMemoryStorage
+telebot и SQLiteStateStorage на синтетических пользователях: сначала каждый
+пользователь проходит все шаги TicketPurchaseStates (запись), затем состояние
+читается случайным пользователям (чтение). Проверяет и удаление брошенных
+состояний по TTL.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_state_storage.py
+    python benchmarks/bench_state_storage.py --users 100000 --reads 200000
+"""
+import argparse
+import json
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from telebot.storage import StateMemoryStorage  # noqa: E402
+
+from state_storage import SQLiteStateStorage  # noqa: E402
+from states import TicketPurchaseStates  # noqa: E402
+
+STEPS = [
+    TicketPurchaseStates.waiting_for_name,
+    TicketPurchaseStates.waiting_for_university,
+    TicketPurchaseStates.waiting_for_faculty,
+    TicketPurchaseStates.waiting_for_info_source,
+    TicketPurchaseStates.waiting_for_confirmation,
+]
+
+
+def run(storage, users, reads, rng):
+    started = time.perf_counter()
+    for user_id in range(users):
+        for step in STEPS:
+            storage.set_state(user_id, user_id, step)
+    writes = users * len(STEPS)
+    write_seconds = time.perf_counter() - started
+
+    ids = [rng.randrange(users) for _ in range(reads)]
+    started = time.perf_counter()
+    for user_id in ids:
+        storage.get_state(user_id, user_id)
+    read_seconds = time.perf_counter() - started
+    return {
+        'set_state_per_second': round(writes / write_seconds),
+        'get_state_per_second': round(reads / read_seconds),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=20000, help='Количество пользователей')
+    parser.add_argument('--reads', type=int, default=100000, help='Количество чтений get_state')
+    args = parser.parse_args()
+
+    results = {'users': args.users, 'reads': args.reads}
+    results['memory'] = run(StateMemoryStorage(), args.users, args.reads, random.Random(1))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        storage = SQLiteStateStorage(path=Path(tmp_dir) / 'states.db', ttl=3600)
+        results['sqlite'] = run(storage, args.users, args.reads, random.Random(1))
+        # Состаренные записи должны удалиться за один проход
+        with storage._lock:
+            storage._connection.execute('UPDATE states SET updated_at = updated_at - 7200')
+        started = time.perf_counter()
+        evicted = storage.evict_expired()
+        results['sqlite']['evicted'] = evicted
+        results['sqlite']['evict_seconds'] = round(time.perf_counter() - started, 3)
+        results['sqlite']['remaining'] = storage.count()
+        storage.stop()
+
+    print(json.dumps(results, ensure_ascii=False, indent=4))
+
+
+if __name__ == '__main__':
+    main()
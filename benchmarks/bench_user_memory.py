@@ -0,0 +1,166 @@
+"""
+Бенчмарк памяти и времени загрузки пользователей.
+
+Сравнивает прежнюю модель User (обычный класс с __dict__) с текущей
+(__slots__ и интернирование факультета, источника и ВУЗа) на синтетической базе.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_user_memory.py
+    python benchmarks/bench_user_memory.py --sizes 100000
+"""
+import argparse
+import gc
+import json
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+UNIVERSITIES = ['вшэ', 'мгу', 'рудн', 'мгимо', 'ранхигс', 'мфти', 'Нигде']
+
+
+class LegacyUser:
+    """Модель User в том виде, в каком она была до перехода на __slots__."""
+
+    def __init__(self, user_id, username, first_name):
+        self.user_id = user_id
+        self.username = username or user_id
+        self.first_name = first_name
+        self.registration_date = None
+        self.is_registered = False
+        self.name = None
+        self.university = None
+        self.faculty = None
+        self.info_source = None
+        self.is_payment_confirmed = False
+
+    @classmethod
+    def from_dict(cls, data):
+        user = cls(data['user_id'], data.get('username'), data.get('first_name'))
+        user.registration_date = data.get('registration_date')
+        user.is_registered = data.get('is_registered', False)
+        user.name = data.get('name')
+        user.university = data.get('university')
+        user.faculty = data.get('faculty')
+        user.info_source = data.get('info_source')
+        user.is_payment_confirmed = data.get('is_payment_confirmed', False)
+        return user
+
+
+def generate_users_file(path, size):
+    from config import MENUS
+
+    faculties = [b['text'] for b in MENUS['faculty_menu']['buttons'] if b['callback_data'].startswith('faculty_')]
+    sources = [b['text'] for b in MENUS['info_source_menu']['buttons']]
+    rng = random.Random(size)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{')
+        for i in range(size):
+            user_id = 100_000_000 + i
+            registered = rng.random() < 0.7
+            record = {
+                'user_id': user_id,
+                'username': f'user{user_id}',
+                'first_name': f'Имя{i % 5000}',
+                'registration_date': '2024-11-01T12:00:00+03:00',
+                'is_registered': registered,
+                'name': f'Фамилия{i} Имя{i % 5000} Отчество{i % 300}' if registered else None,
+                'university': rng.choice(UNIVERSITIES) if registered else None,
+                'faculty': rng.choice(faculties) if registered else None,
+                'info_source': rng.choice(sources) if registered else None,
+                'is_payment_confirmed': registered and rng.random() < 0.5,
+            }
+            if i:
+                f.write(',')
+            f.write(json.dumps(str(user_id)) + ':' + json.dumps(record, ensure_ascii=False))
+        f.write('}')
+
+
+def current_rss_mb():
+    try:
+        with open('/proc/self/status', encoding='ascii') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except FileNotFoundError:
+        pass
+    import resource
+    # На macOS ru_maxrss в байтах, на Linux — в килобайтах
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024) if sys.platform == 'darwin' else maxrss / 1024
+
+
+def load_users(user_class, path):
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return {int(user_id): user_class.from_dict(user_data) for user_id, user_data in data.items()}
+
+
+def run_child(model, path, traced=False):
+    if model == 'legacy':
+        user_class = LegacyUser
+    else:
+        from models import User as user_class
+
+    if traced:
+        # Память, которую удерживают объекты пользователей после загрузки
+        import tracemalloc
+        tracemalloc.start()
+        users = load_users(user_class, path)
+        gc.collect()
+        print(json.dumps({'retained_mb': round(tracemalloc.get_traced_memory()[0] / 2 ** 20, 1)}))
+        return
+
+    gc.collect()
+    rss_before = current_rss_mb()
+    started = time.perf_counter()
+    users = load_users(user_class, path)
+    load_seconds = time.perf_counter() - started
+    gc.collect()
+    print(json.dumps({
+        'users': len(users),
+        'load_seconds': round(load_seconds, 3),
+        'rss_mb': round(current_rss_mb() - rss_before, 1),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100_000, 1_000_000])
+    parser.add_argument('--child', nargs=2, metavar=('MODEL', 'PATH'), help=argparse.SUPPRESS)
+    parser.add_argument('--traced', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(*args.child, traced=args.traced)
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for size in args.sizes:
+            path = Path(tmp_dir) / f'users_{size}.json'
+            generate_users_file(path, size)
+            for model in ('legacy', 'current'):
+                # Каждый замер в отдельном процессе, чтобы RSS не смешивался
+                result = {'size': size, 'model': model}
+                for extra_args in ([], ['--traced']):
+                    output = subprocess.run(
+                        [sys.executable, __file__, '--child', model, str(path), *extra_args],
+                        check=True, capture_output=True, text=True
+                    ).stdout
+                    result.update(json.loads(output.strip().splitlines()[-1]))
+                results.append(result)
+                print(
+                    f"{size:>9} {model:<8} load {result['load_seconds']:>7.3f} s  "
+                    f"RSS +{result['rss_mb']:>8.1f} MB  retained {result['retained_mb']:>8.1f} MB"
+                )
+    return results
+
+
+if __name__ == '__main__':
+    main()
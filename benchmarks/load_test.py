@@ -0,0 +1,299 @@
+"""
+Нагрузочный тест бота на заглушке Bot API.
+
+Бот из handlers.py запускается в этом процессе с infinity_polling, но
+обращается не к Telegram, а к MockBotAPI. N пользователей одновременно
+проходят регистрацию: /start → buy_ticket → ФИО → ВУЗ → факультет →
+источник информации → подтверждение. Задержка шага — время от появления
+обновления в getUpdates до ответного сообщения бота в этот чат; в неё
+входят long polling, обработчик, хранилища и очередь отправки.
+
+Данные бота (users.json, states.db и пр.) и лог пишутся во временный
+каталог, рабочие данные в data/ не затрагиваются. По умолчанию лимиты
+очереди отправки сняты, чтобы измерять сам бот; --telegram-limits
+оставляет лимиты из config.py.
+
+Результат — JSON на stdout (и в --output), который удобно сравнивать
+между коммитами.
+
+Запуск из корня репозитория:
+    python benchmarks/load_test.py
+    python benchmarks/load_test.py --users 500 --api-latency-ms 30 --rate-limit-ratio 0.01
+    python benchmarks/load_test.py --shards 8 --output load.json
+"""
+import argparse
+import itertools
+import json
+import logging
+import queue
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from telebot import apihelper  # noqa: E402
+
+import config  # noqa: E402
+from mock_bot_api import BOT_USER, MockBotAPI  # noqa: E402
+
+# Идентификаторы пользователей заведомо вне TARGET_USER_ID
+FIRST_USER_ID = 10 ** 9
+# Снятые лимиты очереди отправки
+UNLIMITED_RATE = 10 ** 6
+
+STEPS = ['start', 'buy_ticket', 'name', 'university', 'faculty', 'info_source', 'confirm']
+
+
+def percentile(sorted_values, q):
+    """
+    Перцентиль по ближайшему рангу.
+
+    :param sorted_values: Отсортированные значения
+    :param q: Перцентиль от 0 до 100
+    """
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, round(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def summarize(latencies):
+    values = sorted(latencies)
+    if not values:
+        return {'count': 0}
+    return {
+        'count': len(values),
+        'mean': round(sum(values) / len(values), 2),
+        'p50': round(percentile(values, 50), 2),
+        'p95': round(percentile(values, 95), 2),
+        'p99': round(percentile(values, 99), 2),
+        'max': round(values[-1], 2),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def isolate_data(tmp_dir, shards=0, state_storage=config.STATE_STORAGE_BACKEND, telegram_limits=False):
+    """
+    Перенаправляет файлы данных в tmp_dir и применяет параметры запуска.
+
+    Модули бота берут значения из config при импорте, поэтому вызывается
+    до импорта handlers.
+    """
+    for name, value in vars(config).items():
+        if isinstance(value, Path) and value != config.DATA_DIR and value.is_relative_to(config.DATA_DIR):
+            setattr(config, name, tmp_dir / value.relative_to(config.DATA_DIR))
+    config.STORAGE_DIR.mkdir(parents=True, exist_ok=True)
+    config.DATA_DIR = tmp_dir
+    config.UPDATE_SHARDS = shards
+    config.STATE_STORAGE_BACKEND = state_storage
+    if not telegram_limits:
+        config.OUTBOUND_GLOBAL_RATE = config.OUTBOUND_GLOBAL_BURST = UNLIMITED_RATE
+        config.OUTBOUND_CHAT_RATE = config.OUTBOUND_CHAT_BURST = UNLIMITED_RATE
+
+
+def isolate_log(tmp_dir):
+    """
+    Пишет лог бота во временный каталог с тем же форматом и уровнем.
+
+    :return: Новый файловый обработчик
+    """
+    import logger as bot_logging
+
+    bot_logging.file_handler.close()
+    file_handler = logging.FileHandler(tmp_dir / 'bot.log', encoding='utf-8')
+    file_handler.setLevel(bot_logging.file_handler.level)
+    file_handler.setFormatter(bot_logging.formatter)
+    bot_logging.console_handler.setLevel(logging.WARNING)
+    bot_logging.listener.handlers = (bot_logging.console_handler, file_handler)
+    return file_handler
+
+
+class LoadGenerator:
+    """
+    Имитирует пользователей, проходящих регистрацию.
+
+    Каждый пользователь — отдельный поток: отправляет обновление очередного
+    шага и ждёт ответного сообщения бота, прежде чем перейти к следующему.
+    """
+
+    def __init__(self, api, users, timeout):
+        self.api = api
+        self.users = users
+        self.timeout = timeout
+        self._replies = {FIRST_USER_ID + number: queue.Queue() for number in range(users)}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.latencies = {step: [] for step in STEPS}
+        self.completed = 0
+        self.timeouts = Counter()
+
+    def on_send(self, method, chat_id, params):
+        replies = self._replies.get(chat_id)
+        if replies is not None:
+            replies.put(time.perf_counter())
+
+    def _user(self, user_id):
+        return {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}', 'username': f'user{user_id}'}
+
+    def _message_update(self, user_id, text):
+        message = {
+            'message_id': next(self._ids),
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': self._user(user_id),
+            'text': text,
+        }
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text)}]
+        return {'message': message}
+
+    def _callback_update(self, user_id, data):
+        return {'callback_query': {
+            'id': str(next(self._ids)),
+            'from': self._user(user_id),
+            'chat_instance': str(user_id),
+            'data': data,
+            'message': {
+                'message_id': next(self._ids),
+                'date': int(time.time()),
+                'chat': {'id': user_id, 'type': 'private'},
+                'from': BOT_USER,
+                'text': 'menu',
+            },
+        }}
+
+    def _flow(self, user_id):
+        yield 'start', self._message_update(user_id, '/start')
+        yield 'buy_ticket', self._callback_update(user_id, 'buy_ticket')
+        yield 'name', self._message_update(user_id, f'Иванов Иван {user_id}')
+        yield 'university', self._message_update(user_id, 'НИУ ВШЭ')
+        yield 'faculty', self._callback_update(user_id, 'faculty_social_studies')
+        yield 'info_source', self._callback_update(user_id, 'info_source_friends')
+        yield 'confirm', self._callback_update(user_id, 'confirm_yes')
+
+    def _run_user(self, user_id, start_event):
+        replies = self._replies[user_id]
+        start_event.wait()
+        for step, update in self._flow(user_id):
+            sent_at = time.perf_counter()
+            self.api.push_update(update)
+            try:
+                replied_at = replies.get(timeout=self.timeout)
+            except queue.Empty:
+                with self._lock:
+                    self.timeouts[step] += 1
+                return
+            with self._lock:
+                self.latencies[step].append((replied_at - sent_at) * 1000)
+        with self._lock:
+            self.completed += 1
+
+    def run(self):
+        start_event = threading.Event()
+        threads = [
+            threading.Thread(target=self._run_user, args=(user_id, start_event), daemon=True)
+            for user_id in self._replies
+        ]
+        for thread in threads:
+            thread.start()
+        started = time.perf_counter()
+        start_event.set()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100, help='Количество одновременных пользователей')
+    parser.add_argument('--api-latency-ms', type=float, default=0, help='Задержка ответов заглушки (мс)')
+    parser.add_argument('--rate-limit-ratio', type=float, default=0.0, help='Доля отправок, получающих 429')
+    parser.add_argument('--retry-after', type=int, default=1, help='retry_after в ответах 429 (сек)')
+    parser.add_argument('--shards', type=int, default=0, help='UPDATE_SHARDS для диспетчера обновлений')
+    parser.add_argument('--state-storage', choices=['sqlite', 'memory'], default=config.STATE_STORAGE_BACKEND,
+                        help='Хранилище состояний регистрации')
+    parser.add_argument('--telegram-limits', action='store_true', help='Оставить лимиты отправки из config.py')
+    parser.add_argument('--timeout', type=float, default=30, help='Сколько ждать ответа бота на шаг (сек)')
+    parser.add_argument('--seed', type=int, default=1, help='Зерно для выборки ответов 429')
+    parser.add_argument('--output', type=Path, help='Файл для JSON с результатами')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_dir = Path(tmp)
+        isolate_data(tmp_dir, args.shards, args.state_storage, args.telegram_limits)
+        isolate_log(tmp_dir)
+
+        api = MockBotAPI(latency_ms=args.api_latency_ms, rate_limit_ratio=args.rate_limit_ratio,
+                         retry_after=args.retry_after, seed=args.seed)
+        generator = LoadGenerator(api, args.users, args.timeout)
+        api.listener = generator.on_send
+        api.start()
+        apihelper.API_URL = api.api_url
+
+        import storage
+        from telebot import custom_filters
+        from handlers import bot, dispatcher, outbound, payment_index, state_storage
+
+        bot.add_custom_filter(custom_filters.StateFilter(bot))
+        polling = threading.Thread(target=bot.infinity_polling, kwargs={'timeout': 1}, daemon=True)
+        polling.start()
+        try:
+            duration = generator.run()
+        finally:
+            bot.stop_polling()
+            polling.join()
+            if dispatcher is not None:
+                dispatcher.stop()
+            outbound_stats = outbound.stats()
+            outbound.stop()
+            storage.shutdown()
+            payment_index.stop()
+            if args.state_storage == 'sqlite':
+                state_storage.stop()
+            api.stop()
+
+    all_latencies = [value for step in STEPS for value in generator.latencies[step]]
+    results = {
+        'revision': git_revision(),
+        'params': {
+            'users': args.users,
+            'api_latency_ms': args.api_latency_ms,
+            'rate_limit_ratio': args.rate_limit_ratio,
+            'shards': args.shards,
+            'state_storage': args.state_storage,
+            'telegram_limits': args.telegram_limits,
+        },
+        'duration_seconds': round(duration, 3),
+        'completed_flows': generator.completed,
+        'timeouts': dict(generator.timeouts),
+        'updates': len(all_latencies),
+        'updates_per_second': round(len(all_latencies) / duration, 1),
+        'flows_per_second': round(generator.completed / duration, 1),
+        'latency_ms': summarize(all_latencies),
+        'steps_latency_ms': {step: summarize(generator.latencies[step]) for step in STEPS},
+        'mock_api': api.stats(),
+        'outbound': outbound_stats,
+    }
+    output = json.dumps(results, ensure_ascii=False, indent=4, default=str)
+    print(output)
+    if args.output:
+        args.output.write_text(output, encoding='utf-8')
+
+
+if __name__ == '__main__':
+    main()
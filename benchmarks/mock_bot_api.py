@@ -0,0 +1,229 @@
+"""
+Заглушка Telegram Bot API для нагрузочных тестов без сети.
+
+HTTP-сервер отвечает на запросы вида /bot<token>/<method> так же, как
+api.telegram.org: getUpdates отдаёт обновления, положенные через push_update
+(с long polling и подтверждением через offset), sendMessage, sendMediaGroup,
+sendDocument и answerCallbackQuery возвращают правдоподобные объекты.
+Задержка ответа и доля ответов 429 с retry_after настраиваются, чтобы
+проверять поведение бота под ограничениями Telegram.
+
+Бот направляется на заглушку через telebot.apihelper.API_URL:
+    api = MockBotAPI(latency_ms=20, rate_limit_ratio=0.01)
+    api.start()
+    apihelper.API_URL = api.api_url
+"""
+import itertools
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'MockBot', 'username': 'mock_bot'}
+# Методы отправки, на которых имитируется 429
+SEND_METHODS = frozenset({'sendMessage', 'sendMediaGroup', 'sendDocument', 'sendPhoto'})
+# Дольше не держим getUpdates, чтобы stop_polling не ждал полный таймаут
+MAX_POLL_WAIT = 1.0
+
+
+class _MockRequestHandler(BaseHTTPRequestHandler):
+    server_version = 'MockBotAPI'
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        self._handle()
+
+    def _handle(self):
+        url = urlsplit(self.path)
+        parts = url.path.strip('/').split('/')
+        if len(parts) != 2 or not parts[0].startswith('bot'):
+            self._respond(404, {'ok': False, 'error_code': 404, 'description': 'Not Found'})
+            return
+        params = dict(parse_qsl(url.query))
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        if self.headers.get('Content-Type', '').startswith('application/x-www-form-urlencoded'):
+            params.update(parse_qsl(body.decode()))
+        status, payload = self.server.api.call(parts[1], params)
+        self._respond(status, payload)
+
+    def _respond(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Журнал каждого запроса искажает замеры
+        pass
+
+
+class MockBotAPI:
+    """
+    Заглушка Bot API с очередью обновлений и учётом вызовов.
+
+    :param host: Адрес для прослушивания
+    :param port: Порт (0 — любой свободный)
+    :param latency_ms: Задержка каждого ответа, кроме ожидания в getUpdates (мс)
+    :param rate_limit_ratio: Доля вызовов методов отправки, получающих 429
+    :param retry_after: retry_after в ответах 429 (сек)
+    :param listener: Вызывается после успешной отправки как listener(method, chat_id, params)
+    :param seed: Зерно генератора для воспроизводимой выборки 429
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency_ms=0, rate_limit_ratio=0.0, retry_after=1,
+                 listener=None, seed=None):
+        self.latency = latency_ms / 1000
+        self.rate_limit_ratio = rate_limit_ratio
+        self.retry_after = retry_after
+        self.listener = listener
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self._updates = []
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._file_ids = itertools.count(1)
+        self._condition = threading.Condition()
+        self._closed = False
+        self._calls = Counter()
+        self._rate_limited = Counter()
+        self._stats_lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _MockRequestHandler)
+        self._server.daemon_threads = True
+        self._server.api = self
+        self._thread = None
+
+    @property
+    def api_url(self):
+        """
+        Шаблон для telebot.apihelper.API_URL.
+        """
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/bot{{0}}/{{1}}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='mock-bot-api', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def push_update(self, update):
+        """
+        Кладёт обновление в очередь getUpdates.
+
+        :param update: Обновление без update_id
+        :return: Присвоенный update_id
+        """
+        with self._condition:
+            update_id = next(self._update_ids)
+            self._updates.append(dict(update, update_id=update_id))
+            self._condition.notify_all()
+        return update_id
+
+    def stats(self):
+        with self._stats_lock:
+            calls = dict(self._calls)
+            rate_limited = dict(self._rate_limited)
+        with self._condition:
+            pending = len(self._updates)
+        return {'calls': calls, 'rate_limited': rate_limited, 'pending_updates': pending}
+
+    def call(self, method, params):
+        """
+        Выполняет метод Bot API.
+
+        :return: Пара (HTTP-статус, тело ответа)
+        """
+        with self._stats_lock:
+            self._calls[method] += 1
+        if method == 'getUpdates':
+            return 200, {'ok': True, 'result': self._get_updates(params)}
+        if self.latency:
+            time.sleep(self.latency)
+        if method in SEND_METHODS and self._should_rate_limit():
+            with self._stats_lock:
+                self._rate_limited[method] += 1
+            return 429, {
+                'ok': False,
+                'error_code': 429,
+                'description': f'Too Many Requests: retry after {self.retry_after}',
+                'parameters': {'retry_after': self.retry_after}
+            }
+        handler = getattr(self, f'_method_{method}', None)
+        result = handler(params) if handler else True
+        if method in SEND_METHODS and self.listener is not None:
+            self.listener(method, int(params['chat_id']), params)
+        return 200, {'ok': True, 'result': result}
+
+    def _should_rate_limit(self):
+        if not self.rate_limit_ratio:
+            return False
+        with self._random_lock:
+            return self._random.random() < self.rate_limit_ratio
+
+    def _get_updates(self, params):
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        timeout = min(float(params.get('timeout') or 0), MAX_POLL_WAIT)
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            # Подтверждённые через offset обновления больше не отдаются
+            if offset:
+                self._updates = [update for update in self._updates if update['update_id'] >= offset]
+            while not self._updates and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            return self._updates[:limit]
+
+    def _message(self, params, **content):
+        return dict(
+            message_id=next(self._message_ids),
+            date=int(time.time()),
+            chat={'id': int(params['chat_id']), 'type': 'private'},
+            **{'from': BOT_USER},
+            **content
+        )
+
+    def _file(self, **extra):
+        number = next(self._file_ids)
+        return dict(file_id=f'mock-file-{number}', file_unique_id=f'mock-unique-{number}', **extra)
+
+    def _method_getMe(self, params):
+        return dict(BOT_USER, can_join_groups=True, can_read_all_group_messages=False, supports_inline_queries=False)
+
+    def _method_sendMessage(self, params):
+        return self._message(params, text=params.get('text', ''))
+
+    def _method_sendDocument(self, params):
+        return self._message(params, document=self._file(file_name='document'))
+
+    def _method_sendPhoto(self, params):
+        return self._message(params, photo=[self._file(width=1280, height=720)])
+
+    def _method_sendMediaGroup(self, params):
+        media = json.loads(params.get('media') or '[]')
+        media_group_id = str(next(self._file_ids))
+        messages = []
+        for item in media:
+            if item.get('type') == 'document':
+                content = {'document': self._file(file_name='document')}
+            else:
+                content = {'photo': [self._file(width=1280, height=720)]}
+            messages.append(self._message(params, media_group_id=media_group_id, **content))
+        return messages
@@ -1,9 +1,74 @@
-from handlers import bot
+import atexit
+import secrets
+import signal
+import sys
+
+from handlers import (
+    bot, broadcaster, dispatcher, outbound, payment_index, state_storage,
+    send_broadcast_report, warm_media_cache
+)
 from telebot import custom_filters
 
+import storage
+from config import (
+    BOT_MODE, METRICS_PORT, STATE_STORAGE_BACKEND, WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET_TOKEN
+)
+from logger import logger
+from metrics import MetricsServer
+from webhook import WebhookServer
+
 
 bot.add_custom_filter(custom_filters.StateFilter(bot))
 
+# При любом завершении записываем отложенные изменения пользователей
+atexit.register(storage.shutdown)
+if STATE_STORAGE_BACKEND == 'sqlite':
+    atexit.register(state_storage.stop)
+atexit.register(payment_index.stop)
+# Уже поставленные в очередь сообщения отправляются до остановки
+atexit.register(outbound.stop)
+if dispatcher is not None:
+    # Обработчики atexit выполняются в обратном порядке: сначала дообрабатываем очереди
+    atexit.register(dispatcher.stop)
+
+
+def handle_sigterm(signum, frame):
+    logger.info("Получен SIGTERM, завершаем работу бота.")
+    bot.stop_polling()
+    # SystemExit запускает обработчики atexit
+    sys.exit(0)
+
+
+def run_webhook():
+    """
+    Принимает обновления через вебхук вместо long polling.
+    """
+    secret_token = WEBHOOK_SECRET_TOKEN or secrets.token_urlsafe(32)
+    # Обработчики выполняет диспетчер: в режиме вебхука он есть всегда (WEBHOOK_WORKERS очередей)
+    server = WebhookServer(bot, secret_token)
+    if WEBHOOK_URL:
+        bot.set_webhook(url=WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH, secret_token=secret_token)
+        logger.info(f"Вебхук зарегистрирован: {WEBHOOK_URL}.")
+    else:
+        logger.warning(f"WEBHOOK_URL не задан, вебхук не зарегистрирован. Секретный токен: {secret_token}")
+    try:
+        server.serve_forever()
+    finally:
+        # Дообрабатываем принятые обновления до записи отложенных изменений
+        server.stop()
+
+
 # Запускаем бота
 if __name__ == "__main__":
-    bot.infinity_polling()
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    if METRICS_PORT:
+        MetricsServer().start()
+    warm_media_cache()
+    # Незавершённая до перезапуска рассылка продолжается без повторных отправок
+    broadcaster.resume(on_finish=send_broadcast_report)
+    if BOT_MODE == 'webhook':
+        run_webhook()
+    else:
+        # getUpdates не работает, пока зарегистрирован вебхук
+        bot.remove_webhook()
+        bot.infinity_polling()
@@ -0,0 +1,269 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+from telebot.apihelper import ApiTelegramException
+
+import storage
+from config import BROADCAST_STATE_FILE, BROADCAST_LOG_FILE, BROADCAST_MAX_IN_FLIGHT
+from logger import logger
+from outbound import PRIORITY_BULK
+
+
+def parse_filters(tokens, fields=None):
+    """
+    Разбирает фильтры вида поле=значение.
+
+    :param tokens: Строки фильтров, например ['is_registered=1', 'is_payment_confirmed=0']
+    :param fields: Допустимые поля; по умолчанию — поля, по которым выбирает активное хранилище
+    :return: Словарь фильтров для storage.iter_user_ids
+    :raises ValueError: Если фильтр некорректен или хранилище не умеет выбирать по полю
+    """
+    fields = storage.query_fields() if fields is None else fields
+    filters = {}
+    for token in tokens:
+        key, sep, value = token.partition('=')
+        if not sep:
+            raise ValueError(f"Некорректный фильтр: {token}")
+        if key not in fields:
+            raise ValueError(f"Поле {key} недоступно для фильтра. Доступные: {', '.join(fields)}")
+        if key in storage.BOOL_FIELDS:
+            lowered = value.lower()
+            if lowered in ('1', 'true', 'да'):
+                filters[key] = True
+            elif lowered in ('0', 'false', 'нет'):
+                filters[key] = False
+            else:
+                raise ValueError(f"Поле {key} принимает 1 или 0: {token}")
+        elif key == 'user_id':
+            try:
+                filters[key] = int(value)
+            except ValueError:
+                raise ValueError(f"Некорректный user_id: {token}") from None
+        else:
+            filters[key] = value
+    return filters
+
+
+def _is_blocked(error):
+    # 403: пользователь заблокировал бота или удалил аккаунт
+    return isinstance(error, ApiTelegramException) and error.error_code == 403
+
+
+class Broadcast:
+    """
+    Рассылка сообщения по пользователям с контрольными точками.
+
+    Задание рассылки хранится в BROADCAST_STATE_FILE, а ход — в журнале
+    BROADCAST_LOG_FILE: перед отправкой пишется строка «S user_id», после —
+    «D user_id» или «F user_id причина». После сбоя рассылка продолжается
+    с пропуском всех, кому отправка уже начиналась, поэтому повторных
+    сообщений не бывает; начатые, но не завершённые отправки попадают в отчёт.
+    """
+
+    def __init__(self, outbound, state_path=BROADCAST_STATE_FILE, log_path=BROADCAST_LOG_FILE,
+                 max_in_flight=BROADCAST_MAX_IN_FLIGHT):
+        self.outbound = outbound
+        self.state_path = state_path
+        self.log_path = log_path
+        self.max_in_flight = max_in_flight
+        self._lock = threading.Lock()
+        self._thread = None
+        self._job = None
+        self._stats = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, admin_id, text, filters, on_finish=None):
+        """
+        Запускает новую рассылку.
+
+        :param admin_id: Кому отправить отчёт
+        :param text: Текст сообщения (HTML)
+        :param filters: Фильтры для storage.iter_user_ids
+        :param on_finish: Функция, получающая отчёт по завершении
+        :return: False, если другая рассылка ещё идёт
+        """
+        with self._lock:
+            if self.running:
+                return False
+            job = {
+                'id': datetime.now().strftime('%Y%m%d%H%M%S'),
+                'admin_id': admin_id,
+                'text': text,
+                'filters': filters,
+                'started_at': time.time(),
+            }
+            tmp_path = self.state_path.with_name(self.state_path.name + '.tmp')
+            with open(tmp_path, 'w', encoding='UTF-8') as f:
+                json.dump(job, f, ensure_ascii=False, indent=4)
+            os.replace(tmp_path, self.state_path)
+            open(self.log_path, 'w', encoding='UTF-8').close()
+            self._launch(job, on_finish)
+        return True
+
+    def resume(self, on_finish=None):
+        """
+        Продолжает незавершённую рассылку после перезапуска.
+
+        :return: True, если рассылка была и продолжена
+        """
+        try:
+            with open(self.state_path, 'r', encoding='UTF-8') as f:
+                job = json.load(f)
+        except FileNotFoundError:
+            return False
+        except json.JSONDecodeError as e:
+            logger.error(f"Ошибка декодирования {self.state_path}: {e}")
+            return False
+        with self._lock:
+            if self.running:
+                return False
+            logger.info(f"Продолжаем незавершённую рассылку {job['id']}.")
+            self._launch(job, on_finish)
+        return True
+
+    def _launch(self, job, on_finish):
+        self._job = job
+        self._stats = {
+            'total': 0, 'sent': 0, 'blocked': 0, 'failed': 0,
+            'skipped': 0, 'uncertain': 0, 'error': None, 'started_at': time.monotonic(),
+        }
+        self._thread = threading.Thread(target=self._run, args=(job, on_finish), name='broadcast', daemon=True)
+        self._thread.start()
+
+    def _read_log(self):
+        """
+        Читает журнал рассылки.
+
+        Повреждённые строки пропускаются. Последняя строка без перевода строки
+        могла оборваться при сбое и тоже не учитывается: даже если она
+        разбирается, user_id в ней может быть обрезан.
+
+        :return: (user_id начатых отправок, user_id завершённых,
+                  размер журнала без оборванной строки или None, если обрыва нет)
+        """
+        started, finished = set(), set()
+        try:
+            with open(self.log_path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return started, finished, None
+        complete = data.rfind(b'\n') + 1
+        intact_size = None
+        if complete < len(data):
+            intact_size = complete
+            logger.warning(f"Последняя строка журнала рассылки {self.log_path} оборвана: {data[complete:]!r}")
+        lines = data[:complete].decode('UTF-8', errors='replace').splitlines()
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            parts = line.split(' ', 2)
+            try:
+                kind, user_id = parts[0], int(parts[1])
+            except (IndexError, ValueError):
+                kind = None
+            if kind not in ('S', 'D', 'F'):
+                logger.warning(f"Пропущена повреждённая строка {number} журнала рассылки {self.log_path}: {line!r}")
+                continue
+            (started if kind == 'S' else finished).add(user_id)
+        return started, finished, intact_size
+
+    def recipients(self, filters):
+        """
+        Отдаёт user_id получателей по возрастанию.
+        """
+        # Изменения из очереди отложенной записи тоже должны попасть в выборку
+        storage.flush_users()
+        yield from storage.iter_user_ids(**filters)
+
+    def _run(self, job, on_finish):
+        try:
+            self._send_all(job)
+        except Exception as e:
+            logger.error(f"Рассылка {job['id']} прервана: {e}")
+            with self._lock:
+                self._stats['error'] = str(e)
+            # Задание остаётся на диске: после перезапуска рассылка продолжится по журналу
+        else:
+            with self._lock:
+                # Задание выполнено — следующий запуск не должен его продолжать
+                try:
+                    os.remove(self.state_path)
+                except FileNotFoundError:
+                    pass
+
+        report = self.report()
+        report['running'] = False
+        logger.info(f"Итог рассылки {job['id']}: {report}")
+        if on_finish:
+            on_finish(job, report)
+
+    def _send_all(self, job):
+        stats = self._stats
+        started, finished, intact_size = self._read_log()
+        with self._lock:
+            stats['uncertain'] = len(started - finished)
+        if intact_size is not None:
+            # Оборванная строка удаляется, иначе новая запись продолжила бы её
+            os.truncate(self.log_path, intact_size)
+        slots = threading.BoundedSemaphore(self.max_in_flight)
+        log = open(self.log_path, 'a', encoding='UTF-8')
+        log_lock = threading.Lock()
+
+        def write(line):
+            with log_lock:
+                log.write(line + '\n')
+                log.flush()
+
+        def done(user_id, future):
+            error = future.exception()
+            with self._lock:
+                if error is None:
+                    stats['sent'] += 1
+                elif _is_blocked(error):
+                    stats['blocked'] += 1
+                else:
+                    stats['failed'] += 1
+            write(f"D {user_id}" if error is None else f"F {user_id} {str(error)[:200]!r}")
+            slots.release()
+
+        try:
+            for user_id in self.recipients(job['filters']):
+                with self._lock:
+                    stats['total'] += 1
+                if user_id in started:
+                    with self._lock:
+                        stats['skipped'] += 1
+                    continue
+                slots.acquire()
+                write(f"S {user_id}")
+                future = self.outbound.send_message(
+                    user_id, job['text'], priority=PRIORITY_BULK,
+                    parse_mode='HTML', description='рассылки'
+                )
+                future.add_done_callback(lambda f, user_id=user_id: done(user_id, f))
+        finally:
+            # Дожидаемся всех начатых отправок
+            for _ in range(self.max_in_flight):
+                slots.acquire()
+            log.close()
+
+    def report(self):
+        """
+        Текущий ход рассылки: получатели, отправлено, заблокировали бота, ошибки и скорость.
+        error — причина, по которой рассылка прервалась, или None.
+        """
+        with self._lock:
+            if self._stats is None:
+                return None
+            report = dict(self._stats)
+        elapsed = time.monotonic() - report.pop('started_at')
+        report['elapsed_s'] = round(elapsed, 1)
+        report['per_second'] = round(report['sent'] / elapsed, 1) if elapsed else 0.0
+        report['running'] = self.running
+        return report
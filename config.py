@@ -10,11 +10,100 @@ JSON_FILE_PATH = STORAGE_DIR / 'guests_ns2024.json'  # Перенесите gues
 GOOGLE_CREDENTIALS_PATH = STORAGE_DIR / 'ns2024-683591222f43.json'
 GOOGLE_SHEET_ID = '1gqk90fr4vkybdKPLmSf1gUEcUeMt4LXNQbTRpG8wOlo'
 GOOGLE_SHEET_NAME = 'Продажи билетов'
+# Локальный снимок листа; полная загрузка только если таблица изменилась
+SHEET_SNAPSHOT_FILE = STORAGE_DIR / 'sheet_snapshot.json'
+# Состояние прошлой сверки: нормализованные имена и найденные нечеткие совпадения
+RECONCILIATION_STATE_FILE = STORAGE_DIR / 'reconciliation_state.json'
 TARGET_USER_ID = {438251622, 872471903, 5669158349, 102255626, 621562696}
 
 VALID_PAYMENTS_FILE = DATA_DIR / 'guests_valid.json'
+# Журнал увеличений счётчиков подтверждения оплаты (по одному user_id на строку)
+VALID_PAYMENTS_LOG_FILE = DATA_DIR / 'guests_valid.log'
+# Как часто проверять, изменился ли guests_valid.json (сек)
+VALID_PAYMENTS_POLL_INTERVAL = 2
+# Журнал сворачивается в guests_valid.json раз в столько секунд или после стольких записей
+VALID_PAYMENTS_COMPACT_INTERVAL = 60
+VALID_PAYMENTS_COMPACT_THRESHOLD = 500
 
 USERS_DATA_FILE = DATA_DIR / 'users.json'
+# Журнал изменений пользователей (дописывается по одной записи на изменение)
+USERS_JOURNAL_FILE = DATA_DIR / 'users.journal'
+# После скольких записей журнал сворачивается в новый снимок users.json
+USERS_JOURNAL_COMPACT_THRESHOLD = 1000
+# Хранилище пользователей: 'json' (снимок + журнал) или 'sqlite'
+USERS_STORAGE_BACKEND = 'json'
+# База SQLite; перенос из users.json: python user_db.py
+USERS_DB_FILE = DATA_DIR / 'users.db'
+# Отложенная запись: изменения пользователей попадают на диск не позднее чем через это окно (мс)
+USERS_FLUSH_INTERVAL_MS = 200
+# ...или сразу, как только накопится столько изменённых пользователей
+USERS_FLUSH_MAX_BATCH = 100
+# Состояния регистрации (FSM telebot): 'memory' или 'sqlite' (переживают перезапуск)
+STATE_STORAGE_BACKEND = 'sqlite'
+STATES_DB_FILE = DATA_DIR / 'states.db'
+# Шаг регистрации waiting_for_*, не менявшийся столько секунд, считается брошенным
+STATE_TTL_SECONDS = 24 * 60 * 60
+# Как часто удалять брошенные состояния (сек)
+STATE_EVICT_INTERVAL = 10 * 60
+# Предел кэша страниц SQLite для состояний (КБ)
+STATE_DB_CACHE_KB = 2048
+# file_id Telegram для файлов меню, чтобы не загружать их заново при каждом показе
+MEDIA_CACHE_FILE = DATA_DIR / 'media_cache.json'
+# Чат, куда при запуске загружаются файлы меню без file_id (None — загрузка при первом показе)
+MEDIA_CACHE_WARMUP_CHAT_ID = None
+
+# Получение обновлений: 'polling' (infinity_polling) или 'webhook' (встроенный HTTP-сервер)
+BOT_MODE = 'polling'
+# Публичный адрес, который регистрируется в Telegram; пустой — set_webhook не вызывается (локальная проверка)
+WEBHOOK_URL = ''
+WEBHOOK_HOST = '0.0.0.0'
+WEBHOOK_PORT = 8443
+WEBHOOK_PATH = '/telegram/webhook'
+# Секрет из заголовка X-Telegram-Bot-Api-Secret-Token; пустой — генерируется при запуске
+WEBHOOK_SECRET_TOKEN = ''
+# Сколько обновлений может ждать обработки; при переполнении Telegram получает 503 и повторяет доставку
+WEBHOOK_QUEUE_SIZE = 1000
+# Одновременных обработчиков в режиме вебхука: число очередей диспетчера, если UPDATE_SHARDS = 0
+WEBHOOK_WORKERS = 4
+# Очередей диспетчера обновлений: обновления одного пользователя идут по порядку, разных — параллельно.
+# 0 — обработка силами telebot без диспетчера
+UPDATE_SHARDS = 0
+# Сколько обновлений может ждать в одной очереди, прежде чем приём притормозит
+UPDATE_SHARD_QUEUE_SIZE = 1000
+
+# Очередь исходящих сообщений: потоки отправки и лимиты Telegram
+OUTBOUND_WORKERS = 4
+# Не больше 30 сообщений в секунду на бота
+OUTBOUND_GLOBAL_RATE = 30
+OUTBOUND_GLOBAL_BURST = 30
+# Около одного сообщения в секунду в один чат, с небольшим запасом на серию
+OUTBOUND_CHAT_RATE = 1
+OUTBOUND_CHAT_BURST = 3
+# Сколько раз повторять отправку после ответа 429
+OUTBOUND_MAX_RETRIES = 3
+
+# Задание текущей рассылки и журнал её хода (для продолжения после сбоя)
+BROADCAST_STATE_FILE = DATA_DIR / 'broadcast.json'
+BROADCAST_LOG_FILE = DATA_DIR / 'broadcast.log'
+# Сколько сообщений рассылки может одновременно ждать в очереди отправки
+BROADCAST_MAX_IN_FLIGHT = 50
+
+# Метрики Prometheus (/metrics) на локальном адресе; 0 — сервер не запускается
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = 9108
+# Профилирование обновлений: 'off', 'sample' (доля PROFILE_SAMPLE_RATE) или
+# 'threshold' (профилируется всё, сохраняются обновления дольше PROFILE_THRESHOLD_MS)
+PROFILE_MODE = 'off'
+PROFILE_SAMPLE_RATE = 0.01
+PROFILE_THRESHOLD_MS = 500
+# Сколько самых медленных профилей хранить для /profiles
+PROFILE_KEEP = 20
+# Отчёт сверки длиннее порога (символов) отправляется документом, а не страницами сообщений
+REPORT_DOCUMENT_THRESHOLD = 20000
+# Формат документа с отчётом: 'csv' или 'html'
+REPORT_DOCUMENT_FORMAT = 'csv'
+# Для скольких последних отчётов работают кнопки перелистывания
+REPORT_PAGES_KEEP = 20
 
 
 
@@ -1,45 +1,145 @@
+import hashlib
 import json
+import os
+import threading
 import gspread
 from google.oauth2.service_account import Credentials
 import re
 from fuzzywuzzy import fuzz
+from fuzzy_index import FuzzyNameIndex
 from logger import logger
+from report import ReconciliationReport
 from config import (
     JSON_FILE_PATH,
     GOOGLE_CREDENTIALS_PATH,
     GOOGLE_SHEET_ID,
-    GOOGLE_SHEET_NAME
+    GOOGLE_SHEET_NAME,
+    SHEET_SNAPSHOT_FILE,
+    RECONCILIATION_STATE_FILE
 )
 
+# Порог схожести для нечетких совпадений, можно настроить
+FUZZY_SIMILARITY_MIN = 90
+FUZZY_SIMILARITY_MAX = 100
+
+# Имена из таблицы с латиницей или спец. символами
+LATIN_OR_SPECIAL_RE = re.compile(r'[a-zA-Z!$%&/()=?@#^*;:<>~`"{},$begin:math:display$$end:math:display$\\]')
+
+# Версия формата состояния сверки; при изменении нормализации её нужно увеличить
+STATE_VERSION = 1
+
+GOOGLE_SCOPES = [
+    "https://www.googleapis.com/auth/spreadsheets.readonly",
+    # Нужен для дешёвой проверки времени изменения таблицы
+    "https://www.googleapis.com/auth/drive.metadata.readonly",
+]
+
+# Авторизованные клиенты gspread переиспользуются между сверками
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_sheets_client(credentials_path):
+    with _clients_lock:
+        client = _clients.get(credentials_path)
+        if client is None:
+            creds = Credentials.from_service_account_file(credentials_path, scopes=GOOGLE_SCOPES)
+            client = gspread.authorize(creds)
+            _clients[credentials_path] = client
+            logger.debug("Создан клиент Google Sheets для %s.", credentials_path)
+        return client
+
+
 class DataMatcher:
-    def __init__(self, json_file_path, credentials_path, sheet_id, sheet_name):
+    def __init__(self, json_file_path, credentials_path, sheet_id, sheet_name,
+                 client=None, snapshot_path=SHEET_SNAPSHOT_FILE, state_path=RECONCILIATION_STATE_FILE):
         self.json_file_path = json_file_path
         self.credentials_path = credentials_path
         self.sheet_id = sheet_id
         self.sheet_name = sheet_name
+        # Клиент можно передать явно, например подделку для проверки без сети
+        self.client = client
+        self.snapshot_path = snapshot_path
         self.json_data = {}
+        self.json_hash = None
         self.sheet_data = []
+        self.sheet_revision = None
+        # Состояние прошлой сверки для пересчёта только изменившихся строк
+        self.state_path = state_path
+        self.state = None
+        self._name_cache = {}
+        self._used_names = {}
+        self.normalized_rows = 0
 
     def load_json(self):
         try:
-            with open(self.json_file_path, 'r', encoding='utf-8') as f:
-                self.json_data = json.load(f)
+            with open(self.json_file_path, 'rb') as f:
+                raw = f.read()
+            self.json_hash = hashlib.sha256(raw).hexdigest()
+            self.json_data = json.loads(raw.decode('utf-8'))
             logger.info(f"JSON данные загружены из {self.json_file_path}.")
         except FileNotFoundError:
             logger.error(f"Файл JSON не найден: {self.json_file_path}.")
         except json.JSONDecodeError:
             logger.error(f"Ошибка декодирования JSON из файла: {self.json_file_path}.")
 
+    def load_snapshot(self):
+        if not self.snapshot_path:
+            return None
+        try:
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            return None
+        except json.JSONDecodeError:
+            logger.warning(f"Снимок таблицы повреждён: {self.snapshot_path}.")
+            return None
+        if snapshot.get('sheet_id') != self.sheet_id or snapshot.get('sheet_name') != self.sheet_name:
+            return None
+        return snapshot
+
+    def save_snapshot(self):
+        if not self.snapshot_path or self.sheet_revision is None:
+            return
+        snapshot = {
+            'sheet_id': self.sheet_id,
+            'sheet_name': self.sheet_name,
+            'revision': self.sheet_revision,
+            'records': self.sheet_data,
+        }
+        tmp_path = f"{self.snapshot_path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f, ensure_ascii=False)
+            os.replace(tmp_path, self.snapshot_path)
+        except OSError as e:
+            logger.error(f"Ошибка при сохранении снимка таблицы {self.snapshot_path}: {e}")
+
+    @staticmethod
+    def fetch_revision(spreadsheet):
+        try:
+            return spreadsheet.get_lastUpdateTime()
+        except Exception as e:
+            # Без ревизии таблица просто загружается целиком
+            logger.warning(f"Не удалось получить время изменения Google Sheets: {e}")
+            return None
+
     def connect_to_google_sheets(self):
         expected_headers = ['№', 'Фамилия', 'Имя', 'Отчество', 'ВУЗ', 'Деньги', 'Билет', 'Способ', 'Дата']
         try:
-            creds = Credentials.from_service_account_file(
-                self.credentials_path,
-                scopes=["https://www.googleapis.com/auth/spreadsheets.readonly"]
-            )
-            client = gspread.authorize(creds)
-            sheet = client.open_by_key(self.sheet_id).worksheet(self.sheet_name)
+            client = self.client or get_sheets_client(self.credentials_path)
+            spreadsheet = client.open_by_key(self.sheet_id)
+            revision = self.fetch_revision(spreadsheet)
+            snapshot = self.load_snapshot()
+            if revision is not None and snapshot and snapshot.get('revision') == revision:
+                self.sheet_data = snapshot['records']
+                self.sheet_revision = revision
+                logger.info(f"Google Sheets ({self.sheet_name}) не менялась с {revision}, используется локальный снимок.")
+                return
+            sheet = spreadsheet.worksheet(self.sheet_name)
             self.sheet_data = sheet.get_all_records()
+            self.sheet_revision = revision
+            self.save_snapshot()
             logger.info(f"Данные из Google Sheets ({self.sheet_name}) успешно загружены.")
         except FileNotFoundError:
             logger.error(f"Файл учетных данных не найден: {self.credentials_path}.")
@@ -48,10 +148,58 @@ class DataMatcher:
         except Exception as e:
             logger.error(f"Ошибка при подключении к Google Sheets: {e}")
 
+    def input_fingerprint(self):
+        """
+        Хэш входных данных сверки: содержимого JSON и версии данных таблицы.
+        """
+        if self.sheet_revision is not None:
+            sheet_key = f"revision:{self.sheet_revision}"
+        else:
+            sheet_key = hashlib.sha256(
+                json.dumps(self.sheet_data, ensure_ascii=False, sort_keys=True).encode('utf-8')
+            ).hexdigest()
+        return hashlib.sha256(f"{self.json_hash}|{sheet_key}".encode('utf-8')).hexdigest()
+
     @staticmethod
     def normalize_name(name):
         return re.sub(r'\s+', ' ', name.replace("ё", "е").replace("Ё", "Е")).strip().lower()
 
+    def load_state(self):
+        empty = {'version': STATE_VERSION, 'names': {}, 'json_names': [], 'thresholds': None, 'unmatched': {}}
+        if not self.state_path:
+            return empty
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return empty
+        except json.JSONDecodeError:
+            logger.warning(f"Состояние сверки повреждено, выполняется полная сверка: {self.state_path}.")
+            return empty
+        if state.get('version') != STATE_VERSION:
+            return empty
+        return state
+
+    def save_state(self, state):
+        if not self.state_path:
+            return
+        tmp_path = f"{self.state_path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f, ensure_ascii=False)
+            os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            logger.error(f"Ошибка при сохранении состояния сверки {self.state_path}: {e}")
+
+    def _normalize_cached(self, full_name):
+        # Строки, не изменившиеся с прошлой сверки, повторно не нормализуются
+        normalized_full_name = self._name_cache.get(full_name)
+        if normalized_full_name is None:
+            normalized_full_name = self.normalize_name(full_name)
+            self.normalized_rows += 1
+        self._used_names[full_name] = normalized_full_name
+        return normalized_full_name
+
     def prepare_json_data(self):
         normalized_data = {}
         for username, details in self.json_data.items():
@@ -60,7 +208,7 @@ class DataMatcher:
                 continue
             user_id, last_name, first_name, middle_name = details[:4]
             full_name = f"{last_name.strip()} {first_name.strip()} {middle_name.strip()}"
-            normalized_full_name = self.normalize_name(full_name)
+            normalized_full_name = self._normalize_cached(full_name)
             normalized_data[normalized_full_name] = user_id
         logger.debug("JSON данные нормализованы.")
         return normalized_data
@@ -70,7 +218,7 @@ class DataMatcher:
         for row in self.sheet_data:
             try:
                 full_name = f"{row['Фамилия']} {row['Имя']} {row['Отчество']}"
-                normalized_full_name = self.normalize_name(full_name)
+                normalized_full_name = self._normalize_cached(full_name)
                 normalized_data[normalized_full_name] = row  # Сохраняем всю строку для дальнейшего анализа
             except KeyError as e:
                 logger.error(f"Отсутствует ожидаемый заголовок в Google Sheets: {e}")
@@ -81,57 +229,95 @@ class DataMatcher:
         matches = []
         for sheet_name in sheet_normalized:
             similarity = fuzz.ratio(name, sheet_name)
-            if 90 < similarity < 100:  # Порог схожести, можно настроить
+            if FUZZY_SIMILARITY_MIN < similarity < FUZZY_SIMILARITY_MAX:
                 matches.append((sheet_name, similarity))
         return matches
 
+    def update_unmatched(self, json_normalized, unmatched_names):
+        """
+        Обновляет нечеткие совпадения имён из таблицы, которых нет в JSON.
+
+        Для имён, уже проверенных в прошлую сверку, сравниваются только добавленные
+        в JSON имена, а удалённые вычёркиваются. Новые имена из таблицы сравниваются
+        со всем JSON.
+
+        :param json_normalized: Нормализованные имена из JSON
+        :param unmatched_names: Имена из таблицы, которых нет в JSON, в порядке таблицы
+        :return: Словарь {имя из таблицы: [латиница или спец. символы, {имя из JSON: схожесть}]}
+        """
+        thresholds = [FUZZY_SIMILARITY_MIN, FUZZY_SIMILARITY_MAX]
+        previous = self.state['unmatched'] if self.state.get('thresholds') == thresholds else {}
+        previous_json = set(self.state['json_names']) if previous else set()
+
+        entries = {name: previous[name] for name in unmatched_names if name in previous}
+        removed_json = previous_json.difference(json_normalized)
+        added_json = [name for name in json_normalized if name not in previous_json]
+
+        if removed_json:
+            for entry in entries.values():
+                entry[1] = {name: similarity for name, similarity in entry[1].items() if name not in removed_json}
+
+        if added_json and entries:
+            # Новые имена JSON ищем среди уже проверенных имён таблицы
+            sheet_index = FuzzyNameIndex(entries, FUZZY_SIMILARITY_MIN, FUZZY_SIMILARITY_MAX)
+            for json_name in added_json:
+                for sheet_name, similarity in sheet_index.matches(json_name, query_first=False):
+                    entries[sheet_name][1][json_name] = similarity
+
+        new_names = [name for name in unmatched_names if name not in entries]
+        if new_names:
+            # Индекс по сегментам имён отбирает кандидатов вместо перебора всех имён из JSON
+            json_index = FuzzyNameIndex(json_normalized, FUZZY_SIMILARITY_MIN, FUZZY_SIMILARITY_MAX)
+            for sheet_name in new_names:
+                # Проверка на наличие латиницы или спец. символов и нечеткое сравнение
+                entries[sheet_name] = [
+                    bool(LATIN_OR_SPECIAL_RE.search(sheet_name)),
+                    dict(json_index.matches(sheet_name))
+                ]
+
+        logger.debug(
+            "Нечеткое сравнение: %s новых имён из таблицы, %s добавленных и %s удалённых имён JSON.",
+            len(new_names), len(added_json), len(removed_json)
+        )
+        return entries
+
     def match_data(self):
+        self.state = self.load_state()
+        self._name_cache = self.state.get('names', {})
+        self._used_names = {}
+        self.normalized_rows = 0
+
         json_normalized = self.prepare_json_data()
         sheet_normalized = self.prepare_sheet_data()
+        logger.debug("Нормализовано новых или изменённых строк: %s.", self.normalized_rows)
 
         missing_in_sheet = [name for name in json_normalized if name not in sheet_normalized]
         missing_in_json = [name for name in sheet_normalized if name not in json_normalized]
 
-        # Хранение имен с латиницей или спец. символами
-        latin_or_special_names = set()
+        unmatched = self.update_unmatched(json_normalized, missing_in_json)
+        self.save_state({
+            'version': STATE_VERSION,
+            'names': self._used_names,
+            'json_names': list(json_normalized),
+            'thresholds': [FUZZY_SIMILARITY_MIN, FUZZY_SIMILARITY_MAX],
+            'unmatched': unmatched,
+        })
+
+        # Имена с латиницей или спец. символами в порядке таблицы
+        latin_or_special_names = []
 
-        # Сверка данных и поиск нечетких совпадений
+        # Нечеткие совпадения выводятся в порядке таблицы, а для каждого имени — в порядке JSON
+        json_positions = {name: position for position, name in enumerate(json_normalized)}
         fuzzy_matches_output = []
-        for sheet_name in sheet_normalized:
-            if sheet_name not in json_normalized:
-                # Проверка на наличие латиницы или спец. символов
-                if re.search(r'[a-zA-Z!$%&/()=?@#^*;:<>~`"{},$begin:math:display$$end:math:display$\\]', sheet_name):
-                    latin_or_special_names.add(sheet_name)
-
-                # Выполнение нечеткого сравнения
-                fuzzy_matches = self.fuzzy_match_names(sheet_name, json_normalized)
-                for match_name, similarity in fuzzy_matches:
-                    fuzzy_matches_output.append(
-                        f"{sheet_name} (из таблицы) похоже на {match_name} (из JSON) с схожестью {similarity}%"
-                    )
-
-        # Формирование результата для отправки
-        result = ""
-        if fuzzy_matches_output:
-            result += "<b>Нечеткие совпадения:</b>\n"
-            result += "\n".join(fuzzy_matches_output) + "\n\n"
-
-        if missing_in_sheet:
-            result += "<b>Отсутствуют в Google Таблице:</b>\n"
-            result += ", ".join(missing_in_sheet) + "\n\n"
-
-        if missing_in_json:
-            result += "<b>Отсутствуют в JSON:</b>\n"
-            result += ", ".join(missing_in_json) + "\n\n"
-
-        if latin_or_special_names:
-            result += "<b>На латинице или со спец. символами:</b>\n"
-            result += ", ".join(latin_or_special_names) + "\n\n"
-
-        if not result:
-            result = "Все данные совпадают идеально!"
+        for sheet_name in missing_in_json:
+            is_latin_or_special, fuzzy_matches = unmatched[sheet_name]
+            if is_latin_or_special:
+                latin_or_special_names.append(sheet_name)
+            for match_name in sorted(fuzzy_matches, key=json_positions.__getitem__):
+                fuzzy_matches_output.append((sheet_name, match_name, fuzzy_matches[match_name]))
 
-        return result
+        # Текст отчёта собирается при отправке: постранично или сразу в файл
+        return ReconciliationReport(fuzzy_matches_output, missing_in_sheet, missing_in_json, latin_or_special_names)
 
     def run(self):
         self.load_json()
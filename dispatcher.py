@@ -0,0 +1,134 @@
+import queue
+import threading
+import time
+from logger import logger
+
+# Поля Update, в которых Telegram присылает автора в from_user
+_USER_UPDATE_FIELDS = (
+    'message', 'edited_message', 'callback_query', 'inline_query', 'chosen_inline_result',
+    'shipping_query', 'pre_checkout_query', 'my_chat_member', 'chat_member', 'chat_join_request',
+)
+
+
+def update_user_id(update):
+    """
+    Определяет пользователя, от которого пришло обновление.
+
+    :return: user_id или None, если в обновлении нет пользователя
+    """
+    for field in _USER_UPDATE_FIELDS:
+        event = getattr(update, field, None)
+        if event is not None and getattr(event, 'from_user', None) is not None:
+            return event.from_user.id
+    poll_answer = getattr(update, 'poll_answer', None)
+    if poll_answer is not None and poll_answer.user is not None:
+        return poll_answer.user.id
+    return None
+
+
+class ShardedDispatcher:
+    """
+    Параллельная обработка обновлений с сохранением порядка для каждого пользователя.
+
+    Обновления распределяются по очередям по user_id, у каждой очереди один
+    рабочий поток. Обновления одного пользователя обрабатываются строго по
+    порядку, разные пользователи — параллельно. Бот должен быть создан
+    с threaded=False, чтобы обработчики выполнялись в потоке очереди.
+    """
+
+    def __init__(self, process_updates, shards, queue_size, bot=None):
+        self.process_updates = process_updates
+        self.bot = bot
+        self.shards = shards
+        self._queues = [queue.Queue(maxsize=queue_size) for _ in range(shards)]
+        self._threads = []
+        self._lock = threading.Lock()
+        self._stats = [
+            {'processed': 0, 'errors': 0, 'last_lag_ms': 0.0, 'max_lag_ms': 0.0, 'total_lag_ms': 0.0}
+            for _ in range(shards)
+        ]
+
+    @classmethod
+    def install(cls, bot, shards, queue_size):
+        """
+        Перенаправляет bot.process_new_updates в очереди диспетчера.
+
+        Через этот метод обновления передают и infinity_polling, и вебхук.
+        """
+        dispatcher = cls(bot.process_new_updates, shards, queue_size, bot=bot)
+        bot.process_new_updates = dispatcher.submit
+        dispatcher.start()
+        return dispatcher
+
+    def shard_for(self, update):
+        user_id = update_user_id(update)
+        # Обновления без пользователя не зависят друг от друга
+        key = user_id if user_id is not None else update.update_id
+        return key % self.shards
+
+    def submit(self, updates):
+        """
+        Раскладывает обновления по очередям.
+
+        Если очередь заполнена, вызывающий поток ждёт: при polling это
+        откладывает следующий getUpdates, при вебхуке — заполняет его очередь.
+        """
+        for update in updates:
+            # telebot сдвигает offset в process_new_updates, который теперь выполняется позже в потоке очереди;
+            # без этого следующий getUpdates снова получит ещё не обработанные обновления
+            if self.bot is not None and update.update_id > self.bot.last_update_id:
+                self.bot.last_update_id = update.update_id
+            self._queues[self.shard_for(update)].put((update, time.monotonic()))
+
+    def start(self):
+        if self._threads:
+            return
+        for index in range(self.shards):
+            thread = threading.Thread(target=self._work, args=(index,), name=f'updates-shard-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Диспетчер обновлений запущен: {self.shards} очередей.")
+
+    def _work(self, index):
+        updates = self._queues[index]
+        stats = self._stats[index]
+        while True:
+            item = updates.get()
+            if item is None:
+                return
+            update, queued_at = item
+            lag_ms = (time.monotonic() - queued_at) * 1000
+            try:
+                self.process_updates([update])
+            except Exception as e:
+                with self._lock:
+                    stats['errors'] += 1
+                logger.error(f"Ошибка при обработке обновления {update.update_id} в очереди {index}: {e}")
+            with self._lock:
+                stats['processed'] += 1
+                stats['last_lag_ms'] = lag_ms
+                stats['max_lag_ms'] = max(stats['max_lag_ms'], lag_ms)
+                stats['total_lag_ms'] += lag_ms
+
+    def stop(self):
+        """
+        Дожидается обработки поставленных в очередь обновлений и останавливает потоки.
+        """
+        for updates in self._queues:
+            updates.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        logger.info(f"Диспетчер обновлений остановлен, обработано: {sum(s['processed'] for s in self._stats)}.")
+
+    def stats(self):
+        """
+        Глубина очереди и задержка (от постановки в очередь до начала обработки) по каждой очереди.
+        """
+        with self._lock:
+            shards = [dict(stats) for stats in self._stats]
+        for index, stats in enumerate(shards):
+            stats['shard'] = index
+            stats['depth'] = self._queues[index].qsize()
+            stats['avg_lag_ms'] = stats['total_lag_ms'] / stats['processed'] if stats['processed'] else 0.0
+        return shards
@@ -0,0 +1,145 @@
+from collections import Counter, defaultdict
+from fuzzywuzzy import fuzz
+
+
+class FuzzyNameIndex:
+    """
+    Индекс имён для нечёткого поиска по порогу fuzz.ratio.
+
+    fuzz.ratio равен round(100·2·M/T), где M не больше длины наибольшей общей
+    подпоследовательности строк, а T — их суммарная длина. Поэтому для схожести
+    выше lower длины строк должны быть близки, а расстояние в операциях
+    вставки/удаления — не больше d = T·(1 - r), где r = (lower + 0.5) / 100.
+
+    Каждое имя делится на m непересекающихся сегментов. Каждая операция портит
+    не больше одного сегмента, значит у подходящего имени не меньше m - d сегментов
+    остаются нетронутыми и встречаются в запросе со сдвигом не больше d.
+    fuzz.ratio считается только для имён, набравших столько совпавших сегментов,
+    поэтому результат совпадает с полным перебором.
+    """
+
+    # Сегментов на одну допустимую операцию: чем больше, тем строже фильтр
+    SEGMENTS_PER_EDIT = 2
+
+    def __init__(self, names=(), lower=90, upper=100):
+        self.lower = lower
+        self.upper = upper
+        # round(100·r) > lower возможно только при r >= (lower + 0.5) / 100
+        self.min_ratio = (lower + 0.5) / 100 - 1e-9
+        self._names = []
+        self._positions = {}
+        self._keys = []
+        self._segments = defaultdict(set)
+        self._by_length = defaultdict(set)
+        self._partitions = {}
+        for name in names:
+            self.add(name)
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __contains__(self, name):
+        return name in self._positions
+
+    def _partition(self, length):
+        """
+        Делит строку длины length на сегменты одинаковой (±1) длины.
+
+        :return: Список пар (начало, длина)
+        """
+        bounds = self._partitions.get(length)
+        if bounds is None:
+            # Самый длинный допустимый запрос для имени длины l — l·(2 - r)/r, отсюда T <= 2·l/r
+            max_distance = int(2 * length * (1 - self.min_ratio) / self.min_ratio)
+            count = min(length, self.SEGMENTS_PER_EDIT * (max_distance + 1))
+            bounds = []
+            if count:
+                short_length, long_count = divmod(length, count)
+                start = 0
+                for index in range(count):
+                    size = short_length + (1 if index >= count - long_count else 0)
+                    bounds.append((start, size))
+                    start += size
+            self._partitions[length] = bounds
+        return bounds
+
+    def add(self, name):
+        if name in self._positions:
+            return
+        position = len(self._names)
+        length = len(name)
+        self._names.append(name)
+        self._positions[name] = position
+        self._by_length[length].add(position)
+        keys = []
+        for index, (start, size) in enumerate(self._partition(length)):
+            key = (length, index, name[start:start + size])
+            self._segments[key].add(position)
+            keys.append(key)
+        self._keys.append(keys)
+
+    def remove(self, name):
+        position = self._positions.pop(name, None)
+        if position is None:
+            return
+        self._by_length[len(name)].discard(position)
+        for key in self._keys[position]:
+            positions = self._segments[key]
+            positions.discard(position)
+            if not positions:
+                del self._segments[key]
+        self._names[position] = None
+        self._keys[position] = None
+
+    def candidates(self, query):
+        """
+        Возвращает позиции имён, схожесть которых с query может превышать lower.
+
+        :return: Отсортированный по порядку добавления список позиций
+        """
+        query_length = len(query)
+        if self.min_ratio <= 0:
+            return sorted(self._positions.values())
+        # 2·min(L, l) / (L + l) >= r
+        min_length = self.min_ratio * query_length / (2 - self.min_ratio)
+        max_length = query_length * (2 - self.min_ratio) / self.min_ratio
+
+        result = []
+        for length, positions in self._by_length.items():
+            if not positions or length < min_length or length > max_length:
+                continue
+            distance = int((query_length + length) * (1 - self.min_ratio))
+            bounds = self._partition(length)
+            required = len(bounds) - distance
+            if required <= 0:
+                result.extend(positions)
+                continue
+            hits = Counter()
+            for index, (start, size) in enumerate(bounds):
+                # Нетронутый сегмент сдвигается не больше чем на distance позиций
+                first = max(0, start - distance)
+                last = min(query_length - size, start + distance)
+                for query_start in range(first, last + 1):
+                    found = self._segments.get((length, index, query[query_start:query_start + size]))
+                    if found:
+                        # Повторная находка того же сегмента лишь ослабляет фильтр, но не теряет кандидатов
+                        hits.update(found)
+            result.extend(position for position, count in hits.items() if count >= required)
+        result.sort()
+        return result
+
+    def matches(self, query, query_first=True):
+        """
+        Ищет имена, схожесть которых с query строго между lower и upper.
+
+        :param query: Строка запроса
+        :param query_first: Передавать query первым аргументом fuzz.ratio (иначе — вторым)
+        :return: Список пар (имя, схожесть) в порядке добавления имён
+        """
+        matches = []
+        for position in self.candidates(query):
+            name = self._names[position]
+            similarity = fuzz.ratio(query, name) if query_first else fuzz.ratio(name, query)
+            if self.lower < similarity < self.upper:
+                matches.append((name, similarity))
+        return matches
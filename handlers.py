@@ -1,53 +1,184 @@
+import io
 import telebot
 from telebot import types
-from datetime import datetime
-import pytz
+from telebot.storage import StateMemoryStorage
 
 from logger import logger
-from data_matcher import DataMatcher
+from reconciliation import submit_reconciliation
 
 from config import (
     API_TOKEN,
-    TEXTS,
     VALID_PAYMENTS_FILE,
-    MENUS,
     TARGET_USER_ID,
-    JSON_FILE_PATH,
-    GOOGLE_CREDENTIALS_PATH,
-    GOOGLE_SHEET_ID,
-    GOOGLE_SHEET_NAME
+    MEDIA_CACHE_WARMUP_CHAT_ID,
+    BOT_MODE,
+    UPDATE_SHARDS,
+    UPDATE_SHARD_QUEUE_SIZE,
+    WEBHOOK_WORKERS,
+    STATE_STORAGE_BACKEND,
+    REPORT_DOCUMENT_THRESHOLD,
+    REPORT_DOCUMENT_FORMAT
 )
 from models import User
-from storage import load_users, save_users, load_valid_list, save_valid_list
-
+from storage import load_users
+from payments import PaymentIndex
+from media_cache import MediaCache
+from menus import MENU_PLANS, PHOTO_EXTENSIONS, validate_menus
+from dispatcher import ShardedDispatcher
+from outbound import OutboundQueue
+from broadcast import Broadcast
+from state_storage import SQLiteStateStorage
+from metrics import format_summary, instrument_telegram_requests, timed, track_handler
+from report import REPORT_CALLBACK_PREFIX, ReportPages, paginate, parse_page_callback, write_document
+
+import admin
+import registration
 from states import TicketPurchaseStates
 
-# Инициализация бота
-bot = telebot.TeleBot(API_TOKEN)
+# Состояния регистрации хранятся на диске, брошенные шаги со временем удаляются
+if STATE_STORAGE_BACKEND == 'sqlite':
+    state_storage = SQLiteStateStorage()
+    state_storage.start_evictor()
+else:
+    state_storage = StateMemoryStorage()
+
+# Время запросов к Bot API попадает в метрики и в долю Telegram у обработчиков
+instrument_telegram_requests()
+
+# Инициализация бота; с диспетчером обработчики выполняются в потоках его очередей
+# Вебхук всегда работает через диспетчер: иначе telebot выполняет обработчики в своём пуле,
+# и ни число одновременных обработчиков, ни порядок обновлений пользователя не ограничены
+update_shards = UPDATE_SHARDS or (WEBHOOK_WORKERS if BOT_MODE == 'webhook' else 0)
+bot = telebot.TeleBot(API_TOKEN, threaded=not update_shards, state_storage=state_storage)
+dispatcher = ShardedDispatcher.install(bot, update_shards, UPDATE_SHARD_QUEUE_SIZE) if update_shards else None
+
+# Все исходящие сообщения проходят через очередь с ограничением скорости
+outbound = OutboundQueue(bot)
+outbound.start()
+# Рассылки администраторов идут через ту же очередь с низким приоритетом
+broadcaster = Broadcast(outbound)
 
 # Загрузка пользователей из файла
 users = load_users()
+# Индекс подтверждённых оплат держится в памяти и сам следит за изменениями файла
+payment_index = PaymentIndex()
+payment_index.start_watcher()
+# file_id файлов меню: повторные показы не загружают файлы заново
+media_cache = MediaCache()
+# Страницы последних отчётов сверки для кнопок перелистывания
+report_pages = ReportPages()
 logger.info("Бот успешно инициализирован и пользователи загружены.")
 
 def create_keyboard(menu_name):
     """
     Создаёт клавиатуру на основе конфигурации меню.
 
+    Нужна только когда клавиатуру меню требуется дополнить; для обычной отправки
+    send_menu использует заранее сериализованную клавиатуру из MENU_PLANS.
+
     :param menu_name: Название меню из конфигурации MENUS
     :return: Объект InlineKeyboardMarkup
     """
     keyboard = types.InlineKeyboardMarkup()
-    buttons = MENUS.get(menu_name, {}).get('buttons', [])
-    for button in buttons:
-        btn = types.InlineKeyboardButton(
-            text=button['text'],
-            callback_data=button['callback_data']
-        )
-        keyboard.add(btn)
-    logger.debug(f"Клавиатура для меню '{menu_name}' создана.")
+    plan = MENU_PLANS.get(menu_name)
+    for text, callback_data in (plan.buttons if plan else ()):
+        keyboard.add(types.InlineKeyboardButton(text=text, callback_data=callback_data))
+    logger.debug("Клавиатура для меню '%s' создана.", menu_name)
     return keyboard
 
 
+def send_photo_group(user_id, photos, use_cache=True):
+    """
+    Отправляет фотографии одной группой, по file_id для уже загруженных файлов.
+    Вызывается из очереди отправки, которая и повторяет её после ответа 429.
+
+    :param user_id: Идентификатор пользователя
+    :param photos: Пути к фотографиям
+    :param use_cache: Использовать сохранённые file_id
+    """
+    media_group = []
+    sent = []
+    uploads = []
+    for photo in photos:
+        try:
+            file_id = media_cache.get(photo) if use_cache else None
+            if file_id:
+                media_group.append(types.InputMediaPhoto(file_id))
+                uploads.append(None)
+            else:
+                with open(photo, 'rb') as f:
+                    media_group.append(types.InputMediaPhoto(f.read()))
+                uploads.append(photo)
+            sent.append(photo)
+            logger.debug("Фотография '%s' добавлена в группу медиа.", photo)
+        except FileNotFoundError:
+            logger.error(f"Файл {photo} не найден.")
+    if not media_group:
+        return
+
+    try:
+        messages = bot.send_media_group(user_id, media=media_group)
+    except telebot.apihelper.ApiTelegramException as e:
+        cached = [photo for photo, upload in zip(sent, uploads) if upload is None]
+        # 429 и прочие ошибки не связаны с file_id — их обрабатывает очередь отправки
+        if not cached or e.error_code != 400:
+            raise
+        # file_id мог стать недействительным — сбрасываем его и загружаем файлы заново
+        logger.warning(f"Не удалось отправить фотографии по file_id пользователю {user_id}: {e}")
+        media_cache.invalidate(cached)
+        send_photo_group(user_id, photos, use_cache=False)
+        return
+    media_cache.remember(uploads, messages)
+    logger.info(f"Группа фотографий отправлена пользователю {user_id}.")
+
+
+def send_cached_document(user_id, doc):
+    """
+    Отправляет документ по file_id, а при первой отправке загружает файл и запоминает его file_id.
+    Вызывается из очереди отправки.
+
+    :param user_id: Идентификатор пользователя
+    :param doc: Путь к документу
+    """
+    file_id = media_cache.get(doc)
+    if file_id:
+        try:
+            bot.send_document(user_id, file_id)
+            return
+        except telebot.apihelper.ApiTelegramException as e:
+            if e.error_code != 400:
+                raise
+            logger.warning(f"Не удалось отправить документ '{doc}' по file_id пользователю {user_id}: {e}")
+            media_cache.invalidate([doc])
+    with open(doc, 'rb') as f:
+        message = bot.send_document(user_id, f)
+    media_cache.remember([doc], [message])
+
+
+def warm_media_cache():
+    """
+    Хэширует файлы всех меню и, если задан MEDIA_CACHE_WARMUP_CHAT_ID,
+    заранее загружает в Telegram те, для которых ещё нет file_id.
+    """
+    media_files = [media_file for plan in MENU_PLANS.values() for media_file in plan.photos + plan.documents]
+    missing = media_cache.warm(media_files)
+    if not missing or MEDIA_CACHE_WARMUP_CHAT_ID is None:
+        return
+    for media_file in missing:
+        try:
+            with open(media_file, 'rb') as f:
+                if media_file.lower().endswith(PHOTO_EXTENSIONS):
+                    message = bot.send_photo(MEDIA_CACHE_WARMUP_CHAT_ID, f, disable_notification=True)
+                else:
+                    message = bot.send_document(MEDIA_CACHE_WARMUP_CHAT_ID, f, disable_notification=True)
+            media_cache.remember([media_file], [message])
+            bot.delete_message(MEDIA_CACHE_WARMUP_CHAT_ID, message.message_id)
+        except Exception as e:
+            logger.error(f"Ошибка при предварительной загрузке файла '{media_file}': {e}")
+    logger.info(f"Предварительно загружено файлов меню: {len(missing)}.")
+
+
+@timed('send_menu')
 def send_menu(user_id, menu_name, user_data=None, custom_keyboard=None):
     """
     Отправляет меню пользователю с указанным именем меню.
@@ -57,115 +188,172 @@ def send_menu(user_id, menu_name, user_data=None, custom_keyboard=None):
     :param user_data: Дополнительные данные для форматирования текста
     :param custom_keyboard: Пользовательская клавиатура (если есть)
     """
-    menu = MENUS.get(menu_name)
-    if not menu:
+    plan = MENU_PLANS.get(menu_name)
+    if not plan:
         logger.error(f"Меню '{menu_name}' не найдено в конфигурации.")
         return
 
-    # Создаём клавиатуру
-    keyboard = create_keyboard(menu_name)
-
     # Если передана пользовательская клавиатура, используем её вместо стандартной
+    keyboard = plan.keyboard
     if custom_keyboard:
         keyboard = custom_keyboard
-        logger.debug(f"Использована пользовательская клавиатура для меню '{menu_name}'.")
-
-    # Определяем тип медиа-файлов
-    media_photos = []
-    media_documents = []
-    for media_file in menu['media']:
-        if media_file.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp')):
-            media_photos.append(media_file)
-        elif media_file.lower().endswith(('.pdf', '.docx', '.txt')):
-            media_documents.append(media_file)
-        else:
-            logger.warning(f"Неизвестный тип файла: {media_file}")
-
-    # Отправляем фотографии, если они есть
-    if media_photos:
-        media_group = []
-        for photo in media_photos:
-            try:
-                with open(photo, 'rb') as f:
-                    media_group.append(types.InputMediaPhoto(f.read()))
-                logger.debug(f"Фотография '{photo}' добавлена в группу медиа.")
-            except FileNotFoundError:
-                logger.error(f"Файл {photo} не найден.")
-        if media_group:
-            try:
-                bot.send_media_group(user_id, media=media_group)
-                logger.info(f"Группа фотографий отправлена пользователю {user_id}.")
-            except Exception as e:
-                logger.error(f"Ошибка при отправке медиа-группы пользователю {user_id}: {e}")
-
-    # Отправляем документы, если они есть
-    for doc in media_documents:
-        try:
-            with open(doc, 'rb') as f:
-                bot.send_document(user_id, f)
-            logger.info(f"Документ '{doc}' отправлен пользователю {user_id}.")
-        except FileNotFoundError:
-            logger.error(f"Документ {doc} не найден.")
-        except Exception as e:
-            logger.error(f"Ошибка при отправке документа '{doc}' пользователю {user_id}: {e}")
+        logger.debug("Использована пользовательская клавиатура для меню '%s'.", menu_name)
+
+    # Отправки ставятся в очередь чата и уходят в том же порядке: фотографии, документы, текст
+    if plan.photos:
+        outbound.submit(user_id, send_photo_group, user_id, plan.photos, cost=len(plan.photos),
+                        description=f"медиа-группы меню '{menu_name}'")
+
+    for doc in plan.documents:
+        outbound.submit(user_id, send_cached_document, user_id, doc, description=f"документа '{doc}'")
 
     # Форматируем текст, если предоставлены данные
-    text = menu['text'].format(**user_data) if user_data else menu['text']
+    text = plan.text.format(**user_data) if user_data else plan.text
 
     # Отправляем сообщение с клавиатурой
+    outbound.send_message(user_id, text, reply_markup=keyboard, parse_mode='HTML',
+                          description=f"сообщения меню '{menu_name}'")
+    logger.debug("Меню '%s' поставлено в очередь отправки пользователю %s.", menu_name, user_id)
+
+
+def apply_reply(user_id, reply, call=None, custom_keyboard=None):
+    """
+    Выполняет ответ шага регистрации: закрывает callback, меняет состояние и отправляет сообщения.
+
+    :param user_id: Идентификатор пользователя
+    :param reply: registration.Reply
+    :param call: CallbackQuery, если шаг вызван кнопкой
+    :param custom_keyboard: Клавиатура вместо стандартной клавиатуры меню
+    """
+    if call is not None:
+        bot.answer_callback_query(call.id, reply.alert)
+    elif reply.alert:
+        outbound.send_message(user_id, reply.alert)
+
     try:
-        bot.send_message(user_id, text, reply_markup=keyboard, parse_mode='HTML')
-        logger.debug(f"Отправлено меню '{menu_name}' пользователю {user_id}.")
+        if reply.delete_state:
+            bot.delete_state(user_id)
+        elif reply.state is not None:
+            bot.set_state(user_id, reply.state)
     except Exception as e:
-        logger.error(f"Ошибка при отправке сообщения меню '{menu_name}' пользователю {user_id}: {e}")
+        logger.error(f"Ошибка при смене состояния пользователя {user_id}: {e}")
+
+    if reply.text:
+        outbound.send_message(user_id, reply.text, parse_mode=reply.parse_mode)
+    if reply.menu:
+        send_menu(user_id, reply.menu, reply.user_data, custom_keyboard)
+
 
+def send_report_file(chat_id, path, caption):
+    # Файл открывается на каждую попытку: при повторе после 429 он читается с начала
+    with open(path, 'rb') as document:
+        return bot.send_document(chat_id, types.InputFile(document, file_name=f"сверка{path.suffix}"), caption=caption)
 
-def send_result(user_id):
+
+def send_report_document(user_id, report):
     """
-    Отправляет результат автосверки пользователю.
+    Построчно выгружает отчёт во временный файл и отправляет его документом.
 
     :param user_id: Идентификатор пользователя
-    :return: Результат сверки данных
+    :param report: ReconciliationReport
     """
-    matcher = DataMatcher(
-        json_file_path=str(JSON_FILE_PATH),
-        credentials_path=str(GOOGLE_CREDENTIALS_PATH),
-        sheet_id=GOOGLE_SHEET_ID,
-        sheet_name=GOOGLE_SHEET_NAME
+    path = write_document(report, REPORT_DOCUMENT_FORMAT)
+    future = outbound.submit(
+        user_id, send_report_file, user_id, path, "Схожести: отчёт слишком большой для сообщений",
+        description='документа с результатом сверки'
+    )
+    # Файл удаляется после отправки или окончательной ошибки
+    future.add_done_callback(lambda _: path.unlink(missing_ok=True))
+
+
+def send_result(user_id, future):
+    """
+    Отправляет результат фоновой сверки пользователю, когда она завершится.
+
+    Отчёт до REPORT_DOCUMENT_THRESHOLD символов отправляется страницами с кнопками
+    перелистывания, больший — документом.
+
+    :param user_id: Идентификатор пользователя
+    :param future: Future с ReconciliationReport
+    """
+    try:
+        report = future.result()
+    except Exception as e:
+        logger.error(f"Ошибка при выполнении сверки для пользователя {user_id}: {e}")
+        try:
+            outbound.send_message(user_id, "Не удалось провести сверку. Попробуйте позже.")
+        except Exception as send_error:
+            logger.error(f"Ошибка при отправке сообщения об ошибке сверки пользователю {user_id}: {send_error}")
+        return
+
+    logger.debug("Результат сверки для пользователя %s: %s", user_id, report)
+    if report.is_empty:
+        outbound.send_message(user_id, '<b>Схожести:</b>\nВсе данные совпадают идеально!', parse_mode='HTML',
+                              description='результата сверки')
+    elif report.text_length() > REPORT_DOCUMENT_THRESHOLD:
+        try:
+            send_report_document(user_id, report)
+        except Exception as e:
+            logger.error(f"Ошибка при выгрузке отчёта сверки в файл для пользователя {user_id}: {e}")
+            outbound.send_message(user_id, "Не удалось подготовить файл с отчётом. Попробуйте позже.")
+            return
+    else:
+        report_id = report_pages.add(paginate(report.sections()))
+        text, keyboard = report_pages.render(report_id, 0)
+        outbound.send_message(user_id, text, parse_mode='HTML', reply_markup=keyboard,
+                              description='результата сверки')
+    logger.info(f"Результат сверки поставлен в очередь отправки пользователю {user_id}.")
+
+
+def handle_report_page(call):
+    """
+    Обработчик кнопок перелистывания отчёта сверки.
+
+    :param call: Объект CallbackQuery
+    """
+    if call.from_user.id not in TARGET_USER_ID:
+        bot.answer_callback_query(call.id, "Недоступно.")
+        return
+    parsed = parse_page_callback(call.data)
+    if parsed is None:
+        bot.answer_callback_query(call.id, "Неизвестная команда.")
+        return
+    report_id, index = parsed
+    if index is None:
+        # Кнопка с номером страницы ничего не меняет
+        bot.answer_callback_query(call.id)
+        return
+    page = report_pages.render(report_id, index)
+    if page is None:
+        bot.answer_callback_query(call.id, "Отчёт устарел, проведите сверку заново.")
+        return
+    bot.answer_callback_query(call.id)
+    text, keyboard = page
+    chat_id = call.message.chat.id
+    outbound.submit(
+        chat_id, bot.edit_message_text, text, chat_id, call.message.message_id,
+        parse_mode='HTML', reply_markup=keyboard, description=f"страницы {index + 1} отчёта {report_id}"
     )
-    result = matcher.run()
-    if not result:
-        result = "Нет данных для сверки."
-    logger.debug(f"Результат сверки для пользователя {user_id}: {result}")
-    return result
 
 
 def handle_send_result(call):
     """
     Обработчик кнопки 'Провести сверку'.
 
+    Сверка выполняется в фоне, callback закрывается сразу.
+
     :param call: Объект CallbackQuery
     """
     user_id = call.from_user.id
-    logger.debug(f"Пользователь {user_id} инициировал сверку данных.")
+    logger.debug("Пользователь %s инициировал сверку данных.", user_id)
 
-    # Выполняем сверку данных
-    result = send_result(user_id)
+    future = submit_reconciliation()
 
-    # Отправляем результат пользователю
-    try:
-        bot.send_message(
-            user_id,
-            f'<b>Схожести:</b>\n{result}',
-            parse_mode='HTML'
-        )
-        logger.info(f"Результат сверки отправлен пользователю {user_id}.")
-    except Exception as e:
-        logger.error(f"Ошибка при отправке результата сверки пользователю {user_id}: {e}")
+    # Закрываем callback, не дожидаясь окончания сверки
+    bot.answer_callback_query(call.id, "Сверка запущена…")
+    logger.debug("Callback для сверки данных пользователя %s закрыт.", user_id)
 
-    # Закрываем callback
-    bot.answer_callback_query(call.id)
-    logger.debug(f"Callback для сверки данных пользователя {user_id} закрыт.")
+    future.add_done_callback(lambda f: send_result(user_id, f))
 
 
 def buy_ticket(call):
@@ -175,30 +363,11 @@ def buy_ticket(call):
     :param call: Объект CallbackQuery
     """
     user_id = call.from_user.id
-    user = users.get(user_id)
-    logger.debug(f"Пользователь {user_id} инициировал покупку билета.")
-
-    if not user:
-        logger.warning(f"Пользователь {user_id} не найден при попытке купить билет.")
-        bot.answer_callback_query(call.id, "Произошла ошибка. Попробуйте заново /start")
-        return
-
-    # Отправляем инструкции по оплате
-    try:
-        bot.send_message(user_id, TEXTS['payment_instructions'], parse_mode="Markdown")
-        logger.info(f"Отправлены инструкции по оплате пользователю {user_id}.")
-    except Exception as e:
-        logger.error(f"Ошибка при отправке инструкций по оплате пользователю {user_id}: {e}")
-
-    # Переходим к состоянию ожидания ввода ФИО
-    try:
-        bot.set_state(user_id, TicketPurchaseStates.waiting_for_name, call.message.chat.id)
-        logger.debug(f"Пользователь {user_id} переведен в состояние ожидания имени.")
-    except Exception as e:
-        logger.error(f"Ошибка при установке состояния ожидания имени для пользователя {user_id}: {e}")
+    apply_reply(user_id, registration.buy_ticket(user_id, users.get(user_id)), call)
 
 
 @bot.message_handler(state=TicketPurchaseStates.waiting_for_university)
+@track_handler('state:waiting_for_university')
 def process_university(message):
     """
     Обработчик ввода ВУЗа пользователя.
@@ -206,35 +375,7 @@ def process_university(message):
     :param message: Объект Message
     """
     user_id = message.from_user.id
-    user = users.get(user_id)
-    university_input = message.text.strip()
-    logger.debug(f"Пользователь {user_id} отправил название ВУЗа: '{university_input}'.")
-
-    if not user:
-        logger.warning(f"Пользователь {user_id} не найден при обработке ВУза.")
-        bot.send_message(user_id, "Произошла ошибка. Попробуйте заново /start")
-        bot.delete_state(user_id)
-        return
-
-    if not university_input:
-        logger.info(f"Пользователь {user_id} отправил пустое название ВУЗа.")
-        bot.send_message(user_id, "Пожалуйста, введите корректное название ВУЗа.")
-        return
-
-    user.university = university_input
-    save_users(users)
-    logger.info(f"Пользователь {user_id} установил ВУЗ: {university_input}.")
-
-    # Переходим к следующему состоянию
-    try:
-        bot.set_state(user_id, TicketPurchaseStates.waiting_for_faculty)
-        logger.debug(f"Пользователь {user_id} переведен в состояние ожидания факультета.")
-    except Exception as e:
-        logger.error(f"Ошибка при установке состояния ожидания факультета для пользователя {user_id}: {e}")
-
-    # Отправляем меню выбора факультета
-    send_menu(user_id, 'faculty_menu')
-    logger.debug(f"Отправлена клавиатура факультетов пользователю {user_id}.")
+    apply_reply(user_id, registration.enter_university(user_id, users.get(user_id), message.text))
 
 
 def handle_faculty_selection(call):
@@ -244,51 +385,7 @@ def handle_faculty_selection(call):
     :param call: Объект CallbackQuery
     """
     user_id = call.from_user.id
-    user = users.get(user_id)
-    logger.debug(f"Пользователь {user_id} выбрал факультет: {call.data}.")
-
-    if not user:
-        logger.warning(f"Пользователь {user_id} не найден при выборе факультета.")
-        bot.answer_callback_query(call.id, "Произошла ошибка. Попробуйте заново /start")
-        bot.delete_state(user_id)
-        return
-
-    # Извлекаем ключ факультета из callback_data
-    try:
-        faculty_key = call.data.split('faculty_')[1]
-    except IndexError:
-        logger.error(f"Некорректный формат callback_data: {call.data}")
-        bot.answer_callback_query(call.id, "Некорректный выбор факультета.")
-        return
-
-    # Определяем название факультета
-    faculties = {
-        'social_studies': 'Социальные науки',
-        'computer_studies': 'Компьютерные науки',
-        'human_studies': 'Гуманитарные науки',
-        'natural_studies': 'Естественные науки',
-        'physical_studies': 'Физические науки',
-        'another_studies': 'Другое/не учусь в вузе'
-    }
-
-    faculty = faculties.get(faculty_key)
-    if faculty:
-        user.faculty = faculty
-        save_users(users)
-        logger.info(f"Пользователь {user_id} установил факультет: {faculty}.")
-
-        # Переходим к следующему состоянию
-        try:
-            bot.set_state(user_id, TicketPurchaseStates.waiting_for_info_source)
-            logger.debug(f"Пользователь {user_id} переведен в состояние ожидания источника информации.")
-        except Exception as e:
-            logger.error(f"Ошибка при установке состояния ожидания источника информации для пользователя {user_id}: {e}")
-
-        # Отправляем меню выбора источника информации
-        send_menu(user_id, 'info_source_menu')
-    else:
-        logger.error(f"Неизвестный факультет выбран пользователем {user_id}: {faculty_key}")
-        bot.answer_callback_query(call.id, "Неизвестный факультет.")
+    apply_reply(user_id, registration.choose_faculty(user_id, users.get(user_id), call.data), call)
 
 
 def handle_event_info(call):
@@ -299,7 +396,7 @@ def handle_event_info(call):
     """
     user_id = call.from_user.id
     send_menu(user_id, 'event_info_menu')
-    logger.debug(f"Отправлено меню информации о мероприятии пользователю {user_id}.")
+    logger.debug("Отправлено меню информации о мероприятии пользователю %s.", user_id)
 
 
 def handle_event_venue(call):
@@ -310,7 +407,7 @@ def handle_event_venue(call):
     """
     user_id = call.from_user.id
     send_menu(user_id, 'menu_osninfo')
-    logger.debug(f"Отправлено меню места проведения пользователю {user_id}.")
+    logger.debug("Отправлено меню места проведения пользователю %s.", user_id)
 
 
 def handle_event_schedule(call):
@@ -321,7 +418,7 @@ def handle_event_schedule(call):
     """
     user_id = call.from_user.id
     send_menu(user_id, 'menu_pravila')
-    logger.debug(f"Отправлено меню расписания мероприятия пользователю {user_id}.")
+    logger.debug("Отправлено меню расписания мероприятия пользователю %s.", user_id)
 
 
 def handle_event_map(call):
@@ -332,7 +429,7 @@ def handle_event_map(call):
     """
     user_id = call.from_user.id
     send_menu(user_id, 'menu_bar')
-    logger.debug(f"Отправлено меню карты местности пользователю {user_id}.")
+    logger.debug("Отправлено меню карты местности пользователю %s.", user_id)
 
 
 def handle_loft_menu(call):
@@ -343,7 +440,7 @@ def handle_loft_menu(call):
     """
     user_id = call.from_user.id
     send_menu(user_id, 'menu_loft')
-    logger.debug(f"Отправлено меню плана лофта пользователю {user_id}.")
+    logger.debug("Отправлено меню плана лофта пользователю %s.", user_id)
 
 
 def handle_main_menu(call):
@@ -353,23 +450,7 @@ def handle_main_menu(call):
     :param call: Объект CallbackQuery
     """
     user_id = call.from_user.id
-    user = users.get(user_id)
-
-    if not user:
-        logger.warning(f"Пользователь {user_id} не найден при возврате в главное меню.")
-        bot.answer_callback_query(call.id, "Произошла ошибка. Попробуйте заново /start")
-        return
-
-    if user.is_registered:
-        menu_name = 'main_menu_registered'
-        user_data = {'first_name': user.first_name}
-    else:
-        menu_name = 'main_menu_new'
-        user_data = {'first_name': user.first_name}
-
-    # Отправляем главное меню
-    send_menu(user_id, menu_name, user_data=user_data)
-    logger.info(f"Пользователь {user_id} вернулся в главное меню.")
+    apply_reply(user_id, registration.main_menu(user_id, users.get(user_id)), call)
 
 
 def handle_info_source_selection(call):
@@ -379,56 +460,7 @@ def handle_info_source_selection(call):
     :param call: Объект CallbackQuery
     """
     user_id = call.from_user.id
-    user = users.get(user_id)
-    logger.debug(f"Пользователь {user_id} выбрал источник информации: {call.data}.")
-
-    if not user:
-        logger.warning(f"Пользователь {user_id} не найден при выборе источника информации.")
-        bot.answer_callback_query(call.id, "Произошла ошибка. Попробуйте заново /start")
-        bot.delete_state(user_id)
-        return
-
-    # Извлекаем ключ источника информации из callback_data
-    try:
-        source_key = call.data.split('info_source_')[1]
-    except IndexError:
-        logger.error(f"Некорректный формат callback_data: {call.data}")
-        bot.answer_callback_query(call.id, "Некорректный выбор источника информации.")
-        return
-
-    # Определяем название источника информации
-    sources = {
-        'friends': 'От друзей',
-        'odnogroup': 'От одногруппников/однокурсников',
-        'social': 'Из соцсетей',
-        'posvat': 'Пришел/а с посвята',
-        'another': 'Другое'
-    }
-
-    source = sources.get(source_key)
-    if source:
-        user.info_source = source
-        save_users(users)
-        logger.info(f"Пользователь {user_id} установил источник информации: {source}.")
-
-        # Переходим к следующему состоянию
-        try:
-            bot.set_state(user_id, TicketPurchaseStates.waiting_for_confirmation)
-            logger.debug(f"Пользователь {user_id} переведен в состояние ожидания подтверждения.")
-        except Exception as e:
-            logger.error(f"Ошибка при установке состояния ожидания подтверждения для пользователя {user_id}: {e}")
-
-        # Отправляем подтверждение данных
-        user_data = {
-            'name': user.name,
-            'university': user.university,
-            'faculty': user.faculty,
-            'info_source': user.info_source
-        }
-        send_menu(user_id, 'confirmation_menu', user_data)
-    else:
-        logger.error(f"Неизвестный источник информации выбран пользователем {user_id}: {source_key}")
-        bot.answer_callback_query(call.id, "Неизвестный источник информации.")
+    apply_reply(user_id, registration.choose_info_source(user_id, users.get(user_id), call.data), call)
 
 
 def handle_confirmation(call):
@@ -438,48 +470,11 @@ def handle_confirmation(call):
     :param call: Объект CallbackQuery
     """
     user_id = call.from_user.id
-    user = users.get(user_id)
-    logger.debug(f"Пользователь {user_id} отправил подтверждение: {call.data}.")
-
-    if not user:
-        logger.warning(f"Пользователь {user_id} не найден при подтверждении данных.")
-        bot.answer_callback_query(call.id, "Произошла ошибка. Попробуйте заново /start")
-        bot.delete_state(user_id)
-        return
-
-    if call.data == 'confirm_yes':
-        user.is_registered = True
-        save_users(users)
-        logger.info(f"Пользователь {user_id} подтвердил данные и зарегистрировался.")
-
-        bot.answer_callback_query(call.id)
-        
-        # Отправляем меню успешной регистрации
-        send_menu(user_id, 'main_menu_registered')
-        logger.debug(f"Отправлено подтверждение регистрации пользователю {user_id}.")
-
-        # Удаляем состояние пользователя
-        try:
-            bot.delete_state(user_id)
-            logger.debug(f"Состояние пользователя {user_id} удалено после подтверждения регистрации.")
-        except Exception as e:
-            logger.error(f"Ошибка при удалении состояния пользователя {user_id}: {e}")
-
-    elif call.data == 'confirm_no':
-        logger.info(f"Пользователь {user_id} отказался от подтверждения данных. Начинаем заново.")
-        bot.answer_callback_query(call.id)
-        try:
-            bot.send_message(user_id, TEXTS['enter_name_text'])
-            bot.set_state(user_id, TicketPurchaseStates.waiting_for_name)
-            logger.debug(f"Пользователь {user_id} переведен в состояние ожидания имени для повторной регистрации.")
-        except Exception as e:
-            logger.error(f"Ошибка при перенаправлении пользователя {user_id} на повторную регистрацию: {e}")
-    else:
-        logger.error(f"Неизвестная команда подтверждения от пользователя {user_id}: {call.data}")
-        bot.answer_callback_query(call.id, "Неизвестная команда.")
+    apply_reply(user_id, registration.confirm(user_id, users.get(user_id), call.data), call)
 
 
 @bot.message_handler(state=TicketPurchaseStates.waiting_for_name)
+@track_handler('state:waiting_for_name')
 def process_name(message):
     """
     Обработчик ввода имени пользователя.
@@ -487,41 +482,7 @@ def process_name(message):
     :param message: Объект Message
     """
     user_id = message.from_user.id
-    user = users.get(user_id)
-    name_input = message.text.strip()
-    logger.debug(f"Пользователь {user_id} начал обработку имени.")
-
-    if not user:
-        logger.warning(f"Пользователь {user_id} не найден при обработке имени.")
-        bot.send_message(user_id, "Произошла ошибка. Попробуйте заново /start")
-        bot.delete_state(user_id)
-        return
-
-    if not name_input:
-        logger.info(f"Пользователь {user_id} отправил пустое имя.")
-        bot.send_message(user_id, "Пожалуйста, введите корректное ФИО.")
-        return
-
-    user.name = name_input
-    save_users(users)
-    logger.info(f"Пользователь {user_id} установил ФИО: {name_input}.")
-
-    # Переходим к следующему состоянию
-    try:
-        bot.set_state(user_id, TicketPurchaseStates.waiting_for_university)
-        logger.debug(f"Пользователь {user_id} переведен в состояние ожидания ВУЗа.")
-    except Exception as e:
-        logger.error(f"Ошибка при установке состояния ожидания ВУЗа для пользователя {user_id}: {e}")
-
-    # Отправляем сообщение для ввода ВУЗа
-    try:
-        bot.send_message(
-            user_id,
-            "Напишите, из какого вы ВУЗа.\n\nЕсли вы не учитесь в ВУЗе, то напишите «Нигде»."
-        )
-        logger.debug(f"Отправлено сообщение для ввода ВУЗа пользователю {user_id}.")
-    except Exception as e:
-        logger.error(f"Ошибка при отправке сообщения для ввода ВУза пользователю {user_id}: {e}")
+    apply_reply(user_id, registration.enter_name(user_id, users.get(user_id), message.text))
 
 
 def handle_buy_ticket(call):
@@ -540,60 +501,17 @@ def handle_change_data(call):
     :param call: Объект CallbackQuery
     """
     user_id = call.from_user.id
-    user = users.get(user_id)
-
-    if not user:
-        logger.warning(f"Пользователь {user_id} не найден при попытке изменить данные.")
-        bot.answer_callback_query(call.id, "Произошла ошибка. Попробуйте заново /start")
-        return
+    apply_reply(user_id, registration.change_data(user_id, users.get(user_id)), call)
 
-    # Сбрасываем данные пользователя
-    user.name = None
-    user.university = None
-    user.faculty = None
-    user.is_registered = False
-    save_users(users)
-    logger.info(f"Пользователь {user_id} сбросил свои данные для обновления.")
 
-    # Отправляем уведомление и переходим к состоянию ввода имени
-    try:
-        bot.answer_callback_query(call.id)
-        bot.send_message(user_id, "Давайте обновим ваши данные. Пожалуйста, напишите свое ФИО.")
-        bot.set_state(user_id, TicketPurchaseStates.waiting_for_name, call.message.chat.id)
-        logger.debug(f"Пользователь {user_id} переведен в состояние ожидания имени для обновления данных.")
-    except Exception as e:
-        logger.error(f"Ошибка при перенаправлении пользователя {user_id} на обновление данных: {e}")
-
-
-def check_oplata(message):
+def check_oplata(call):
     """
     Обработчик подтверждения оплаты.
 
-    :param message: Объект Message
+    :param call: Объект CallbackQuery
     """
-    user_id = str(message.from_user.id)
-    valid_list = load_valid_list()
-    logger.debug(f"Загружен список валидных оплат: {valid_list}.")
-
-    if user_id in valid_list:
-        valid_list[user_id] += 1
-        save_valid_list(valid_list)
-        logger.info(f"Пользователь {user_id} подтвердил оплату. Обновленный счетчик: {valid_list[user_id]}.")
-
-        try:
-            # Отправляем меню успешной оплаты
-            send_menu(message.from_user.id, 'payment_success_menu')
-            logger.debug(f"Отправлено меню успешной оплаты пользователю {user_id}.")
-        except Exception as e:
-            logger.error(f"Ошибка при отправке меню успешной оплаты пользователю {user_id}: {e}")
-    else:
-        logger.warning(f"Пользователь {user_id} не найден в списке валидных оплат.")
-        try:
-            # Отправляем меню ошибки оплаты
-            send_menu(message.from_user.id, 'payment_error_menu')
-            logger.debug(f"Отправлено меню ошибки оплаты пользователю {user_id}.")
-        except Exception as e:
-            logger.error(f"Ошибка при отправке меню ошибки оплаты пользователю {user_id}: {e}")
+    user_id = call.from_user.id
+    apply_reply(user_id, registration.payment_checked(user_id, payment_index.confirm(user_id)), call)
 
 
 # Словарь соответствия callback_data обработчикам
@@ -626,6 +544,9 @@ callback_handlers = {
     'check_payment': check_oplata
 }
 
+# Проверяем меню при запуске: кнопки без обработчиков, отсутствующие файлы и поля шаблонов
+validate_menus(MENU_PLANS, callback_handlers, User.__slots__)
+
 
 @bot.callback_query_handler(func=lambda call: True)
 def callback_query(call):
@@ -635,10 +556,15 @@ def callback_query(call):
     :param call: Объект CallbackQuery
     """
     handler = callback_handlers.get(call.data)
+    label = call.data
+    if handler is None and call.data.startswith(REPORT_CALLBACK_PREFIX):
+        # Номера отчёта и страницы не попадают в метку метрик
+        handler, label = handle_report_page, REPORT_CALLBACK_PREFIX.rstrip(':')
     if handler:
-        logger.debug(f"Вызван обработчик для callback_data: '{call.data}' от пользователя {call.from_user.id}.")
+        logger.debug("Вызван обработчик для callback_data: '%s' от пользователя %s.", call.data, call.from_user.id)
         try:
-            handler(call)
+            with track_handler(label, kind='callback_query'):
+                handler(call)
         except Exception as e:
             logger.error(f"Ошибка в обработчике '{call.data}' для пользователя {call.from_user.id}: {e}")
             bot.answer_callback_query(call.id, "Произошла ошибка при обработке запроса.")
@@ -648,6 +574,7 @@ def callback_query(call):
 
 
 @bot.message_handler(commands=['start'])
+@track_handler('command:start')
 def start(message):
     """
     Обработчик команды /start.
@@ -655,45 +582,99 @@ def start(message):
     :param message: Объект Message
     """
     user_id = message.from_user.id
-    username = message.from_user.username or str(user_id)
-    first_name = message.from_user.first_name
     logger.info(f"Пользователь {user_id} запустил команду /start.")
+    reply = registration.start(users, message.from_user)
 
-    # Проверяем, есть ли пользователь в базе
-    user = users.get(user_id)
-
-    if not user:
-        # Создаем нового пользователя
-        user = User(user_id, username, first_name)
-        # Устанавливаем дату регистрации
-        tz_moscow = pytz.timezone('Europe/Moscow')
-        user.registration_date = datetime.now(tz_moscow).isoformat()
-        users[user_id] = user
-        save_users(users)
-        logger.info(f"Создан новый пользователь {user_id} с именем {first_name}.")
-
-    # Выбираем соответствующий текст приветствия и меню
-    if user.is_registered:
-        menu_name = 'main_menu_registered'
-        user_data = {'first_name': user.first_name}
-    else:
-        menu_name = 'main_menu_new'
-        user_data = {'first_name': user.first_name}
-
-    keyboard = create_keyboard(menu_name)
-
+    keyboard = None
     # Если пользователь в TARGET_USER_ID, добавляем кнопку "Провести сверку"
     if user_id in TARGET_USER_ID:
-        try:
-            send_button = types.InlineKeyboardButton(
-                text='Провести сверку',
-                callback_data='send__result'
-            )
-            keyboard.add(send_button)
-            logger.debug(f"Добавлена кнопка 'Провести сверку' для пользователя {user_id}.")
-        except Exception as e:
-            logger.error(f"Ошибка при добавлении кнопки 'Провести сверку' для пользователя {user_id}: {e}")
+        keyboard = create_keyboard(reply.menu)
+        keyboard.add(types.InlineKeyboardButton(text='Провести сверку', callback_data='send__result'))
+
+    apply_reply(user_id, reply, custom_keyboard=keyboard)
+    logger.info(f"Отправлено приветственное сообщение пользователю {user_id}.")
+
+
+@bot.message_handler(commands=['shards'], func=lambda message: message.from_user.id in TARGET_USER_ID)
+@track_handler('command:shards')
+def shards_stats(message):
+    """
+    Показывает администратору глубину очередей диспетчера и задержку обработки.
+
+    :param message: Объект Message
+    """
+    outbound.send_message(message.chat.id, admin.shards_status(dispatcher))
+
+
+def send_broadcast_report(job, report):
+    """
+    Отправляет администратору итог рассылки.
+    """
+    outbound.send_message(job['admin_id'], admin.broadcast_finished(job, report))
+
+
+@bot.message_handler(commands=['broadcast'], func=lambda message: message.from_user.id in TARGET_USER_ID)
+@track_handler('command:broadcast')
+def start_broadcast(message):
+    """
+    Запускает рассылку (формат — admin.start_broadcast).
+
+    :param message: Объект Message
+    """
+    text = admin.start_broadcast(broadcaster, message.from_user.id, message.text, send_broadcast_report)
+    outbound.send_message(message.chat.id, text)
 
-    # Отправляем главное меню
-    send_menu(user_id, menu_name, user_data=user_data, custom_keyboard=keyboard)
-    logger.info(f"Отправлено приветственное сообщение пользователю {user_id}.")
\ No newline at end of file
+
+@bot.message_handler(commands=['broadcast_status'], func=lambda message: message.from_user.id in TARGET_USER_ID)
+@track_handler('command:broadcast_status')
+def broadcast_status(message):
+    """
+    Показывает ход текущей или последней рассылки.
+
+    :param message: Объект Message
+    """
+    outbound.send_message(message.chat.id, admin.broadcast_status(broadcaster))
+
+
+@bot.message_handler(commands=['metrics'], func=lambda message: message.from_user.id in TARGET_USER_ID)
+@track_handler('command:metrics')
+def metrics_summary(message):
+    """
+    Показывает администратору частоту обновлений и время обработчиков.
+
+    :param message: Объект Message
+    """
+    outbound.send_message(message.chat.id, format_summary())
+
+
+@bot.message_handler(commands=['profiles'], func=lambda message: message.from_user.id in TARGET_USER_ID)
+@track_handler('command:profiles')
+def profiles_list(message):
+    """
+    Список самых медленных профилей и управление профилированием (формат — admin.profiles).
+
+    :param message: Объект Message
+    """
+    outbound.send_message(message.chat.id, admin.profiles(message.from_user.id, message.text))
+
+
+def send_profile_document(chat_id, document):
+    # Новый InputFile на каждую попытку: при повторе после 429 поток читается заново
+    return bot.send_document(chat_id, types.InputFile(io.BytesIO(document.data), file_name=document.file_name),
+                             caption=document.caption)
+
+
+@bot.message_handler(commands=['profile'], func=lambda message: message.from_user.id in TARGET_USER_ID)
+@track_handler('command:profile')
+def profile_download(message):
+    """
+    Отправляет администратору профиль обновления файлом. Формат: /profile <номер> [pstats|collapsed].
+
+    :param message: Объект Message
+    """
+    text, document = admin.profile_document(message.text)
+    if document is None:
+        outbound.send_message(message.chat.id, text)
+        return
+    outbound.submit(message.chat.id, send_profile_document, message.chat.id, document,
+                    description=document.description)
@@ -1,6 +1,12 @@
 # logger.py
+import atexit
 import logging
 import logging.handlers
+import os
+import queue
+import random
+import threading
+import time
 from pathlib import Path
 
 # Путь к директории для хранения логов
@@ -10,12 +16,157 @@ LOG_DIR.mkdir(exist_ok=True)
 # Конфигурация логирования
 LOG_FILE = LOG_DIR / 'bot.log'
 
+
+def _env_number(name, default, cast=float):
+    value = os.environ.get(name)
+    if value is None or not value.strip():
+        return default
+    try:
+        return cast(value)
+    except ValueError:
+        return default
+
+
+# Настройки меняются переменными окружения, без правки кода:
+# уровень логгера (DEBUG, INFO, ...)
+LOG_LEVEL = os.environ.get('BOT_LOG_LEVEL', 'DEBUG').upper()
+# доля записей DEBUG, которые попадают в лог (0..1)
+LOG_DEBUG_SAMPLE_RATE = _env_number('BOT_LOG_DEBUG_SAMPLE_RATE', 1.0)
+# сколько записей одного места вызова пропускается за окно (0 — без ограничения); ERROR и выше не ограничиваются
+LOG_SITE_LIMIT = _env_number('BOT_LOG_SITE_LIMIT', 100, int)
+LOG_SITE_WINDOW = _env_number('BOT_LOG_SITE_WINDOW', 10.0)
+# максимальная длина текста записи (0 — без ограничения)
+LOG_MAX_MESSAGE_LENGTH = _env_number('BOT_LOG_MAX_MESSAGE_LENGTH', 4000, int)
+
+
+class LogThrottle:
+    """
+    Прореживает записи в периоды высокой нагрузки.
+
+    DEBUG-записи проходят с вероятностью sample_rate. Каждое место вызова
+    (файл и строка) пишет не больше site_limit записей за окно window секунд;
+    о подавленных записях позже сообщает одна сводная запись того же уровня.
+
+    :param sample_rate: Доля пропускаемых DEBUG-записей
+    :param site_limit: Лимит записей одного места вызова за окно (0 — без лимита)
+    :param window: Длина окна (сек)
+    """
+
+    def __init__(self, sample_rate=LOG_DEBUG_SAMPLE_RATE, site_limit=LOG_SITE_LIMIT, window=LOG_SITE_WINDOW):
+        self.sample_rate = sample_rate
+        self.site_limit = site_limit
+        self.window = window
+        self._lock = threading.Lock()
+        # (pathname, lineno) -> [начало окна, записей в окне, подавлено, уровень, имя логгера]
+        self._sites = {}
+        # Сводки окон, закрытых новой записью того же места вызова
+        self._pending = []
+        self._next_sweep = 0.0
+
+    def admit(self, record):
+        """
+        :return: True, если запись нужно записать
+        """
+        if record.levelno == logging.DEBUG and self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return False
+        if not self.site_limit or record.levelno >= logging.ERROR:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None:
+                site = self._sites[key] = [now, 0, 0, record.levelno, record.name]
+            elif now - site[0] >= self.window:
+                if site[2]:
+                    self._pending.append(self._summary(key, site, now))
+                site[0], site[1], site[2] = now, 0, 0
+            if site[1] < self.site_limit:
+                site[1] += 1
+                return True
+            site[2] += 1
+            return False
+
+    def _summary(self, key, site, now):
+        pathname, lineno = key
+        return logging.LogRecord(
+            site[4], site[3], pathname, lineno,
+            "Подавлено %s записей из %s:%s за %.0f с.",
+            (site[2], os.path.basename(pathname), lineno, now - site[0]), None
+        )
+
+    def due_summaries(self, force=False):
+        """
+        Сводки о подавленных записях для мест вызова, чьё окно закончилось.
+
+        :param force: Выпустить сводки и по незакончившимся окнам (при остановке)
+        :return: Список LogRecord
+        """
+        now = time.monotonic()
+        if not force and now < self._next_sweep:
+            return []
+        with self._lock:
+            self._next_sweep = now + min(self.window, 1.0)
+            summaries, self._pending = self._pending, []
+            for key, site in list(self._sites.items()):
+                if force or now - site[0] >= self.window:
+                    if site[2]:
+                        summaries.append(self._summary(key, site, now))
+                    # Закончившиеся окна удаляются, чтобы тихие места вызова не копились в памяти
+                    del self._sites[key]
+        return summaries
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Кладёт записи в очередь без форматирования.
+
+    Стандартный QueueHandler форматирует сообщение ещё в потоке обработчика;
+    здесь запись уходит как есть, и строка собирается в потоке QueueListener.
+    Поэтому в аргументы логирования передаются только неизменяемые значения.
+    Отброшенные LogThrottle записи в очередь не попадают вовсе.
+    """
+
+    def __init__(self, queue, throttle=None):
+        super().__init__(queue)
+        self.throttle = throttle
+
+    def handle(self, record):
+        if self.throttle is not None:
+            for summary in self.throttle.due_summaries():
+                self.enqueue(summary)
+            if not self.throttle.admit(record):
+                return False
+        return super().handle(record)
+
+    def prepare(self, record):
+        return record
+
+
+class TruncatingFormatter(logging.Formatter):
+    """
+    Обрезает слишком длинный текст записи (например, целиком залогированные словари).
+    """
+
+    def __init__(self, *args, max_length=LOG_MAX_MESSAGE_LENGTH, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_length = max_length
+
+    def format(self, record):
+        if self.max_length:
+            message = record.getMessage()
+            if len(message) > self.max_length:
+                record.msg = f"{message[:self.max_length]}… [обрезано {len(message) - self.max_length} симв.]"
+                record.args = None
+        return super().format(record)
+
+
 # Создание логгера
 logger = logging.getLogger('bot_logger')
-logger.setLevel(logging.DEBUG)  # Уровень логирования
+logger.setLevel(getattr(logging, LOG_LEVEL, logging.DEBUG))  # Уровень логирования
 
 # Форматтер для логов
-formatter = logging.Formatter(
+formatter = TruncatingFormatter(
     fmt='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     datefmt='%Y-%m-%d %H:%M:%S'
 )
@@ -35,6 +186,25 @@ file_handler = logging.handlers.RotatingFileHandler(
 file_handler.setLevel(logging.DEBUG)  # Уровень для файла
 file_handler.setFormatter(formatter)
 
-# Добавление обработчиков к логгеру
-logger.addHandler(console_handler)
-logger.addHandler(file_handler)
+# Обработчики вызываются в отдельном потоке: запись в файл и консоль не задерживает обработку обновлений
+log_queue = queue.SimpleQueue()
+throttle = LogThrottle()
+logger.addHandler(DeferredQueueHandler(log_queue, throttle))
+listener = logging.handlers.QueueListener(log_queue, console_handler, file_handler, respect_handler_level=True)
+listener.start()
+
+
+def stop_logging():
+    """
+    Дописывает записи из очереди и останавливает поток логирования.
+    """
+    # Сводки о подавленных записях не теряются при остановке
+    for summary in throttle.due_summaries(force=True):
+        log_queue.put_nowait(summary)
+    # QueueListener.stop нельзя вызывать повторно
+    if listener._thread is not None:
+        listener.stop()
+
+
+# Модуль импортируется первым, поэтому очередь дописывается после остальных обработчиков atexit
+atexit.register(stop_logging)
@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+import threading
+from config import MEDIA_CACHE_FILE
+from logger import logger
+
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def file_id_from_message(message):
+    """
+    Достаёт file_id отправленного файла из ответа Telegram.
+
+    :param message: Объект Message, который вернул Bot API
+    :return: file_id или None, если в сообщении нет фотографии или документа
+    """
+    if message.photo:
+        # Последний размер — оригинал, Telegram сам подберёт превью по нему
+        return message.photo[-1].file_id
+    if message.document:
+        return message.document.file_id
+    return None
+
+
+class MediaCache:
+    """
+    Кэш file_id Telegram для файлов меню.
+
+    После первой загрузки файл отправляется по file_id без передачи байтов.
+    Запись привязана к sha256 содержимого: если файл изменился, file_id
+    больше не выдаётся. Хэш пересчитывается только при смене mtime или размера.
+    """
+
+    def __init__(self, path=MEDIA_CACHE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = {}
+        # media_path -> (mtime_ns, size, sha256)
+        self._digests = {}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='UTF-8') as f:
+                self._entries = json.load(f)
+        except FileNotFoundError:
+            self._entries = {}
+        except json.JSONDecodeError as e:
+            logger.error(f"Ошибка декодирования {self.path}: {e}")
+            self._entries = {}
+
+    def _save_locked(self):
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        try:
+            with open(tmp_path, 'w', encoding='UTF-8') as f:
+                json.dump(self._entries, f, ensure_ascii=False, indent=4)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.error(f"Ошибка при сохранении {self.path}: {e}")
+
+    def _digest_locked(self, media_path):
+        mtime_ns, size = _file_signature(media_path)
+        cached = self._digests.get(media_path)
+        if cached and cached[:2] == (mtime_ns, size):
+            return cached[2]
+        digest = hashlib.sha256()
+        with open(media_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        sha256 = digest.hexdigest()
+        self._digests[media_path] = (mtime_ns, size, sha256)
+        return sha256
+
+    def get(self, media_path):
+        """
+        Возвращает file_id для актуальной версии файла.
+
+        :param media_path: Путь к файлу
+        :return: file_id или None, если файл ещё не загружался или изменился
+        :raises FileNotFoundError: Если файла нет
+        """
+        with self._lock:
+            sha256 = self._digest_locked(media_path)
+            entry = self._entries.get(media_path)
+            if entry and entry['sha256'] == sha256:
+                return entry['file_id']
+            return None
+
+    def remember(self, media_paths, messages):
+        """
+        Запоминает file_id загруженных файлов.
+
+        :param media_paths: Пути в порядке отправки; None для файлов, отправленных по file_id
+        :param messages: Сообщения, которые вернул Bot API, в том же порядке
+        """
+        changed = False
+        with self._lock:
+            for media_path, message in zip(media_paths, messages):
+                if media_path is None:
+                    continue
+                file_id = file_id_from_message(message)
+                if not file_id:
+                    continue
+                try:
+                    sha256 = self._digest_locked(media_path)
+                except FileNotFoundError:
+                    continue
+                self._entries[media_path] = {'sha256': sha256, 'file_id': file_id}
+                changed = True
+            if changed:
+                self._save_locked()
+
+    def invalidate(self, media_paths):
+        """
+        Удаляет file_id файлов, например если Telegram перестал их принимать.
+        """
+        with self._lock:
+            removed = [path for path in media_paths if self._entries.pop(path, None)]
+            if removed:
+                self._save_locked()
+        if removed:
+            logger.warning(f"Сброшены file_id для файлов: {', '.join(removed)}")
+
+    def warm(self, media_paths):
+        """
+        Хэширует файлы меню и убирает записи для изменившихся файлов.
+
+        :param media_paths: Пути ко всем файлам меню
+        :return: Список файлов, для которых ещё нет file_id
+        """
+        missing = []
+        with self._lock:
+            stale = False
+            for media_path in dict.fromkeys(media_paths):
+                try:
+                    sha256 = self._digest_locked(media_path)
+                except FileNotFoundError:
+                    logger.error(f"Файл {media_path} не найден.")
+                    continue
+                entry = self._entries.get(media_path)
+                if entry and entry['sha256'] != sha256:
+                    del self._entries[media_path]
+                    stale = True
+                    entry = None
+                if entry is None:
+                    missing.append(media_path)
+            if stale:
+                self._save_locked()
+        logger.info(f"Кэш file_id прогрет: {len(self._digests)} файлов, без file_id — {len(missing)}.")
+        return missing
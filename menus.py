@@ -0,0 +1,97 @@
+import json
+import os
+import string
+from collections import namedtuple
+from types import MappingProxyType
+from config import MENUS
+from logger import logger
+
+PHOTO_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp')
+DOCUMENT_EXTENSIONS = ('.pdf', '.docx', '.txt')
+
+# Готовый к отправке план меню: всё, что не зависит от пользователя, посчитано заранее
+MenuPlan = namedtuple('MenuPlan', ['name', 'text', 'fields', 'buttons', 'keyboard', 'photos', 'documents'])
+
+
+def _template_fields(text):
+    """
+    Возвращает имена подстановок в шаблоне str.format.
+
+    :raises ValueError: Если шаблон некорректен
+    """
+    fields = set()
+    for _, field_name, _, _ in string.Formatter().parse(text):
+        if field_name:
+            fields.add(field_name.split('.')[0].split('[')[0])
+    return frozenset(fields)
+
+
+def compile_menu(name, menu):
+    """
+    Собирает план меню из конфигурации.
+
+    :param name: Название меню
+    :param menu: Описание меню из MENUS
+    :return: MenuPlan
+    """
+    buttons = tuple((button['text'], button['callback_data']) for button in menu.get('buttons', []))
+    # Тот же JSON, что дал бы InlineKeyboardMarkup.to_json(): по одной кнопке в ряду
+    keyboard = json.dumps({
+        'inline_keyboard': [[{'text': text, 'callback_data': callback_data}] for text, callback_data in buttons]
+    })
+
+    photos = []
+    documents = []
+    for media_file in menu.get('media', []):
+        if media_file.lower().endswith(PHOTO_EXTENSIONS):
+            photos.append(media_file)
+        elif media_file.lower().endswith(DOCUMENT_EXTENSIONS):
+            documents.append(media_file)
+        else:
+            logger.warning(f"Неизвестный тип файла: {media_file}")
+
+    try:
+        fields = _template_fields(menu['text'])
+    except ValueError as e:
+        logger.error(f"Некорректный шаблон текста меню '{name}': {e}")
+        fields = frozenset()
+
+    return MenuPlan(name, menu['text'], fields, buttons, keyboard, tuple(photos), tuple(documents))
+
+
+def compile_menus(menus):
+    """
+    Собирает планы для всех меню.
+
+    :return: Неизменяемый словарь {название меню: MenuPlan}
+    """
+    return MappingProxyType({name: compile_menu(name, menu) for name, menu in menus.items()})
+
+
+def validate_menus(plans, callback_handlers, template_fields):
+    """
+    Проверяет планы меню при запуске и пишет найденные проблемы в лог.
+
+    :param plans: Планы меню
+    :param callback_handlers: Словарь обработчиков callback_data
+    :param template_fields: Имена, которые можно подставлять в текст меню
+    :return: Список описаний проблем
+    """
+    problems = []
+    for plan in plans.values():
+        for text, callback_data in plan.buttons:
+            if callback_data not in callback_handlers:
+                problems.append(f"Меню '{plan.name}': нет обработчика для кнопки '{text}' ({callback_data})")
+        for media_file in plan.photos + plan.documents:
+            if not os.path.isfile(media_file):
+                problems.append(f"Меню '{plan.name}': файл {media_file} не найден")
+        for field in sorted(plan.fields - set(template_fields)):
+            problems.append(f"Меню '{plan.name}': неизвестное поле шаблона '{field}'")
+    for problem in problems:
+        logger.error(problem)
+    if not problems:
+        logger.info(f"Проверено меню: {len(plans)}, проблем не найдено.")
+    return problems
+
+
+MENU_PLANS = compile_menus(MENUS)
@@ -0,0 +1,401 @@
+"""
+Встроенные метрики бота в формате Prometheus.
+
+Гистограммы и счётчики хранятся в памяти процесса. Время обработчика
+делится на хранилище, Telegram API и вычисления: обработчик открывает
+span (track_handler), а операции с хранилищем (timed(..., component='storage'))
+и запросы к Bot API, выполненные внутри обработчика (через
+apihelper.CUSTOM_REQUEST_SENDER или AsyncOutbound.call), добавляют к нему своё
+время. Остаток считается вычислениями.
+
+Составляющая telegram синхронного бота покрывает только вызовы в потоке
+обработчика (answer_callback_query и т. п.): отправки через OutboundQueue
+выполняются позже рабочими потоками. Очередь запоминает метку обработчика,
+поставившего отправку, и относит к ней время от постановки до ответа Telegram
+(bot_handler_outbound_seconds).
+
+Метрики отдаются встроенным HTTP-сервером (MetricsServer) и сводкой
+администратору (format_summary).
+"""
+import bisect
+import contextvars
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from telebot import apihelper
+
+from config import METRICS_HOST, METRICS_PORT
+from logger import logger
+from profiling import profiler
+
+# Границы корзин гистограмм (сек)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COMPONENTS = ('storage', 'telegram', 'compute')
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels_text(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{value}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    """
+    Счётчик с метками.
+    """
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def values(self):
+        with self._lock:
+            return dict(self._values)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        for labelvalues, value in sorted(self.values().items()):
+            lines.append(f'{self.name}{_labels_text(self.labelnames, labelvalues)} {value}')
+        return lines
+
+
+class Histogram:
+    """
+    Гистограмма с фиксированными корзинами и метками.
+    """
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labelvalues -> [счётчики по корзинам (последняя — +Inf), сумма, количество]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def series(self):
+        """
+        :return: {labelvalues: (счётчики по корзинам, сумма, количество)}
+        """
+        with self._lock:
+            return {labelvalues: (list(counts), total, count)
+                    for labelvalues, (counts, total, count) in self._series.items()}
+
+    def quantile(self, q, *labelvalues):
+        """
+        Оценка квантиля линейной интерполяцией внутри корзины, как histogram_quantile в Prometheus.
+        """
+        series = self.series().get(labelvalues)
+        if series is None or not series[2]:
+            return None
+        counts, _, count = series
+        rank = q * count
+        cumulative = 0
+        for index, bucket_count in enumerate(counts):
+            if cumulative + bucket_count >= rank and bucket_count:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0.0
+                return lower + (self.buckets[index] - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.buckets[-1]
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for labelvalues, (counts, total, count) in sorted(self.series().items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{self.name}_bucket{_labels_text(self.labelnames, labelvalues, [("le", le)])} '
+                             f'{cumulative}')
+            labels = _labels_text(self.labelnames, labelvalues)
+            lines.append(f'{self.name}_sum{labels} {total}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+START_TIME = time.time()
+
+UPDATES = Counter('bot_updates_total', 'Обработанные обновления по типу', ['kind'])
+HANDLER_SECONDS = Histogram('bot_handler_seconds', 'Время обработчика обновления', ['handler'])
+HANDLER_COMPONENT_SECONDS = Histogram(
+    'bot_handler_component_seconds', 'Время обработчика по составляющим', ['handler', 'component']
+)
+HANDLER_ERRORS = Counter('bot_handler_errors_total', 'Исключения в обработчиках', ['handler'])
+OPERATION_SECONDS = Histogram('bot_operation_seconds', 'Время отдельных операций', ['operation'])
+TELEGRAM_REQUEST_SECONDS = Histogram('bot_telegram_request_seconds', 'Время запросов к Bot API', ['method'])
+TELEGRAM_ERRORS = Counter('bot_telegram_request_errors_total', 'Неуспешные запросы к Bot API', ['method'])
+HANDLER_OUTBOUND_SECONDS = Histogram(
+    'bot_handler_outbound_seconds', 'Отложенные отправки обработчика: от постановки в очередь до ответа Telegram',
+    ['handler']
+)
+
+REGISTRY = (
+    UPDATES, HANDLER_SECONDS, HANDLER_COMPONENT_SECONDS, HANDLER_ERRORS, HANDLER_OUTBOUND_SECONDS,
+    OPERATION_SECONDS, TELEGRAM_REQUEST_SECONDS, TELEGRAM_ERRORS
+)
+
+# Время составляющих текущего обработчика; contextvars изолирует потоки и задачи asyncio
+_span = contextvars.ContextVar('metrics_span', default=None)
+
+
+class _Span:
+    __slots__ = ('handler', 'storage', 'telegram', 'depth')
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.storage = 0.0
+        self.telegram = 0.0
+        # Вложенные операции (например, запись из другой записи) не считаются дважды
+        self.depth = 0
+
+
+@contextmanager
+def track_handler(handler, kind='message'):
+    """
+    Замеряет обработчик обновления: время, составляющие, ошибки.
+    При включённом профилировании обработчик выполняется под cProfile.
+
+    Используется как контекстный менеджер или декоратор.
+
+    :param handler: Метка обработчика (callback_data, state:<шаг>, command:<команда>)
+    :param kind: Тип обновления для bot_updates_total
+    """
+    span = _Span(handler)
+    token = _span.set(span)
+    # Профилировщик выключен — None без лишних вызовов
+    profile = profiler.start() if profiler.enabled else None
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        HANDLER_ERRORS.inc(handler)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        if profile is not None:
+            profiler.finish(profile, handler, elapsed)
+        _span.reset(token)
+        UPDATES.inc(kind)
+        HANDLER_SECONDS.observe(elapsed, handler)
+        HANDLER_COMPONENT_SECONDS.observe(span.storage, handler, 'storage')
+        HANDLER_COMPONENT_SECONDS.observe(span.telegram, handler, 'telegram')
+        HANDLER_COMPONENT_SECONDS.observe(max(0.0, elapsed - span.storage - span.telegram), handler, 'compute')
+
+
+@contextmanager
+def component(name):
+    """
+    Относит время блока к составляющей текущего обработчика (storage или telegram).
+    """
+    span = _span.get()
+    if span is None or span.depth:
+        yield
+        return
+    span.depth += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        span.depth -= 1
+        setattr(span, name, getattr(span, name) + time.perf_counter() - started)
+
+
+def current_handler():
+    """
+    Метка обработчика, в котором выполняется код, или None вне обработчика.
+    """
+    span = _span.get()
+    return span.handler if span is not None else None
+
+
+def observe_outbound(handler, seconds):
+    """
+    Относит отложенную отправку к обработчику, который поставил её в очередь.
+
+    :param handler: Метка из current_handler() на момент постановки
+    :param seconds: Время от постановки в очередь до ответа Telegram
+    """
+    if handler is not None:
+        HANDLER_OUTBOUND_SECONDS.observe(seconds, handler)
+
+
+def timed(operation, component_name=None):
+    """
+    Декоратор: время вызова в bot_operation_seconds.
+
+    :param operation: Метка операции
+    :param component_name: Составляющая обработчика, к которой относится время (например, 'storage')
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                if component_name is None:
+                    return func(*args, **kwargs)
+                with component(component_name):
+                    return func(*args, **kwargs)
+            finally:
+                OPERATION_SECONDS.observe(time.perf_counter() - started, operation)
+        return wrapper
+    return decorator
+
+
+def _timed_request(method, url, **kwargs):
+    api_method = url.rsplit('/', 1)[-1]
+    # Long polling getUpdates ждёт обновлений, его время не показательно
+    if api_method == 'getUpdates':
+        return apihelper._get_req_session().request(method, url, **kwargs)
+    started = time.perf_counter()
+    try:
+        with component('telegram'):
+            response = apihelper._get_req_session().request(method, url, **kwargs)
+    except Exception:
+        TELEGRAM_ERRORS.inc(api_method)
+        raise
+    finally:
+        TELEGRAM_REQUEST_SECONDS.observe(time.perf_counter() - started, api_method)
+    if response.status_code != 200:
+        TELEGRAM_ERRORS.inc(api_method)
+    return response
+
+
+def instrument_telegram_requests():
+    """
+    Замеряет запросы telebot к Bot API.
+    """
+    apihelper.CUSTOM_REQUEST_SENDER = _timed_request
+
+
+def render():
+    """
+    Все метрики в текстовом формате Prometheus.
+    """
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    lines.append('# HELP bot_start_time_seconds Время запуска процесса (unix)')
+    lines.append('# TYPE bot_start_time_seconds gauge')
+    lines.append(f'bot_start_time_seconds {START_TIME}')
+    return '\n'.join(lines) + '\n'
+
+
+def format_summary(limit=10):
+    """
+    Краткая сводка для администратора: частота обновлений и самые нагруженные обработчики.
+    """
+    uptime = time.time() - START_TIME
+    updates = sum(UPDATES.values().values())
+    lines = [f"Обновлений: {updates} за {uptime / 60:.0f} мин ({updates / uptime:.2f}/с)"]
+
+    handlers = sorted(HANDLER_SECONDS.series().items(), key=lambda item: item[1][2], reverse=True)
+    components = HANDLER_COMPONENT_SECONDS.series()
+    errors = HANDLER_ERRORS.values()
+    if handlers:
+        lines.append("\nОбработчик: вызовов, ошибок, p50/p95 мс, хранилище/Telegram/вычисления мс")
+    for (handler,), (_, total, count) in handlers[:limit]:
+        split = '/'.join(
+            f"{components[(handler, name)][1] / count * 1000:.1f}" if (handler, name) in components else '0'
+            for name in COMPONENTS
+        )
+        lines.append(
+            f"{handler}: {count}, {errors.get((handler,), 0)}, "
+            f"{HANDLER_SECONDS.quantile(0.5, handler) * 1000:.1f}/{HANDLER_SECONDS.quantile(0.95, handler) * 1000:.1f}, "
+            f"{split}"
+        )
+
+    outbound = sorted(HANDLER_OUTBOUND_SECONDS.series().items(), key=lambda item: item[1][2], reverse=True)
+    if outbound:
+        lines.append("\nОтправки через очередь по обработчикам: отправок, среднее/p95 мс")
+    for (handler,), (_, total, count) in outbound[:limit]:
+        lines.append(
+            f"{handler}: {count}, {total / count * 1000:.1f}/"
+            f"{HANDLER_OUTBOUND_SECONDS.quantile(0.95, handler) * 1000:.1f}"
+        )
+
+    operations = OPERATION_SECONDS.series()
+    if operations:
+        lines.append("\nОперации: вызовов, среднее/p95 мс")
+    for (operation,), (_, total, count) in sorted(operations.items()):
+        lines.append(
+            f"{operation}: {count}, {total / count * 1000:.1f}/"
+            f"{OPERATION_SECONDS.quantile(0.95, operation) * 1000:.1f}"
+        )
+    telegram_errors = sum(TELEGRAM_ERRORS.values().values())
+    if telegram_errors:
+        lines.append(f"\nОшибок запросов к Telegram: {telegram_errors}")
+    return '\n'.join(lines)
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    server_version = 'NightBotMetrics'
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("Метрики: %s " + format, self.address_string(), *args)
+
+
+class MetricsServer:
+    """
+    HTTP-сервер, отдающий /metrics в фоновом потоке.
+    """
+
+    def __init__(self, host=METRICS_HOST, port=METRICS_PORT):
+        self._server = ThreadingHTTPServer((host, port), _MetricsRequestHandler)
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def server_address(self):
+        return self._server.server_address
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='metrics-http', daemon=True)
+        self._thread.start()
+        host, port = self.server_address[:2]
+        logger.info(f"Метрики доступны на http://{host}:{port}/metrics.")
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
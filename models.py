@@ -1,4 +1,27 @@
+import sys
+
+
+def intern_value(value):
+    # Факультет, источник и ВУЗ берутся из небольших наборов значений,
+    # поэтому одинаковые строки храним в одном экземпляре.
+    # Применяется и при загрузке (from_dict), и при вводе значений в сценарии регистрации
+    return sys.intern(value) if isinstance(value, str) else value
+
+
 class User:
+    __slots__ = (
+        'user_id',
+        'username',
+        'first_name',
+        'registration_date',
+        'is_registered',
+        'name',
+        'university',
+        'faculty',
+        'info_source',
+        'is_payment_confirmed',
+    )
+
     def __init__(self, user_id, username, first_name):
         self.user_id = user_id
         self.username = username or user_id
@@ -33,9 +56,9 @@ class User:
         user.registration_date = data.get('registration_date')
         user.is_registered = data.get('is_registered', False)
         user.name = data.get('name')
-        user.university = data.get('university')
-        user.faculty = data.get('faculty')
-        user.info_source = data.get('info_source')
+        user.university = intern_value(data.get('university'))
+        user.faculty = intern_value(data.get('faculty'))
+        user.info_source = intern_value(data.get('info_source'))
         user.is_payment_confirmed = data.get('is_payment_confirmed', False)
         return user
     
\ No newline at end of file
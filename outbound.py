@@ -0,0 +1,440 @@
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from telebot.apihelper import ApiTelegramException
+
+from config import (
+    OUTBOUND_WORKERS,
+    OUTBOUND_GLOBAL_RATE,
+    OUTBOUND_GLOBAL_BURST,
+    OUTBOUND_CHAT_RATE,
+    OUTBOUND_CHAT_BURST,
+    OUTBOUND_MAX_RETRIES
+)
+from logger import logger
+from metrics import component, current_handler, observe_outbound
+
+# Чем меньше значение, тем раньше отправка
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 10
+
+# Сколько последних задержек хранить для перцентилей
+LATENCY_WINDOW = 1000
+# Как часто удалять простаивающие чаты с полным ведром (сек)
+PRUNE_INTERVAL = 60
+
+
+class TokenBucket:
+    """
+    Ведро токенов: rate токенов в секунду, не больше capacity про запас.
+    """
+
+    def __init__(self, rate, capacity, now=None):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic() if now is None else now
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, cost, now):
+        """
+        Сколько секунд ждать, пока накопится cost токенов.
+        """
+        self._refill(now)
+        # Отправка дороже всего ведра ждёт полного ведра, а не бесконечно
+        cost = min(cost, self.capacity)
+        return 0.0 if self.tokens >= cost else (cost - self.tokens) / self.rate
+
+    def take(self, cost):
+        self.tokens -= min(cost, self.capacity)
+
+    def is_full(self, now):
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class _Job:
+    __slots__ = ('chat_id', 'func', 'args', 'kwargs', 'priority', 'cost', 'description',
+                 'handler', 'future', 'enqueued_at', 'attempts')
+
+    def __init__(self, chat_id, func, args, kwargs, priority, cost, description):
+        self.chat_id = chat_id
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        self.cost = cost
+        self.description = description
+        # Обработчик, поставивший отправку, — к нему относится время в метриках
+        self.handler = current_handler()
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+        self.attempts = 0
+
+
+class _Chat:
+    __slots__ = ('jobs', 'bucket', 'blocked_until', 'scheduled')
+
+    def __init__(self, bucket):
+        self.jobs = deque()
+        self.bucket = bucket
+        self.blocked_until = 0.0
+        # Чат стоит в одной из куч или его отправка уже выполняется
+        self.scheduled = False
+
+
+class OutboundQueue:
+    """
+    Очередь исходящих сообщений с ограничением скорости.
+
+    Обработчики ставят отправку в очередь и сразу получают Future.
+    Рабочие потоки соблюдают общее ведро токенов и ведро каждого чата,
+    отправляют интерактивные ответы раньше массовых рассылок, а при ответе 429
+    ждут retry_after и повторяют отправку. Сообщения одного чата уходят строго
+    в порядке постановки.
+    """
+
+    def __init__(self, bot, workers=OUTBOUND_WORKERS, global_rate=OUTBOUND_GLOBAL_RATE,
+                 global_burst=OUTBOUND_GLOBAL_BURST, chat_rate=OUTBOUND_CHAT_RATE,
+                 chat_burst=OUTBOUND_CHAT_BURST, max_retries=OUTBOUND_MAX_RETRIES):
+        self.bot = bot
+        self.workers = workers
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate, global_burst)
+        self._chats = {}
+        # (priority, seq, chat_id) — чаты, готовые к отправке
+        self._ready = []
+        # (ready_at, priority, seq, chat_id) — чаты, ждущие токенов или retry_after
+        self._delayed = []
+        self._seq = itertools.count()
+        self._condition = threading.Condition()
+        self._threads = []
+        self._stopping = False
+        self._pending = 0
+        self._last_prune = time.monotonic()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._stats = {'sent': 0, 'failed': 0, 'retries': 0, 'rate_limited': 0}
+
+    def start(self):
+        if self._threads:
+            return
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f'outbound-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, chat_id, func, *args, priority=PRIORITY_INTERACTIVE, cost=1, description=None, **kwargs):
+        """
+        Ставит вызов Bot API в очередь чата.
+
+        :param chat_id: Чат, к лимиту которого относится отправка
+        :param func: Функция, выполняющая отправку
+        :param priority: PRIORITY_INTERACTIVE или PRIORITY_BULK
+        :param cost: Сколько сообщений отправляет вызов (для медиа-группы — число файлов)
+        :param description: Что отправляется, для сообщений об ошибках
+        :return: Future с результатом func
+        """
+        job = _Job(chat_id, func, args, kwargs, priority, cost, description)
+        with self._condition:
+            if self._stopping and not self._threads:
+                # Очередь уже остановлена — отправляем сразу
+                self._execute_now(job)
+                return job.future
+            chat = self._chats.get(chat_id)
+            if chat is None:
+                chat = self._chats[chat_id] = _Chat(TokenBucket(self.chat_rate, self.chat_burst))
+            chat.jobs.append(job)
+            self._pending += 1
+            if not chat.scheduled:
+                chat.scheduled = True
+                heapq.heappush(self._ready, (priority, next(self._seq), chat_id))
+                self._condition.notify()
+        return job.future
+
+    def send_message(self, chat_id, text, priority=PRIORITY_INTERACTIVE, description=None, **kwargs):
+        return self.submit(chat_id, self.bot.send_message, chat_id, text,
+                           priority=priority, description=description or 'сообщения', **kwargs)
+
+    def send_document(self, chat_id, document, priority=PRIORITY_INTERACTIVE, description=None, **kwargs):
+        return self.submit(chat_id, self.bot.send_document, chat_id, document,
+                           priority=priority, description=description or 'документа', **kwargs)
+
+    def send_media_group(self, chat_id, media, priority=PRIORITY_INTERACTIVE, description=None, **kwargs):
+        return self.submit(chat_id, self.bot.send_media_group, chat_id, media, priority=priority,
+                           cost=len(media), description=description or 'медиа-группы', **kwargs)
+
+    def _next_job(self):
+        """
+        Ждёт отправку, для которой есть токены. Вызывается под блокировкой.
+
+        :return: Задание или None, если очередь остановлена и пуста
+        """
+        while True:
+            now = time.monotonic()
+            while self._delayed and self._delayed[0][0] <= now:
+                _, priority, seq, chat_id = heapq.heappop(self._delayed)
+                heapq.heappush(self._ready, (priority, seq, chat_id))
+            if self._ready:
+                priority, seq, chat_id = heapq.heappop(self._ready)
+                chat = self._chats[chat_id]
+                job = chat.jobs[0]
+                wait = max(
+                    chat.blocked_until - now,
+                    chat.bucket.delay(job.cost, now),
+                    self._global.delay(job.cost, now)
+                )
+                if wait > 0:
+                    heapq.heappush(self._delayed, (now + wait, priority, seq, chat_id))
+                    continue
+                chat.bucket.take(job.cost)
+                self._global.take(job.cost)
+                chat.jobs.popleft()
+                return job
+            if self._stopping and not self._pending:
+                return None
+            if now - self._last_prune >= PRUNE_INTERVAL:
+                self._prune(now)
+            self._condition.wait(self._delayed[0][0] - now if self._delayed else PRUNE_INTERVAL)
+
+    def _prune(self, now):
+        idle = [chat_id for chat_id, chat in self._chats.items()
+                if not chat.scheduled and chat.blocked_until <= now and chat.bucket.is_full(now)]
+        for chat_id in idle:
+            del self._chats[chat_id]
+        self._last_prune = now
+
+    def _work(self):
+        while True:
+            with self._condition:
+                job = self._next_job()
+            if job is None:
+                return
+            retry_after = self._execute(job)
+            with self._condition:
+                chat = self._chats[job.chat_id]
+                if retry_after is not None:
+                    chat.blocked_until = time.monotonic() + retry_after
+                    chat.jobs.appendleft(job)
+                else:
+                    self._pending -= 1
+                if chat.jobs:
+                    head = chat.jobs[0]
+                    heapq.heappush(self._ready, (head.priority, next(self._seq), job.chat_id))
+                else:
+                    chat.scheduled = False
+                self._condition.notify_all()
+
+    def _execute(self, job):
+        """
+        Выполняет отправку.
+
+        :return: Через сколько секунд повторить, если Telegram ответил 429, иначе None
+        """
+        if job.attempts == 0 and not job.future.set_running_or_notify_cancel():
+            return None
+        job.attempts += 1
+        try:
+            result = job.func(*job.args, **job.kwargs)
+        except ApiTelegramException as e:
+            if e.error_code == 429 and job.attempts <= self.max_retries:
+                retry_after = (e.result_json or {}).get('parameters', {}).get('retry_after', 1)
+                with self._condition:
+                    self._stats['rate_limited'] += 1
+                    self._stats['retries'] += 1
+                logger.warning(f"Telegram ограничил отправку в чат {job.chat_id}, повтор через {retry_after} с.")
+                return retry_after
+            self._fail(job, e)
+            return None
+        except Exception as e:
+            self._fail(job, e)
+            return None
+        latency = time.monotonic() - job.enqueued_at
+        observe_outbound(job.handler, latency)
+        latency_ms = latency * 1000
+        with self._condition:
+            self._stats['sent'] += 1
+            self._latencies.append(latency_ms)
+        job.future.set_result(result)
+        return None
+
+    def _execute_now(self, job):
+        job.future.set_running_or_notify_cancel()
+        try:
+            job.future.set_result(job.func(*job.args, **job.kwargs))
+        except Exception as e:
+            self._fail(job, e)
+        else:
+            observe_outbound(job.handler, time.monotonic() - job.enqueued_at)
+
+    def _fail(self, job, error):
+        with self._condition:
+            self._stats['failed'] += 1
+        logger.error(f"Ошибка при отправке {job.description or 'сообщения'} в чат {job.chat_id}: {error}")
+        job.future.set_exception(error)
+
+    def stop(self):
+        """
+        Отправляет всё, что уже стоит в очереди, и останавливает рабочие потоки.
+        """
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        logger.info(f"Очередь отправки остановлена: {self.stats()}")
+
+    def stats(self):
+        with self._condition:
+            stats = dict(self._stats)
+            stats['queued'] = self._pending
+            stats['chats'] = len(self._chats)
+            latencies = sorted(self._latencies)
+        if latencies:
+            stats['latency_p50_ms'] = latencies[len(latencies) // 2]
+            stats['latency_p95_ms'] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            stats['latency_max_ms'] = latencies[-1]
+        return stats
+
+
+class _AsyncChat:
+    __slots__ = ('lock', 'bucket', 'blocked_until', 'waiting')
+
+    def __init__(self, lock, bucket):
+        self.lock = lock
+        self.bucket = bucket
+        self.blocked_until = 0.0
+        self.waiting = 0
+
+
+class AsyncOutbound:
+    """
+    Отправка сообщений для AsyncTeleBot с теми же лимитами, что у OutboundQueue.
+
+    Вместо рабочих потоков каждая отправка — корутина: сообщения одного чата
+    идут по очереди под asyncio.Lock, ведра токенов общие, при ответе 429
+    корутина ждёт retry_after и повторяет вызов.
+    """
+
+    def __init__(self, global_rate=OUTBOUND_GLOBAL_RATE, global_burst=OUTBOUND_GLOBAL_BURST,
+                 chat_rate=OUTBOUND_CHAT_RATE, chat_burst=OUTBOUND_CHAT_BURST, max_retries=OUTBOUND_MAX_RETRIES):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate, global_burst)
+        self._chats = {}
+        self._last_prune = time.monotonic()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._stats = {'sent': 0, 'failed': 0, 'retries': 0, 'rate_limited': 0}
+
+    def _chat(self, chat_id):
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = _AsyncChat(asyncio.Lock(), TokenBucket(self.chat_rate, self.chat_burst))
+        return chat
+
+    def _prune(self, now):
+        idle = [chat_id for chat_id, chat in self._chats.items()
+                if not chat.waiting and chat.blocked_until <= now and chat.bucket.is_full(now)]
+        for chat_id in idle:
+            del self._chats[chat_id]
+        self._last_prune = now
+
+    async def call(self, chat_id, func, *args, cost=1, description=None, raise_errors=False, **kwargs):
+        """
+        Выполняет корутину Bot API с учётом лимитов.
+
+        :param chat_id: Чат, к лимиту которого относится отправка
+        :param func: Асинхронная функция отправки
+        :param raise_errors: Пробросить ошибку отправки вместо возврата None
+        :return: Результат func или None, если отправка не удалась
+        """
+        enqueued_at = time.monotonic()
+        if enqueued_at - self._last_prune >= PRUNE_INTERVAL:
+            self._prune(enqueued_at)
+        chat = self._chat(chat_id)
+        chat.waiting += 1
+        try:
+            async with chat.lock:
+                attempts = 0
+                while True:
+                    now = time.monotonic()
+                    # Проверка и списание токенов идут без await, поэтому атомарны в цикле событий
+                    wait = max(chat.blocked_until - now, chat.bucket.delay(cost, now), self._global.delay(cost, now))
+                    if wait > 0:
+                        await asyncio.sleep(wait)
+                        continue
+                    chat.bucket.take(cost)
+                    self._global.take(cost)
+                    attempts += 1
+                    try:
+                        # Отправка ожидается внутри обработчика, поэтому входит в его составляющую telegram
+                        with component('telegram'):
+                            result = await func(*args, **kwargs)
+                    except ApiTelegramException as e:
+                        if e.error_code == 429 and attempts <= self.max_retries:
+                            retry_after = (e.result_json or {}).get('parameters', {}).get('retry_after', 1)
+                            self._stats['rate_limited'] += 1
+                            self._stats['retries'] += 1
+                            chat.blocked_until = time.monotonic() + retry_after
+                            logger.warning(f"Telegram ограничил отправку в чат {chat_id}, повтор через {retry_after} с.")
+                            continue
+                        raise
+                    self._stats['sent'] += 1
+                    self._latencies.append((time.monotonic() - enqueued_at) * 1000)
+                    return result
+        except Exception as e:
+            self._stats['failed'] += 1
+            logger.error(f"Ошибка при отправке {description or 'сообщения'} в чат {chat_id}: {e}")
+            if raise_errors:
+                raise
+            return None
+        finally:
+            chat.waiting -= 1
+
+    def stats(self):
+        stats = dict(self._stats)
+        stats['chats'] = len(self._chats)
+        latencies = sorted(self._latencies)
+        if latencies:
+            stats['latency_p50_ms'] = latencies[len(latencies) // 2]
+            stats['latency_p95_ms'] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            stats['latency_max_ms'] = latencies[-1]
+        return stats
+
+
+class AsyncOutboundBridge:
+    """
+    Отправка через AsyncOutbound из обычных потоков, например из потока рассылки.
+
+    send_message ставит отправку в цикл событий и, как OutboundQueue.send_message,
+    возвращает concurrent.futures.Future; ошибки отправки попадают в Future.
+    Приоритетов у AsyncOutbound нет: массовые отправки делят лимиты с
+    интерактивными на общих основаниях.
+    """
+
+    def __init__(self, outbound, bot):
+        self.outbound = outbound
+        self.bot = bot
+        self.loop = None
+
+    def attach(self, loop):
+        """
+        Задаёт цикл событий, в котором выполняются отправки; вызывается из работающего цикла.
+        """
+        self.loop = loop
+
+    def send_message(self, chat_id, text, priority=PRIORITY_INTERACTIVE, description=None, **kwargs):
+        coro = self.outbound.call(chat_id, self.bot.send_message, chat_id, text,
+                                  description=description or 'сообщения', raise_errors=True, **kwargs)
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
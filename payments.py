@@ -0,0 +1,162 @@
+import json
+import os
+import threading
+import time
+from config import (
+    VALID_PAYMENTS_FILE,
+    VALID_PAYMENTS_LOG_FILE,
+    VALID_PAYMENTS_POLL_INTERVAL,
+    VALID_PAYMENTS_COMPACT_INTERVAL,
+    VALID_PAYMENTS_COMPACT_THRESHOLD
+)
+from logger import logger
+from metrics import timed
+
+
+def _file_signature(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class PaymentIndex:
+    """
+    Резидентный индекс подтверждённых оплат из guests_valid.json.
+
+    Проверка оплаты — обращение к словарю в памяти. Файл перечитывается только
+    когда меняются его mtime или размер, а увеличения счётчиков дописываются
+    в отдельный журнал и периодически сворачиваются обратно в файл.
+    """
+
+    def __init__(self, path=VALID_PAYMENTS_FILE, log_path=VALID_PAYMENTS_LOG_FILE,
+                 poll_interval=VALID_PAYMENTS_POLL_INTERVAL,
+                 compact_interval=VALID_PAYMENTS_COMPACT_INTERVAL,
+                 compact_threshold=VALID_PAYMENTS_COMPACT_THRESHOLD):
+        self.path = path
+        self.log_path = log_path
+        self.poll_interval = poll_interval
+        self.compact_interval = compact_interval
+        self.compact_threshold = compact_threshold
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._signature = None
+        self._pending = 0
+        self._last_compaction = time.monotonic()
+        self._watcher = None
+        self._stop_event = threading.Event()
+        self.reload()
+
+    def reload(self):
+        """
+        Перечитывает файл оплат и применяет к нему журнал увеличений счётчиков.
+        """
+        with self._lock:
+            self._reload_locked()
+
+    def _reload_locked(self):
+        signature = _file_signature(self.path)
+        try:
+            with open(self.path, 'r', encoding='UTF-8') as f:
+                counts = json.load(f)
+        except FileNotFoundError:
+            counts = {}
+        except json.JSONDecodeError as e:
+            # Файл может читаться в момент записи; оставляем прежние данные до следующей проверки
+            logger.error(f"Ошибка декодирования {self.path}: {e}")
+            return
+
+        pending = 0
+        try:
+            with open(self.log_path, 'r', encoding='UTF-8') as f:
+                for line in f:
+                    user_id = line.strip()
+                    if user_id in counts:
+                        counts[user_id] += 1
+                        pending += 1
+        except FileNotFoundError:
+            pass
+
+        self._counts = counts
+        self._signature = signature
+        self._pending = pending
+        logger.info(f"Индекс оплат загружен: {len(counts)} записей, {pending} из журнала.")
+
+    def get(self, user_id):
+        return self._counts.get(str(user_id))
+
+    @timed('payment_confirm', 'storage')
+    def confirm(self, user_id):
+        """
+        Увеличивает счётчик подтверждений пользователя.
+
+        :param user_id: Идентификатор пользователя
+        :return: Новое значение счётчика или None, если оплаты нет в списке
+        """
+        user_id = str(user_id)
+        with self._lock:
+            if user_id not in self._counts:
+                return None
+            self._counts[user_id] += 1
+            count = self._counts[user_id]
+            with open(self.log_path, 'a', encoding='UTF-8') as f:
+                f.write(user_id + '\n')
+            self._pending += 1
+            needs_compaction = self._pending >= self.compact_threshold
+        if needs_compaction:
+            self.compact()
+        return count
+
+    def compact(self):
+        """
+        Записывает счётчики в guests_valid.json и очищает журнал.
+
+        Если процесс упадёт между заменой файла и очисткой журнала,
+        при следующей загрузке эти увеличения будут учтены повторно.
+        """
+        with self._lock:
+            if _file_signature(self.path) != self._signature:
+                # Файл изменили снаружи — сначала подхватываем новую версию
+                self._reload_locked()
+            self._last_compaction = time.monotonic()
+            if not self._pending:
+                return
+            tmp_path = self.path.with_name(self.path.name + '.tmp')
+            try:
+                with open(tmp_path, 'w', encoding='UTF-8') as f:
+                    json.dump(self._counts, f, ensure_ascii=False, indent=4)
+                os.replace(tmp_path, self.path)
+                open(self.log_path, 'w', encoding='UTF-8').close()
+            except OSError as e:
+                logger.error(f"Ошибка при сохранении {self.path}: {e}")
+                return
+            self._signature = _file_signature(self.path)
+            logger.debug("Журнал оплат свёрнут в %s (%s увеличений).", self.path, self._pending)
+            self._pending = 0
+
+    def start_watcher(self):
+        """
+        Запускает фоновую проверку изменений файла и периодическое сворачивание журнала.
+        """
+        if self._watcher is not None:
+            return
+        self._watcher = threading.Thread(target=self._watch, name='payments-watcher', daemon=True)
+        self._watcher.start()
+
+    def _watch(self):
+        while not self._stop_event.wait(self.poll_interval):
+            try:
+                if _file_signature(self.path) != self._signature:
+                    logger.info(f"Файл {self.path} изменился, перечитываем индекс оплат.")
+                    self.reload()
+                if time.monotonic() - self._last_compaction >= self.compact_interval:
+                    self.compact()
+            except Exception as e:
+                logger.error(f"Ошибка при проверке файла оплат: {e}")
+
+    def stop(self):
+        self._stop_event.set()
+        if self._watcher is not None:
+            self._watcher.join()
+        self.compact()
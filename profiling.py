@@ -0,0 +1,219 @@
+"""
+Профилирование отдельных обновлений.
+
+Обработчики, обёрнутые metrics.track_handler, при включённом режиме
+выполняются под cProfile:
+    'sample'    — профилируется случайная доля обновлений (PROFILE_SAMPLE_RATE);
+    'threshold' — профилируется каждое обновление, но сохраняются только
+                  обработанные дольше PROFILE_THRESHOLD_MS.
+Хранятся PROFILE_KEEP самых медленных профилей; администратор скачивает их
+в формате pstats (python -m pstats, snakeviz) или collapsed stacks
+(flamegraph.pl, speedscope). В режиме 'off' обработчик не профилируется,
+остаётся одна проверка атрибута.
+
+Одновременно профилируется только одно обновление: пока профиль снимается,
+остальные обработчики выполняются без профилирования (в Python 3.12+
+профилировщик один на процесс, а раньше второй enable() в том же потоке
+перехватывал первый). В асинхронном режиме cProfile видит весь поток цикла
+событий: профиль включает и другие корутины, выполнявшиеся во время обработки.
+"""
+import cProfile
+import heapq
+import itertools
+import marshal
+import os
+import pstats
+import random
+import threading
+from datetime import datetime
+
+from config import PROFILE_MODE, PROFILE_SAMPLE_RATE, PROFILE_THRESHOLD_MS, PROFILE_KEEP
+from logger import logger
+
+PROFILE_MODES = ('off', 'sample', 'threshold')
+PROFILE_FORMATS = ('pstats', 'collapsed')
+
+
+def _frame_name(func):
+    filename, lineno, name = func
+    if filename == '~':
+        # Встроенные функции: {built-in method time.sleep}
+        return name.strip('{}<>')
+    return f"{name} ({os.path.basename(filename)}:{lineno})"
+
+
+def collapse_stats(stats):
+    """
+    Переводит статистику cProfile в collapsed stacks ("a;b;c <мкс>").
+
+    cProfile хранит только пары вызывающий → вызываемый, поэтому полные стеки
+    восстанавливаются обходом графа от корней, а время вызываемой функции
+    делится между путями пропорционально времени вызовов по каждому ребру.
+
+    :param stats: Словарь pstats.Stats.stats
+    :return: Текст в формате collapsed stacks
+    """
+    callees = {}
+    for func, (_, _, _, _, callers) in stats.items():
+        for caller, (_, _, _, edge_cumtime) in callers.items():
+            callees.setdefault(caller, []).append((func, edge_cumtime))
+
+    lines = {}
+
+    def walk(func, path, budget):
+        _, _, tottime, cumtime, _ = stats[func]
+        if budget <= 0 or not cumtime:
+            return
+        share = min(1.0, budget / cumtime)
+        path = path + (func,)
+        self_time = tottime * share
+        if self_time:
+            key = ';'.join(_frame_name(frame) for frame in path)
+            lines[key] = lines.get(key, 0) + self_time
+        for callee, edge_cumtime in callees.get(func, ()):
+            # Рекурсия уже учтена во времени функции выше по стеку
+            if callee not in path:
+                walk(callee, path, edge_cumtime * share)
+
+    for func, (_, _, _, cumtime, callers) in stats.items():
+        if not callers:
+            walk(func, (), cumtime)
+    return '\n'.join(f"{key} {round(value * 1_000_000)}" for key, value in lines.items() if value >= 1e-6) + '\n'
+
+
+class Profiler:
+    """
+    Профилировщик обработчиков с хранением самых медленных профилей.
+
+    :param mode: 'off', 'sample' или 'threshold'
+    :param sample_rate: Доля профилируемых обновлений в режиме 'sample'
+    :param threshold_ms: Порог времени обработки в режиме 'threshold' (мс)
+    :param keep: Сколько самых медленных профилей хранить
+    """
+
+    def __init__(self, mode=PROFILE_MODE, sample_rate=PROFILE_SAMPLE_RATE, threshold_ms=PROFILE_THRESHOLD_MS,
+                 keep=PROFILE_KEEP):
+        self.keep = keep
+        self._lock = threading.Lock()
+        # Куча (время, порядковый номер, запись): в вершине самый быстрый из сохранённых
+        self._slowest = []
+        self._seq = itertools.count(1)
+        # Снимается ли сейчас профиль; меняется под self._lock
+        self._active = False
+        self.configure(mode, sample_rate, threshold_ms)
+
+    def configure(self, mode, sample_rate=None, threshold_ms=None):
+        """
+        Меняет режим профилирования.
+
+        :param mode: 'off', 'sample' или 'threshold'
+        :param sample_rate: Доля профилируемых обновлений, от 0 до 1
+        :param threshold_ms: Порог времени обработки (мс), не меньше 0
+        :raises ValueError: Если режим или параметры недопустимы
+        """
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Неизвестный режим профилирования: {mode}. Допустимые: {', '.join(PROFILE_MODES)}")
+        if sample_rate is not None and not 0 <= sample_rate <= 1:
+            raise ValueError(f"Доля профилируемых обновлений должна быть от 0 до 1: {sample_rate}")
+        if threshold_ms is not None and not threshold_ms >= 0:
+            raise ValueError(f"Порог профилирования не может быть отрицательным: {threshold_ms}")
+        if sample_rate is not None:
+            self.sample_rate = sample_rate
+        if threshold_ms is not None:
+            self.threshold = threshold_ms / 1000
+        self.mode = mode
+        # Единственный атрибут, который проверяется на каждом обновлении
+        self.enabled = mode != 'off'
+        logger.info(f"Режим профилирования обновлений: {mode}.")
+
+    def start(self):
+        """
+        Начинает профилирование текущего обновления.
+
+        :return: cProfile.Profile или None, если обновление не профилируется
+        """
+        if self.mode == 'sample' and random.random() >= self.sample_rate:
+            return None
+        with self._lock:
+            if self._active:
+                # Идёт другой профиль: второй enable() испортил бы оба
+                return None
+            self._active = True
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Профилировщик занят кодом вне бота (например, запуск под python -m cProfile)
+            with self._lock:
+                self._active = False
+            return None
+        return profile
+
+    def finish(self, profile, label, elapsed):
+        """
+        Останавливает профилирование и сохраняет профиль, если он среди самых медленных.
+
+        :param profile: Результат start()
+        :param label: Метка обработчика
+        :param elapsed: Время обработки (сек)
+        """
+        profile.disable()
+        with self._lock:
+            self._active = False
+        if self.mode == 'threshold' and elapsed < self.threshold:
+            return
+        with self._lock:
+            if len(self._slowest) >= self.keep and elapsed <= self._slowest[0][0]:
+                return
+        # Статистика собирается вне блокировки: это самая дорогая часть
+        stats = pstats.Stats(profile).stats
+        entry = {
+            'id': next(self._seq),
+            'label': label,
+            'elapsed_ms': elapsed * 1000,
+            'captured_at': datetime.now().isoformat(timespec='seconds'),
+            'stats': stats,
+        }
+        with self._lock:
+            if len(self._slowest) < self.keep:
+                heapq.heappush(self._slowest, (elapsed, entry['id'], entry))
+            elif elapsed > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, (elapsed, entry['id'], entry))
+
+    def profiles(self):
+        """
+        Сохранённые профили от самого медленного.
+        """
+        with self._lock:
+            return [entry for _, _, entry in sorted(self._slowest, reverse=True)]
+
+    def get(self, profile_id):
+        for entry in self.profiles():
+            if entry['id'] == profile_id:
+                return entry
+        return None
+
+    def clear(self):
+        with self._lock:
+            self._slowest.clear()
+
+    @staticmethod
+    def export(entry, fmt='pstats'):
+        """
+        Профиль в виде файла.
+
+        :param entry: Запись из profiles()
+        :param fmt: 'pstats' (marshal, как pstats.Stats.dump_stats) или 'collapsed'
+        :return: Пара (имя файла, содержимое в байтах)
+        """
+        stamp = entry['captured_at'].replace(':', '').replace('-', '')
+        name = f"profile_{entry['id']}_{entry['label'].replace(':', '_')}_{stamp}"
+        if fmt == 'pstats':
+            return f"{name}.prof", marshal.dumps(entry['stats'])
+        if fmt == 'collapsed':
+            return f"{name}.collapsed.txt", collapse_stats(entry['stats']).encode()
+        raise ValueError(f"Неизвестный формат профиля: {fmt}. Допустимые: {', '.join(PROFILE_FORMATS)}")
+
+
+profiler = Profiler()
+
@@ -0,0 +1,78 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from logger import logger
+from metrics import timed
+from config import (
+    JSON_FILE_PATH,
+    GOOGLE_CREDENTIALS_PATH,
+    GOOGLE_SHEET_ID,
+    GOOGLE_SHEET_NAME
+)
+
+# Сверка выполняется в отдельном потоке, чтобы не занимать потоки telebot.
+# Входные данные у всех сверок одни и те же, поэтому одновременные запросы
+# разделяют одну выполняющуюся сверку и второй поток не нужен
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='reconciliation')
+
+_inflight_lock = threading.Lock()
+_inflight = None
+
+# Последний отчёт и хэш входных данных, по которым он построен
+_cache_lock = threading.Lock()
+_cached_fingerprint = None
+_cached_result = None
+
+
+@timed('data_matcher_run')
+def run_reconciliation():
+    """
+    Выполняет сверку JSON со списком гостей и Google Таблицы.
+
+    Если входные данные не изменились с прошлой сверки, сопоставление не повторяется.
+
+    :return: ReconciliationReport
+    """
+    global _cached_fingerprint, _cached_result
+    # gspread, google-auth и fuzzywuzzy загружаются при первой сверке, а не при запуске бота
+    from data_matcher import DataMatcher
+
+    matcher = DataMatcher(
+        json_file_path=str(JSON_FILE_PATH),
+        credentials_path=str(GOOGLE_CREDENTIALS_PATH),
+        sheet_id=GOOGLE_SHEET_ID,
+        sheet_name=GOOGLE_SHEET_NAME
+    )
+    matcher.load_json()
+    matcher.connect_to_google_sheets()
+
+    fingerprint = matcher.input_fingerprint()
+    with _cache_lock:
+        if fingerprint == _cached_fingerprint:
+            logger.info("Входные данные сверки не изменились, используется сохранённый отчёт.")
+            return _cached_result
+
+    result = matcher.match_data()
+    # Отчёт по неполным данным не кэшируется, иначе он отдавался бы, пока входные данные не изменятся
+    if not matcher.sheet_data or matcher.sheet_revision is None or matcher.json_hash is None:
+        logger.warning("Данные для сверки загружены не полностью, отчёт не сохраняется для повторных запросов.")
+        return result
+    with _cache_lock:
+        _cached_fingerprint = fingerprint
+        _cached_result = result
+    return result
+
+
+def submit_reconciliation():
+    """
+    Ставит сверку в фоновый пул или присоединяется к уже выполняющейся.
+
+    :return: Future с ReconciliationReport
+    """
+    global _inflight
+    with _inflight_lock:
+        if _inflight is not None and not _inflight.done():
+            logger.debug("Сверка уже выполняется, запрос присоединён к ней.")
+            return _inflight
+        _inflight = _executor.submit(run_reconciliation)
+        return _inflight
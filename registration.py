@@ -0,0 +1,223 @@
+"""
+Сценарий регистрации, общий для синхронного (handlers.py) и асинхронного
+(async_handlers.py) ботов.
+
+Шаги меняют пользователя и возвращают Reply: что ответить и в какое состояние
+перевести. Сами обращения к Telegram и хранилищу состояний выполняет модуль
+обработчиков — через OutboundQueue или корутинами через AsyncOutbound.
+"""
+from collections import namedtuple
+from datetime import datetime
+
+import pytz
+
+from config import TEXTS
+from logger import logger
+from models import User, intern_value
+from states import TicketPurchaseStates
+from storage import mark_dirty
+
+FACULTIES = {
+    'social_studies': 'Социальные науки',
+    'computer_studies': 'Компьютерные науки',
+    'human_studies': 'Гуманитарные науки',
+    'natural_studies': 'Естественные науки',
+    'physical_studies': 'Физические науки',
+    'another_studies': 'Другое/не учусь в вузе'
+}
+
+INFO_SOURCES = {
+    'friends': 'От друзей',
+    'odnogroup': 'От одногруппников/однокурсников',
+    'social': 'Из соцсетей',
+    'posvat': 'Пришел/а с посвята',
+    'another': 'Другое'
+}
+
+ERROR_RESTART = "Произошла ошибка. Попробуйте заново /start"
+ASK_UNIVERSITY = "Напишите, из какого вы ВУЗа.\n\nЕсли вы не учитесь в ВУЗе, то напишите «Нигде»."
+
+# alert — ответ на callback; на шаге из сообщения он отправляется обычным сообщением.
+# Порядок выполнения: alert, смена состояния, text, menu.
+Reply = namedtuple(
+    'Reply', ['alert', 'state', 'delete_state', 'text', 'parse_mode', 'menu', 'user_data'],
+    defaults=(None, None, False, None, None, None, None)
+)
+
+
+def start(users, from_user):
+    """
+    /start: создаёт пользователя при первом обращении и показывает главное меню.
+
+    :param users: Словарь пользователей
+    :param from_user: Отправитель сообщения
+    """
+    user = users.get(from_user.id)
+    if not user:
+        user = User(from_user.id, from_user.username or str(from_user.id), from_user.first_name)
+        user.registration_date = datetime.now(pytz.timezone('Europe/Moscow')).isoformat()
+        users[from_user.id] = user
+        mark_dirty(user)
+        logger.info(f"Создан новый пользователь {from_user.id} с именем {from_user.first_name}.")
+    return main_menu(from_user.id, user)
+
+
+def main_menu(user_id, user):
+    """
+    Возврат в главное меню: для зарегистрированных и новых пользователей оно разное.
+
+    :param user_id: ID пользователя
+    :param user: Объект User или None, если пользователь не найден
+    """
+    if not user:
+        logger.warning(f"Пользователь {user_id} не найден при возврате в главное меню.")
+        return Reply(alert=ERROR_RESTART)
+    menu_name = 'main_menu_registered' if user.is_registered else 'main_menu_new'
+    return Reply(menu=menu_name, user_data={'first_name': user.first_name})
+
+
+def buy_ticket(user_id, user):
+    """
+    Покупка билета: инструкции по оплате и переход к вводу ФИО.
+
+    :param user_id: ID пользователя
+    :param user: Объект User или None, если пользователь не найден
+    """
+    if not user:
+        logger.warning(f"Пользователь {user_id} не найден при попытке купить билет.")
+        return Reply(alert=ERROR_RESTART)
+    logger.info(f"Отправлены инструкции по оплате пользователю {user_id}.")
+    return Reply(state=TicketPurchaseStates.waiting_for_name, text=TEXTS['payment_instructions'],
+                 parse_mode='Markdown')
+
+
+def enter_name(user_id, user, text):
+    """
+    Ввод ФИО; после него запрашивается ВУЗ.
+
+    :param user_id: ID пользователя
+    :param user: Объект User или None, если пользователь не найден
+    :param text: Текст сообщения с ФИО
+    """
+    if not user:
+        logger.warning(f"Пользователь {user_id} не найден при обработке имени.")
+        return Reply(alert=ERROR_RESTART, delete_state=True)
+    name = (text or '').strip()
+    if not name:
+        logger.info(f"Пользователь {user_id} отправил пустое имя.")
+        return Reply(text="Пожалуйста, введите корректное ФИО.")
+    user.name = name
+    mark_dirty(user)
+    logger.info(f"Пользователь {user_id} установил ФИО: {name}.")
+    return Reply(state=TicketPurchaseStates.waiting_for_university, text=ASK_UNIVERSITY)
+
+
+def enter_university(user_id, user, text):
+    """
+    Ввод ВУЗа; после него показывается выбор факультета.
+
+    :param user_id: ID пользователя
+    :param user: Объект User или None, если пользователь не найден
+    :param text: Текст сообщения с названием ВУЗа
+    """
+    if not user:
+        logger.warning(f"Пользователь {user_id} не найден при обработке ВУза.")
+        return Reply(alert=ERROR_RESTART, delete_state=True)
+    university = (text or '').strip()
+    if not university:
+        logger.info(f"Пользователь {user_id} отправил пустое название ВУЗа.")
+        return Reply(text="Пожалуйста, введите корректное название ВУЗа.")
+    user.university = intern_value(university)
+    mark_dirty(user)
+    logger.info(f"Пользователь {user_id} установил ВУЗ: {university}.")
+    return Reply(state=TicketPurchaseStates.waiting_for_faculty, menu='faculty_menu')
+
+
+def choose_faculty(user_id, user, data):
+    """
+    :param data: callback_data вида faculty_<ключ FACULTIES>
+    """
+    if not user:
+        logger.warning(f"Пользователь {user_id} не найден при выборе факультета.")
+        return Reply(alert=ERROR_RESTART, delete_state=True)
+    faculty = FACULTIES.get(data.split('faculty_', 1)[-1])
+    if not faculty:
+        logger.error(f"Неизвестный факультет выбран пользователем {user_id}: {data}")
+        return Reply(alert="Неизвестный факультет.")
+    user.faculty = intern_value(faculty)
+    mark_dirty(user)
+    logger.info(f"Пользователь {user_id} установил факультет: {faculty}.")
+    return Reply(state=TicketPurchaseStates.waiting_for_info_source, menu='info_source_menu')
+
+
+def choose_info_source(user_id, user, data):
+    """
+    :param data: callback_data вида info_source_<ключ INFO_SOURCES>
+    """
+    if not user:
+        logger.warning(f"Пользователь {user_id} не найден при выборе источника информации.")
+        return Reply(alert=ERROR_RESTART, delete_state=True)
+    source = INFO_SOURCES.get(data.split('info_source_', 1)[-1])
+    if not source:
+        logger.error(f"Неизвестный источник информации выбран пользователем {user_id}: {data}")
+        return Reply(alert="Неизвестный источник информации.")
+    user.info_source = intern_value(source)
+    mark_dirty(user)
+    logger.info(f"Пользователь {user_id} установил источник информации: {source}.")
+    user_data = {
+        'name': user.name,
+        'university': user.university,
+        'faculty': user.faculty,
+        'info_source': user.info_source
+    }
+    return Reply(state=TicketPurchaseStates.waiting_for_confirmation, menu='confirmation_menu', user_data=user_data)
+
+
+def confirm(user_id, user, data):
+    """
+    :param data: 'confirm_yes' или 'confirm_no'
+    """
+    if not user:
+        logger.warning(f"Пользователь {user_id} не найден при подтверждении данных.")
+        return Reply(alert=ERROR_RESTART, delete_state=True)
+    if data == 'confirm_yes':
+        user.is_registered = True
+        mark_dirty(user)
+        logger.info(f"Пользователь {user_id} подтвердил данные и зарегистрировался.")
+        return Reply(delete_state=True, menu='main_menu_registered')
+    if data == 'confirm_no':
+        logger.info(f"Пользователь {user_id} отказался от подтверждения данных. Начинаем заново.")
+        return Reply(state=TicketPurchaseStates.waiting_for_name, text=TEXTS['enter_name_text'])
+    logger.error(f"Неизвестная команда подтверждения от пользователя {user_id}: {data}")
+    return Reply(alert="Неизвестная команда.")
+
+
+def change_data(user_id, user):
+    """
+    Сброс данных зарегистрированного пользователя и повторный ввод начиная с ФИО.
+
+    :param user_id: ID пользователя
+    :param user: Объект User или None, если пользователь не найден
+    """
+    if not user:
+        logger.warning(f"Пользователь {user_id} не найден при попытке изменить данные.")
+        return Reply(alert=ERROR_RESTART)
+    user.name = None
+    user.university = None
+    user.faculty = None
+    user.is_registered = False
+    mark_dirty(user)
+    logger.info(f"Пользователь {user_id} сбросил свои данные для обновления.")
+    return Reply(state=TicketPurchaseStates.waiting_for_name,
+                 text="Давайте обновим ваши данные. Пожалуйста, напишите свое ФИО.")
+
+
+def payment_checked(user_id, count):
+    """
+    :param count: Результат PaymentIndex.confirm
+    """
+    if count is None:
+        logger.warning(f"Пользователь {user_id} не найден в списке валидных оплат.")
+        return Reply(menu='payment_error_menu')
+    logger.info(f"Пользователь {user_id} подтвердил оплату. Обновленный счетчик: {count}.")
+    return Reply(menu='payment_success_menu')
@@ -0,0 +1,234 @@
+"""
+Отчёт сверки: секции, постраничный вывод и выгрузка в файл.
+
+DataMatcher.match_data возвращает ReconciliationReport, а не готовую строку.
+Отчёт отдаёт секции генератором, строки секций тоже порождаются лениво:
+небольшой отчёт разбивается на HTML-страницы в пределах лимита Telegram
+с кнопками навигации, большой построчно пишется во временный CSV или HTML
+файл и отправляется документом, не собираясь целиком в памяти.
+"""
+import csv
+import html
+import re
+import tempfile
+import threading
+from collections import OrderedDict, namedtuple
+from pathlib import Path
+
+from telebot import types
+
+from config import REPORT_PAGES_KEEP
+
+# Лимит Telegram на длину текста сообщения
+MESSAGE_LIMIT = 4096
+# Запас на заголовок страницы «Схожести — стр. N/M»
+PAGE_LIMIT = MESSAGE_LIMIT - 96
+REPORT_CALLBACK_PREFIX = 'report:'
+REPORT_DOCUMENT_FORMATS = ('csv', 'html')
+_PARTIAL_ENTITY = re.compile(r'&[^;\s]*$')
+
+# rows — итератор кортежей; для fuzzy: (имя из таблицы, имя из JSON, схожесть), для остальных: (имя,)
+Section = namedtuple('Section', ['key', 'title', 'rows'])
+
+
+class ReconciliationReport:
+    """
+    Результат сверки JSON со списком гостей и Google Таблицы.
+
+    :param fuzzy_matches: Список (имя из таблицы, имя из JSON, схожесть)
+    :param missing_in_sheet: Имена из JSON, которых нет в таблице
+    :param missing_in_json: Имена из таблицы, которых нет в JSON
+    :param latin_or_special: Имена на латинице или со спец. символами
+    """
+
+    def __init__(self, fuzzy_matches, missing_in_sheet, missing_in_json, latin_or_special):
+        self.fuzzy_matches = fuzzy_matches
+        self.missing_in_sheet = missing_in_sheet
+        self.missing_in_json = missing_in_json
+        self.latin_or_special = latin_or_special
+
+    @property
+    def is_empty(self):
+        return not (self.fuzzy_matches or self.missing_in_sheet or self.missing_in_json or self.latin_or_special)
+
+    def sections(self):
+        """
+        Генератор непустых секций отчёта.
+        """
+        if self.fuzzy_matches:
+            yield Section('fuzzy', 'Нечеткие совпадения', iter(self.fuzzy_matches))
+        if self.missing_in_sheet:
+            yield Section('missing_in_sheet', 'Отсутствуют в Google Таблице',
+                          ((name,) for name in self.missing_in_sheet))
+        if self.missing_in_json:
+            yield Section('missing_in_json', 'Отсутствуют в JSON', ((name,) for name in self.missing_in_json))
+        if self.latin_or_special:
+            yield Section('latin_or_special', 'На латинице или со спец. символами',
+                          ((name,) for name in self.latin_or_special))
+
+    def text_length(self):
+        """
+        Длина отчёта в HTML-строках без сборки самого текста.
+        """
+        return sum(
+            len(section.title) + 8 + sum(len(line) + 1 for line in html_lines(section))
+            for section in self.sections()
+        )
+
+    def __repr__(self):
+        return (f"<ReconciliationReport: нечетких {len(self.fuzzy_matches)}, "
+                f"нет в таблице {len(self.missing_in_sheet)}, нет в JSON {len(self.missing_in_json)}, "
+                f"латиница {len(self.latin_or_special)}>")
+
+
+def html_lines(section):
+    """
+    Строки секции для сообщения Telegram (HTML, имена экранированы).
+    """
+    if section.key == 'fuzzy':
+        for sheet_name, json_name, similarity in section.rows:
+            yield (f"{html.escape(sheet_name)} (из таблицы) похоже на {html.escape(json_name)} (из JSON) "
+                   f"с схожестью {similarity}%")
+    else:
+        for (name,) in section.rows:
+            yield html.escape(name)
+
+
+def _fit(line, limit):
+    if len(line) <= limit:
+        return line
+    # Обрезанная строка не должна заканчиваться половиной HTML-сущности
+    return _PARTIAL_ENTITY.sub('', line[:limit - 1]) + '…'
+
+
+def paginate(sections, limit=PAGE_LIMIT):
+    """
+    Разбивает секции на страницы не длиннее limit символов.
+
+    Секция, не поместившаяся на страницу, продолжается на следующей
+    с пометкой «(продолжение)».
+
+    :param sections: Итерируемое Section
+    :return: Генератор текстов страниц
+    """
+    page = []
+    size = 0
+    for section in sections:
+        header = f"<b>{section.title}:</b>"
+        continued = f"<b>{section.title} (продолжение):</b>"
+        first = True
+        for line in html_lines(section):
+            line = _fit(line, limit - len(continued) - 1)
+            chunk = f"{header}\n{line}" if first else line
+            if first and page:
+                # Пустая строка между секциями
+                chunk = '\n' + chunk
+            if page and size + len(chunk) + 1 > limit:
+                yield '\n'.join(page)
+                page, size = [], 0
+                chunk = f"{header if first else continued}\n{line}"
+            page.append(chunk)
+            size += len(chunk) + 1
+            first = False
+    if page:
+        yield '\n'.join(page)
+
+
+def write_document(report, fmt='csv'):
+    """
+    Построчно пишет отчёт во временный файл.
+
+    :param report: ReconciliationReport
+    :param fmt: 'csv' или 'html'
+    :return: Path к файлу; удалить его должен вызывающий
+    """
+    if fmt not in REPORT_DOCUMENT_FORMATS:
+        raise ValueError(f"Неизвестный формат отчёта: {fmt}. Допустимые: {', '.join(REPORT_DOCUMENT_FORMATS)}")
+    # utf-8-sig — чтобы Excel открыл CSV с кириллицей без перекодировки
+    encoding = 'utf-8-sig' if fmt == 'csv' else 'utf-8'
+    with tempfile.NamedTemporaryFile('w', encoding=encoding, newline='', prefix='reconciliation_',
+                                     suffix=f'.{fmt}', delete=False) as f:
+        if fmt == 'csv':
+            writer = csv.writer(f)
+            writer.writerow(['Раздел', 'Имя', 'Похоже на', 'Схожесть, %'])
+            for section in report.sections():
+                for row in section.rows:
+                    writer.writerow((section.title,) + tuple(row) if section.key == 'fuzzy'
+                                    else (section.title, row[0], '', ''))
+        else:
+            f.write('<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>Сверка гостей</title></head>\n'
+                    '<body>\n')
+            for section in report.sections():
+                f.write(f'<h2>{html.escape(section.title)}</h2>\n<table border="1" cellpadding="4">\n')
+                if section.key == 'fuzzy':
+                    f.write('<tr><th>Из таблицы</th><th>Из JSON</th><th>Схожесть, %</th></tr>\n')
+                for row in section.rows:
+                    f.write('<tr>' + ''.join(f'<td>{html.escape(str(value))}</td>' for value in row) + '</tr>\n')
+                f.write('</table>\n')
+            f.write('</body></html>\n')
+    return Path(f.name)
+
+
+class ReportPages:
+    """
+    Страницы последних отчётов для кнопок навигации.
+
+    :param keep: Сколько отчётов хранить (старые вытесняются)
+    """
+
+    def __init__(self, keep=REPORT_PAGES_KEEP):
+        self.keep = keep
+        self._reports = OrderedDict()
+        self._lock = threading.Lock()
+        self._next_id = 1
+
+    def add(self, pages):
+        """
+        :param pages: Список текстов страниц
+        :return: Идентификатор отчёта для callback_data
+        """
+        with self._lock:
+            report_id = self._next_id
+            self._next_id += 1
+            self._reports[report_id] = list(pages)
+            while len(self._reports) > self.keep:
+                self._reports.popitem(last=False)
+        return report_id
+
+    def render(self, report_id, index):
+        """
+        Текст страницы с заголовком и клавиатура навигации.
+
+        :return: (text, InlineKeyboardMarkup) или None, если отчёт уже вытеснен
+        """
+        with self._lock:
+            pages = self._reports.get(report_id)
+        if pages is None:
+            return None
+        index = max(0, min(index, len(pages) - 1))
+        text = f"<b>Схожести</b> — стр. {index + 1}/{len(pages)}\n\n{pages[index]}"
+        if len(pages) == 1:
+            return text, None
+        keyboard = types.InlineKeyboardMarkup()
+        buttons = []
+        if index > 0:
+            buttons.append(types.InlineKeyboardButton('◀', callback_data=f'{REPORT_CALLBACK_PREFIX}{report_id}:{index - 1}'))
+        buttons.append(types.InlineKeyboardButton(f'{index + 1}/{len(pages)}',
+                                                  callback_data=f'{REPORT_CALLBACK_PREFIX}{report_id}:noop'))
+        if index < len(pages) - 1:
+            buttons.append(types.InlineKeyboardButton('▶', callback_data=f'{REPORT_CALLBACK_PREFIX}{report_id}:{index + 1}'))
+        keyboard.row(*buttons)
+        return text, keyboard
+
+
+def parse_page_callback(data):
+    """
+    Разбирает callback_data кнопки навигации.
+
+    :return: (report_id, номер страницы или None для кнопки-счётчика) или None при неверном формате
+    """
+    try:
+        report_id, page = data[len(REPORT_CALLBACK_PREFIX):].split(':')
+        return int(report_id), None if page == 'noop' else int(page)
+    except ValueError:
+        return None
@@ -0,0 +1,244 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+
+from telebot.asyncio_storage.base_storage import (
+    StateStorageBase as AsyncStateStorageBase,
+    StateDataContext as AsyncStateDataContext
+)
+from telebot.storage.base_storage import StateStorageBase, StateDataContext
+
+from config import STATES_DB_FILE, STATE_TTL_SECONDS, STATE_EVICT_INTERVAL, STATE_DB_CACHE_KB
+from logger import logger
+from metrics import timed
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS states (
+    key TEXT PRIMARY KEY,
+    state TEXT,
+    data TEXT NOT NULL DEFAULT '{}',
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_states_updated_at ON states (updated_at);
+"""
+
+# Устаревшими считаются только незавершённые шаги регистрации
+EVICTABLE_STATE_PATTERN = '%waiting\\_for\\_%'
+
+
+class SQLiteStateStorage(StateStorageBase):
+    """
+    Хранилище состояний telebot в SQLite.
+
+    Состояния переживают перезапуск бота, а в памяти держится только кэш
+    страниц SQLite ограниченного размера. Состояния waiting_for_*, которые
+    не менялись дольше ttl секунд, считаются брошенными: get_state их
+    не возвращает, а фоновый поток удаляет из базы.
+    """
+
+    def __init__(self, path=STATES_DB_FILE, ttl=STATE_TTL_SECONDS, evict_interval=STATE_EVICT_INTERVAL,
+                 cache_kb=STATE_DB_CACHE_KB, separator=':', prefix='telebot'):
+        super().__init__()
+        self.path = path
+        self.ttl = ttl
+        self.evict_interval = evict_interval
+        self.separator = separator
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        # Отрицательное значение — размер кэша в килобайтах
+        self._connection.execute(f'PRAGMA cache_size=-{int(cache_kb)}')
+        self._connection.executescript(SCHEMA)
+        self._stop_event = threading.Event()
+        self._evictor = None
+
+    def _key(self, chat_id, user_id, business_connection_id=None, message_thread_id=None, bot_id=None):
+        return self._get_key(chat_id, user_id, self.prefix, self.separator,
+                             business_connection_id, message_thread_id, bot_id)
+
+    def _is_expired(self, state, updated_at, now):
+        return (self.ttl and state and 'waiting_for_' in state
+                and updated_at < now - self.ttl)
+
+    @timed('state_set', 'storage')
+    def set_state(self, chat_id, user_id, state, business_connection_id=None, message_thread_id=None, bot_id=None):
+        if hasattr(state, 'name'):
+            state = state.name
+        key = self._key(chat_id, user_id, business_connection_id, message_thread_id, bot_id)
+        with self._lock:
+            self._connection.execute(
+                "INSERT INTO states (key, state, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at",
+                (key, state, time.time())
+            )
+        return True
+
+    @timed('state_get', 'storage')
+    def get_state(self, chat_id, user_id, business_connection_id=None, message_thread_id=None, bot_id=None):
+        key = self._key(chat_id, user_id, business_connection_id, message_thread_id, bot_id)
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT state, updated_at FROM states WHERE key = ?', (key,)
+            ).fetchone()
+        if row is None or self._is_expired(row[0], row[1], time.time()):
+            return None
+        return row[0]
+
+    @timed('state_delete', 'storage')
+    def delete_state(self, chat_id, user_id, business_connection_id=None, message_thread_id=None, bot_id=None):
+        key = self._key(chat_id, user_id, business_connection_id, message_thread_id, bot_id)
+        with self._lock:
+            cursor = self._connection.execute('DELETE FROM states WHERE key = ?', (key,))
+        return cursor.rowcount > 0
+
+    @timed('state_set_data', 'storage')
+    def set_data(self, chat_id, user_id, key, value, business_connection_id=None, message_thread_id=None,
+                 bot_id=None):
+        state_key = self._key(chat_id, user_id, business_connection_id, message_thread_id, bot_id)
+        with self._lock:
+            row = self._connection.execute('SELECT data FROM states WHERE key = ?', (state_key,)).fetchone()
+            if row is None:
+                raise RuntimeError(f"SQLiteStateStorage: key {state_key} does not exist.")
+            data = json.loads(row[0])
+            data[key] = value
+            self._connection.execute(
+                'UPDATE states SET data = ?, updated_at = ? WHERE key = ?',
+                (json.dumps(data, ensure_ascii=False), time.time(), state_key)
+            )
+        return True
+
+    @timed('state_get_data', 'storage')
+    def get_data(self, chat_id, user_id, business_connection_id=None, message_thread_id=None, bot_id=None):
+        key = self._key(chat_id, user_id, business_connection_id, message_thread_id, bot_id)
+        with self._lock:
+            row = self._connection.execute('SELECT data FROM states WHERE key = ?', (key,)).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def reset_data(self, chat_id, user_id, business_connection_id=None, message_thread_id=None, bot_id=None):
+        return self.save(chat_id, user_id, {}, business_connection_id, message_thread_id, bot_id)
+
+    def get_interactive_data(self, chat_id, user_id, business_connection_id=None, message_thread_id=None,
+                             bot_id=None):
+        return StateDataContext(self, chat_id=chat_id, user_id=user_id,
+                                business_connection_id=business_connection_id,
+                                message_thread_id=message_thread_id, bot_id=bot_id)
+
+    @timed('state_save', 'storage')
+    def save(self, chat_id, user_id, data, business_connection_id=None, message_thread_id=None, bot_id=None):
+        key = self._key(chat_id, user_id, business_connection_id, message_thread_id, bot_id)
+        with self._lock:
+            cursor = self._connection.execute(
+                'UPDATE states SET data = ?, updated_at = ? WHERE key = ?',
+                (json.dumps(data, ensure_ascii=False), time.time(), key)
+            )
+        return cursor.rowcount > 0
+
+    def evict_expired(self):
+        """
+        Удаляет брошенные состояния waiting_for_*.
+
+        :return: Количество удалённых записей
+        """
+        if not self.ttl:
+            return 0
+        with self._lock:
+            cursor = self._connection.execute(
+                "DELETE FROM states WHERE updated_at < ? AND state LIKE ? ESCAPE '\\'",
+                (time.time() - self.ttl, EVICTABLE_STATE_PATTERN)
+            )
+        if cursor.rowcount:
+            logger.info(f"Удалено брошенных состояний регистрации: {cursor.rowcount}.")
+        return cursor.rowcount
+
+    def count(self):
+        with self._lock:
+            return self._connection.execute('SELECT COUNT(*) FROM states').fetchone()[0]
+
+    def start_evictor(self):
+        """
+        Запускает фоновое удаление брошенных состояний.
+        """
+        if self._evictor is not None:
+            return
+        self._evictor = threading.Thread(target=self._evict_loop, name='states-evictor', daemon=True)
+        self._evictor.start()
+
+    def _evict_loop(self):
+        while not self._stop_event.wait(self.evict_interval):
+            try:
+                self.evict_expired()
+            except sqlite3.Error as e:
+                logger.error(f"Ошибка при удалении устаревших состояний: {e}")
+
+    def stop(self):
+        self._stop_event.set()
+        if self._evictor is not None:
+            self._evictor.join()
+        with self._lock:
+            self._connection.close()
+
+    def __str__(self):
+        return f"<SQLiteStateStorage: {self.path}>"
+
+
+class AsyncSQLiteStateStorage(AsyncStateStorageBase):
+    """
+    Асинхронная обёртка SQLiteStateStorage для AsyncTeleBot.
+
+    Запросы к базе выполняются в пуле потоков, чтобы не блокировать цикл событий.
+    """
+
+    def __init__(self, storage=None):
+        super().__init__()
+        self.storage = storage or SQLiteStateStorage()
+
+    async def set_state(self, chat_id, user_id, state, business_connection_id=None, message_thread_id=None,
+                        bot_id=None):
+        return await asyncio.to_thread(self.storage.set_state, chat_id, user_id, state,
+                                       business_connection_id, message_thread_id, bot_id)
+
+    async def get_state(self, chat_id, user_id, business_connection_id=None, message_thread_id=None, bot_id=None):
+        return await asyncio.to_thread(self.storage.get_state, chat_id, user_id,
+                                       business_connection_id, message_thread_id, bot_id)
+
+    async def delete_state(self, chat_id, user_id, business_connection_id=None, message_thread_id=None,
+                           bot_id=None):
+        return await asyncio.to_thread(self.storage.delete_state, chat_id, user_id,
+                                       business_connection_id, message_thread_id, bot_id)
+
+    async def set_data(self, chat_id, user_id, key, value, business_connection_id=None, message_thread_id=None,
+                       bot_id=None):
+        return await asyncio.to_thread(self.storage.set_data, chat_id, user_id, key, value,
+                                       business_connection_id, message_thread_id, bot_id)
+
+    async def get_data(self, chat_id, user_id, business_connection_id=None, message_thread_id=None, bot_id=None):
+        return await asyncio.to_thread(self.storage.get_data, chat_id, user_id,
+                                       business_connection_id, message_thread_id, bot_id)
+
+    async def reset_data(self, chat_id, user_id, business_connection_id=None, message_thread_id=None,
+                         bot_id=None):
+        return await asyncio.to_thread(self.storage.reset_data, chat_id, user_id,
+                                       business_connection_id, message_thread_id, bot_id)
+
+    def get_interactive_data(self, chat_id, user_id, business_connection_id=None, message_thread_id=None,
+                             bot_id=None):
+        return AsyncStateDataContext(self, chat_id=chat_id, user_id=user_id,
+                                     business_connection_id=business_connection_id,
+                                     message_thread_id=message_thread_id, bot_id=bot_id)
+
+    async def save(self, chat_id, user_id, data, business_connection_id=None, message_thread_id=None, bot_id=None):
+        return await asyncio.to_thread(self.storage.save, chat_id, user_id, data,
+                                       business_connection_id, message_thread_id, bot_id)
+
+    def start_evictor(self):
+        self.storage.start_evictor()
+
+    def stop(self):
+        self.storage.stop()
+
+    def __str__(self):
+        return f"<AsyncSQLiteStateStorage: {self.storage.path}>"
@@ -1,21 +1,264 @@
 import json
 import os
-from config import USERS_DATA_FILE, VALID_PAYMENTS_FILE
+import threading
+from config import (
+    USERS_DATA_FILE,
+    USERS_JOURNAL_FILE,
+    USERS_JOURNAL_COMPACT_THRESHOLD,
+    USERS_STORAGE_BACKEND,
+    USERS_FLUSH_INTERVAL_MS,
+    USERS_FLUSH_MAX_BATCH,
+    VALID_PAYMENTS_FILE
+)
 from models import User
-import logger 
-def load_users():
+from logger import logger
+from write_behind import WriteBehindFlusher
+from metrics import timed
+
+# Журнал, который в данный момент сворачивается в снимок
+USERS_JOURNAL_COMPACTING_FILE = USERS_JOURNAL_FILE.with_name(USERS_JOURNAL_FILE.name + '.compacting')
+
+_journal_lock = threading.Lock()
+_compaction_lock = threading.Lock()
+# Последнее записанное на диск состояние каждого пользователя (user_id -> to_dict())
+_persisted = {}
+_journal_records = 0
+
+
+def _replay_journal(path, data):
+    """
+    Применяет записи журнала к словарю данных снимка.
+
+    :param path: Путь к файлу журнала
+    :param data: Словарь {str(user_id): dict} для обновления
+    :return: Количество применённых записей
+    """
+    applied = 0
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                    user_id = record['id']
+                    fields = record['f']
+                except (json.JSONDecodeError, KeyError, TypeError) as e:
+                    # Оборванная запись (например, после аварийного завершения) пропускается
+                    logger.warning(f"Пропущена повреждённая запись журнала {path}:{line_number}: {e}")
+                    continue
+                data.setdefault(str(user_id), {'user_id': user_id}).update(fields)
+                applied += 1
+    except FileNotFoundError:
+        pass
+    return applied
+
+
+def load_json_users():
+    global _journal_records
     try:
         with open(USERS_DATA_FILE, 'r', encoding='utf-8') as f:
             data = json.load(f)
-            return {int(user_id): User.from_dict(user_data) for user_id, user_data in data.items()}
     except (FileNotFoundError, json.JSONDecodeError) as e:
         logger.error(f"Ошибка при загрузке пользователей: {e}")
-        return {}
+        data = {}
+
+    # Сначала незавершённое сворачивание, затем текущий журнал
+    applied = _replay_journal(USERS_JOURNAL_COMPACTING_FILE, data)
+    applied += _replay_journal(USERS_JOURNAL_FILE, data)
+
+    with _journal_lock:
+        _persisted.clear()
+        _persisted.update({int(user_id): dict(user_data) for user_id, user_data in data.items()})
+        _journal_records = applied
+    return {int(user_id): User.from_dict(user_data) for user_id, user_data in data.items()}
+
 
+def _append_changes(users):
+    """
+    Дописывает в журнал изменившиеся поля переданных пользователей.
+
+    :param users: Итерируемый набор объектов User
+    """
+    global _journal_records
+    with _journal_lock:
+        lines = []
+        for user in users:
+            current = user.to_dict()
+            previous = _persisted.get(user.user_id)
+            if previous is None:
+                changes = current
+            else:
+                changes = {key: value for key, value in current.items() if previous.get(key) != value}
+            if not changes:
+                continue
+            lines.append(json.dumps({'id': user.user_id, 'f': changes}, ensure_ascii=False, separators=(',', ':')))
+            _persisted[user.user_id] = current
+
+        if not lines:
+            return
+        with open(USERS_JOURNAL_FILE, 'a', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        _journal_records += len(lines)
+        needs_compaction = _journal_records >= USERS_JOURNAL_COMPACT_THRESHOLD
+
+    if needs_compaction:
+        _start_background_compaction()
+
+
+def load_users():
+    if USERS_STORAGE_BACKEND == 'sqlite':
+        import user_db
+        return user_db.load_users()
+    return load_json_users()
+
+
+def save_user(user):
+    if USERS_STORAGE_BACKEND == 'sqlite':
+        import user_db
+        user_db.save_user(user)
+        return
+    _append_changes((user,))
+
+
+@timed('save_users', 'storage')
 def save_users(users):
-    with open(USERS_DATA_FILE, 'w', encoding='utf-8') as f:
-        data = {str(user_id): user.to_dict() for user_id, user in users.items()}
-        json.dump(data, f, ensure_ascii=False, indent=4)
+    if USERS_STORAGE_BACKEND == 'sqlite':
+        import user_db
+        user_db.save_users(users)
+        return
+    _append_changes(users.values())
+
+
+# Логические поля пользователя: в фильтрах рассылки '1'/'0' означают True/False
+BOOL_FIELDS = ('is_registered', 'is_payment_confirmed')
+
+
+def query_fields():
+    """
+    Поля, по которым активное хранилище умеет выбирать пользователей.
+    """
+    if USERS_STORAGE_BACKEND == 'sqlite':
+        import user_db
+        return user_db.QUERY_COLUMNS
+    return User.__slots__
+
+
+def iter_user_ids(**filters):
+    """
+    Отдаёт user_id подходящих пользователей по возрастанию.
+
+    SQLite читается страницами по первичному ключу; в JSON-хранилище все
+    записанные данные и так в памяти, сортируются только идентификаторы.
+
+    :param filters: Значения полей из query_fields()
+    """
+    if USERS_STORAGE_BACKEND == 'sqlite':
+        import user_db
+        yield from user_db.iter_user_ids(**filters)
+        return
+    with _journal_lock:
+        user_ids = sorted(
+            user_id for user_id, user_data in _persisted.items()
+            if all(user_data.get(key) == value for key, value in filters.items())
+        )
+    yield from user_ids
+
+
+def query_users(**filters):
+    """
+    Возвращает сохранённых пользователей, подходящих под фильтры.
+
+    В SQLite выборка идёт по индексам, в JSON-хранилище — перебором последних записанных данных.
+
+    :param filters: Значения полей, например is_registered=True, is_payment_confirmed=False
+    :return: Список объектов User
+    """
+    if USERS_STORAGE_BACKEND == 'sqlite':
+        import user_db
+        return user_db.query_users(**filters)
+    with _journal_lock:
+        matching = [
+            dict(user_data) for user_data in _persisted.values()
+            if all(user_data.get(key) == value for key, value in filters.items())
+        ]
+    return [User.from_dict(user_data) for user_data in matching]
+
+
+_flusher = WriteBehindFlusher(
+    save_batch=lambda batch: save_users(batch),
+    interval_ms=USERS_FLUSH_INTERVAL_MS,
+    max_batch=USERS_FLUSH_MAX_BATCH
+)
+
+
+def mark_dirty(user):
+    """
+    Помечает пользователя изменённым; запись выполнит фоновый поток.
+    """
+    _flusher.mark_dirty(user)
+
+
+def flush_users():
+    _flusher.flush()
+
+
+def flush_stats():
+    return _flusher.stats()
+
+
+def shutdown():
+    """
+    Принудительно записывает все отложенные изменения. Вызывается при завершении бота.
+    """
+    _flusher.stop()
+    logger.info(f"Отложенные изменения пользователей записаны: {_flusher.stats()}")
+
+
+def compact_journal():
+    """
+    Сворачивает журнал изменений в новый снимок users.json.
+
+    Журнал переименовывается под блокировкой, поэтому запись новых изменений
+    не ждёт, пока снимок сериализуется и пишется на диск.
+    """
+    global _journal_records
+    with _compaction_lock:
+        with _journal_lock:
+            if os.path.exists(USERS_JOURNAL_FILE):
+                if os.path.exists(USERS_JOURNAL_COMPACTING_FILE):
+                    # Предыдущее сворачивание не завершилось: дописываем к нему текущий журнал
+                    with open(USERS_JOURNAL_FILE, 'r', encoding='utf-8') as src, \
+                            open(USERS_JOURNAL_COMPACTING_FILE, 'a', encoding='utf-8') as dst:
+                        dst.write(src.read())
+                    os.remove(USERS_JOURNAL_FILE)
+                else:
+                    os.replace(USERS_JOURNAL_FILE, USERS_JOURNAL_COMPACTING_FILE)
+            elif not os.path.exists(USERS_JOURNAL_COMPACTING_FILE):
+                return
+            snapshot = {str(user_id): dict(user_data) for user_id, user_data in _persisted.items()}
+            _journal_records = 0
+
+        tmp_path = USERS_DATA_FILE.with_name(USERS_DATA_FILE.name + '.tmp')
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f, ensure_ascii=False, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, USERS_DATA_FILE)
+            os.remove(USERS_JOURNAL_COMPACTING_FILE)
+            logger.info(f"Журнал пользователей свёрнут в снимок ({len(snapshot)} пользователей).")
+        except OSError as e:
+            # Журнал остаётся на диске и будет применён при следующей загрузке
+            logger.error(f"Ошибка при сворачивании журнала пользователей: {e}")
+
+
+def _start_background_compaction():
+    if _compaction_lock.locked():
+        return
+    threading.Thread(target=compact_journal, name='users-journal-compaction', daemon=True).start()
+
 
 def load_valid_list():
     try:
@@ -30,4 +273,3 @@ def save_valid_list(valid_list):
             json.dump(valid_list, f, ensure_ascii=False, indent=4)
     except Exception as e:
         print(f"Ошибка при сохранении {VALID_PAYMENTS_FILE}: {e}")
-        
\ No newline at end of file
@@ -0,0 +1,37 @@
+"""
+Общая настройка тестов: данные и лог бота во временном каталоге.
+
+Модули бота читают config при импорте, поэтому каталог подменяется здесь,
+до импорта тестовых модулей.
+"""
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(ROOT_DIR), str(ROOT_DIR / 'benchmarks')]
+
+from load_test import isolate_data, isolate_log  # noqa: E402
+
+TMP_DIR = Path(tempfile.mkdtemp(prefix='bot_tests_'))
+isolate_data(TMP_DIR)
+isolate_log(TMP_DIR)
+
+
+@pytest.fixture
+def mock_api():
+    """
+    Заглушка Bot API, на которую направлены запросы telebot.
+    """
+    from telebot import apihelper, asyncio_helper
+    from mock_bot_api import MockBotAPI
+
+    api = MockBotAPI()
+    api.start()
+    api_urls = apihelper.API_URL, asyncio_helper.API_URL
+    apihelper.API_URL = asyncio_helper.API_URL = api.api_url
+    yield api
+    apihelper.API_URL, asyncio_helper.API_URL = api_urls
+    api.stop()
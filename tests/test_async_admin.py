@@ -0,0 +1,50 @@
+"""
+Команды администратора в асинхронном режиме.
+"""
+import asyncio
+import time
+
+from telebot import types
+
+from config import TARGET_USER_ID
+from test_registration_flow import _message
+
+ADMIN_ID = min(TARGET_USER_ID)
+RECIPIENT_ID = 3101
+
+
+def test_admin_commands_and_broadcast(mock_api):
+    import async_bot  # noqa: F401
+    import async_handlers
+
+    sent = []
+    mock_api.listener = lambda method, chat_id, params: sent.append((chat_id, params.get('text')))
+    commands = ['/metrics', '/profiles', '/shards', '/broadcast_status']
+
+    async def drive():
+        async_handlers.broadcast_outbound.attach(asyncio.get_running_loop())
+        updates = [_message(RECIPIENT_ID, '/start')]
+        updates += [_message(ADMIN_ID, command) for command in commands]
+        updates.append(_message(ADMIN_ID, f'/broadcast user_id={RECIPIENT_ID}\nНовость'))
+        for update_id, update in enumerate(updates, 1):
+            await async_handlers.bot.process_new_updates([types.Update.de_json(dict(update, update_id=update_id))])
+        # Рассылка идёт в своём потоке и отправляет через этот цикл событий
+        deadline = time.monotonic() + 5
+        while async_handlers.broadcaster.running and time.monotonic() < deadline:
+            await asyncio.sleep(0.02)
+        # Итог рассылки отправляется из её потока после завершения
+        while not any(text.startswith('Рассылка ') and 'завершена' in text
+                      for chat_id, text in sent if chat_id == ADMIN_ID) and time.monotonic() < deadline:
+            await asyncio.sleep(0.02)
+        await async_handlers.bot.close_session()
+
+    asyncio.run(drive())
+
+    admin_texts = [text for chat_id, text in sent if chat_id == ADMIN_ID]
+    assert admin_texts[0].startswith('Обновлений:')
+    assert admin_texts[1].startswith('Профилирование:')
+    assert 'без диспетчера' in admin_texts[2]
+    assert admin_texts[3] == 'Рассылок ещё не было.'
+    assert admin_texts[4].startswith('Рассылка запущена.')
+    assert 'Отправлено: 1\n' in admin_texts[5]
+    assert (RECIPIENT_ID, 'Новость') in sent
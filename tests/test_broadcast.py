@@ -0,0 +1,86 @@
+import json
+from concurrent.futures import Future
+
+import pytest
+
+import admin
+import user_db
+from broadcast import Broadcast, parse_filters
+from models import User
+
+
+def test_bool_conversion_only_for_bool_fields():
+    fields = ('is_registered', 'university', 'user_id')
+    assert parse_filters(['is_registered=1', 'university=1', 'user_id=1'], fields) == {
+        'is_registered': True, 'university': '1', 'user_id': 1
+    }
+    with pytest.raises(ValueError):
+        parse_filters(['is_registered=maybe'], fields)
+
+
+def test_fields_outside_backend_are_rejected():
+    with pytest.raises(ValueError, match='name'):
+        parse_filters(['name=Иван'], user_db.QUERY_COLUMNS)
+
+
+def test_sqlite_user_ids_are_streamed_in_order():
+    users = {}
+    for user_id in (50, 7, 31, 12, 44, 3, 28):
+        user = User(user_id, f'user{user_id}', 'U')
+        user.is_registered = user_id % 2 == 0
+        users[user_id] = user
+    user_db.save_users(users)
+
+    assert list(user_db.iter_user_ids(batch_size=2, is_registered=True)) == [12, 28, 44, 50]
+    assert list(user_db.iter_user_ids(batch_size=3)) == [3, 7, 12, 28, 31, 44, 50]
+
+
+class _InstantOutbound:
+    def __init__(self):
+        self.sent = []
+
+    def send_message(self, chat_id, text, **kwargs):
+        self.sent.append(chat_id)
+        future = Future()
+        future.set_result(None)
+        return future
+
+
+def _resume(tmp_path, log, recipients):
+    state_path, log_path = tmp_path / 'broadcast.json', tmp_path / 'broadcast.log'
+    state_path.write_text(json.dumps({'id': '1', 'admin_id': 1, 'text': 'Новость', 'filters': {}}), encoding='UTF-8')
+    log_path.write_bytes(log)
+    outbound = _InstantOutbound()
+    broadcaster = Broadcast(outbound, state_path=state_path, log_path=log_path)
+    broadcaster.recipients = recipients
+    finished = []
+    assert broadcaster.resume(on_finish=lambda job, report: finished.append(report))
+    broadcaster._thread.join(timeout=5)
+    return outbound, finished[0], state_path, log_path
+
+
+def test_resume_skips_damaged_log_lines(tmp_path):
+    # Строка «S 3» оборвалась при сбое: возможно, это был «S 31»
+    outbound, report, state_path, log_path = _resume(
+        tmp_path, b'S 1\nD 1\n\xff\xfe garbage\nS 2\nS 3', lambda filters: iter([1, 2, 3, 4])
+    )
+
+    assert outbound.sent == [3, 4]
+    assert (report['skipped'], report['uncertain'], report['sent'], report['error']) == (2, 1, 2, None)
+    assert not state_path.exists()
+    assert log_path.read_bytes().endswith(b'S 2\nS 3\nD 3\nS 4\nD 4\n')
+
+
+def test_failure_is_reported_and_job_is_kept(tmp_path):
+    def recipients(filters):
+        yield 1
+        raise RuntimeError('хранилище недоступно')
+
+    outbound, report, state_path, _ = _resume(tmp_path, b'', recipients)
+
+    assert outbound.sent == [1]
+    assert report['error'] == 'хранилище недоступно'
+    assert not report['running']
+    # Задание остаётся для продолжения после перезапуска
+    assert state_path.exists()
+    assert admin.broadcast_finished({'id': '1'}, report).startswith('Рассылка 1 прервана')
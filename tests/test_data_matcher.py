@@ -0,0 +1,116 @@
+import json
+
+import pytest
+
+import data_matcher
+import reconciliation
+from data_matcher import DataMatcher
+from metrics import OPERATION_SECONDS
+
+HEADERS = ['№', 'Фамилия', 'Имя', 'Отчество', 'ВУЗ', 'Деньги', 'Билет', 'Способ', 'Дата']
+
+
+class FakeWorksheet:
+    def __init__(self, records):
+        self.records = records
+        self.reads = 0
+
+    def get_all_records(self):
+        self.reads += 1
+        return [dict(record) for record in self.records]
+
+
+class FakeSpreadsheet:
+    def __init__(self, worksheets, revision):
+        self.worksheets = worksheets
+        self.revision = revision
+
+    def get_lastUpdateTime(self):
+        return self.revision
+
+    def worksheet(self, name):
+        return self.worksheets[name]
+
+
+class FakeSheetsClient:
+    """
+    Подделка клиента gspread: open_by_key, get_lastUpdateTime и worksheet().get_all_records().
+    """
+
+    def __init__(self, sheet_id, spreadsheet):
+        self.spreadsheets = {sheet_id: spreadsheet}
+
+    def open_by_key(self, key):
+        return self.spreadsheets[key]
+
+
+def _row(number, last_name, first_name, middle_name):
+    return dict(zip(HEADERS, [number, last_name, first_name, middle_name, 'МГУ', 1000, 'да', 'карта', '01.10']))
+
+
+@pytest.fixture
+def matcher_factory(tmp_path):
+    guests = {
+        'ivanov': [1, 'Иванов', 'Иван', 'Иванович'],
+        'aleshin': [2, 'Алешин', 'Алексей', 'Алексеевич'],
+        'petrov': [3, 'Петров', 'Петр', 'Петрович'],
+        'sidorov': [4, 'Сидоров', 'Сидор', 'Сидорович'],
+    }
+    json_path = tmp_path / 'guests.json'
+    json_path.write_text(json.dumps(guests, ensure_ascii=False), encoding='utf-8')
+    worksheet = FakeWorksheet([
+        _row(1, 'Иванов', 'Иван', 'Иванович'),
+        # ё и лишние пробелы убираются нормализацией
+        _row(2, 'Алёшин', 'Алексей ', 'Алексеевич'),
+        _row(3, 'Петров', 'Петр', 'Петровичь'),
+        _row(4, 'Smith', 'John', 'Junior'),
+    ])
+    client = FakeSheetsClient('sheet-id', FakeSpreadsheet({'Гости': worksheet}, '2026-10-01T12:00:00Z'))
+
+    def make():
+        return DataMatcher(str(json_path), 'credentials.json', 'sheet-id', 'Гости', client=client,
+                           snapshot_path=str(tmp_path / 'snapshot.json'), state_path=str(tmp_path / 'state.json'))
+
+    make.worksheet = worksheet
+    make.client = client
+    make.json_path = json_path
+    return make
+
+
+def test_match_data_sections(matcher_factory):
+    matcher = matcher_factory()
+    matcher.load_json()
+    matcher.connect_to_google_sheets()
+    report = matcher.match_data()
+
+    assert report.fuzzy_matches == [('петров петр петровичь', 'петров петр петрович', 98)]
+    assert report.missing_in_sheet == ['петров петр петрович', 'сидоров сидор сидорович']
+    assert report.missing_in_json == ['петров петр петровичь', 'smith john junior']
+    assert report.latin_or_special == ['smith john junior']
+    assert [section.key for section in report.sections()] == ['fuzzy', 'missing_in_sheet', 'missing_in_json',
+                                                              'latin_or_special']
+
+
+def test_unchanged_sheet_uses_snapshot_and_state(matcher_factory):
+    first = matcher_factory().run()
+    matcher = matcher_factory()
+    second = matcher.run()
+
+    # Ревизия не изменилась — таблица не перечитывается, строки не нормализуются заново
+    assert matcher_factory.worksheet.reads == 1
+    assert matcher.normalized_rows == 0
+    assert vars(second) == vars(first)
+
+
+def test_run_reconciliation_is_timed(matcher_factory, monkeypatch):
+    monkeypatch.setattr(reconciliation, 'JSON_FILE_PATH', matcher_factory.json_path)
+    monkeypatch.setattr(reconciliation, 'GOOGLE_SHEET_ID', 'sheet-id')
+    monkeypatch.setattr(reconciliation, 'GOOGLE_SHEET_NAME', 'Гости')
+    monkeypatch.setattr(reconciliation, '_cached_fingerprint', None)
+    monkeypatch.setattr(data_matcher, 'get_sheets_client', lambda credentials_path: matcher_factory.client)
+    before = OPERATION_SECONDS.series().get(('data_matcher_run',), (None, 0.0, 0))[2]
+
+    report = reconciliation.submit_reconciliation().result(timeout=10)
+
+    assert report.latin_or_special == ['smith john junior']
+    assert OPERATION_SECONDS.series()[('data_matcher_run',)][2] == before + 1
@@ -0,0 +1,43 @@
+import threading
+import time
+from collections import Counter
+
+import telebot
+
+from dispatcher import ShardedDispatcher
+
+
+def _message_update(user_id, text):
+    return {'message': {
+        'message_id': 1,
+        'date': int(time.time()),
+        'chat': {'id': user_id, 'type': 'private'},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}'},
+        'text': text,
+    }}
+
+
+def test_polling_does_not_refetch_queued_updates(mock_api):
+    bot = telebot.TeleBot('123:TEST', threaded=False)
+    handled = Counter()
+    lock = threading.Lock()
+    release = threading.Event()
+
+    @bot.message_handler(func=lambda message: True)
+    def handle(message):
+        # Обновления остаются в очередях диспетчера, пока идёт следующий getUpdates
+        release.wait(5)
+        with lock:
+            handled[message.text] += 1
+
+    dispatcher = ShardedDispatcher.install(bot, shards=2, queue_size=10)
+    for user_id in (1, 2, 3, 4):
+        mock_api.push_update(_message_update(user_id, f'text {user_id}'))
+
+    for _ in range(2):
+        bot._TeleBot__retrieve_updates(timeout=2, long_polling_timeout=0)
+    release.set()
+    dispatcher.stop()
+
+    assert bot.last_update_id == 4
+    assert handled == Counter({f'text {user_id}': 1 for user_id in (1, 2, 3, 4)})
@@ -0,0 +1,87 @@
+import asyncio
+
+import metrics
+from metrics import HANDLER_COMPONENT_SECONDS, HANDLER_OUTBOUND_SECONDS, Histogram, track_handler
+from outbound import AsyncOutbound, OutboundQueue
+
+
+def test_quantile_interpolates_inside_bucket():
+    histogram = Histogram('test_seconds', 'Тест', buckets=(1.0, 2.0, 4.0))
+    for value in (0.5, 1.5, 1.5, 3.0):
+        histogram.observe(value)
+
+    assert histogram.quantile(0.5) == 1.5
+    assert histogram.quantile(0.25) == 1.0
+    assert histogram.quantile(1.0) == 4.0
+
+
+def test_quantile_edge_cases():
+    histogram = Histogram('test_seconds', 'Тест', ['handler'], buckets=(1.0, 2.0))
+    assert histogram.quantile(0.5, 'missing') is None
+
+    # Значения выше последней границы оцениваются этой границей, как в Prometheus
+    histogram.observe(10.0, 'slow')
+    assert histogram.quantile(0.95, 'slow') == 2.0
+
+
+def test_histogram_render():
+    histogram = Histogram('test_seconds', 'Тест', ['handler'], buckets=(1.0, 2.0))
+    histogram.observe(0.5, 'a"b')
+    histogram.observe(1.5, 'a"b')
+    histogram.observe(3.0, 'a"b')
+
+    assert histogram.render() == [
+        '# HELP test_seconds Тест',
+        '# TYPE test_seconds histogram',
+        'test_seconds_bucket{handler="a\\"b",le="1.0"} 1',
+        'test_seconds_bucket{handler="a\\"b",le="2.0"} 2',
+        'test_seconds_bucket{handler="a\\"b",le="+Inf"} 3',
+        'test_seconds_sum{handler="a\\"b"} 5.0',
+        'test_seconds_count{handler="a\\"b"} 3',
+    ]
+
+
+def test_render_includes_registry():
+    with track_handler('test:render'):
+        pass
+    text = metrics.render()
+
+    assert text.endswith('\n')
+    assert '# TYPE bot_handler_seconds histogram' in text
+    assert 'bot_handler_seconds_count{handler="test:render"} 1' in text
+    assert '# TYPE bot_handler_outbound_seconds histogram' in text
+    assert 'bot_start_time_seconds ' in text
+
+
+def test_queued_send_is_attributed_to_handler():
+    queue = OutboundQueue(bot=None, workers=1)
+    queue.start()
+    try:
+        with track_handler('test:queued'):
+            future = queue.submit(1, lambda: 'ok')
+        queue.submit(1, lambda: 'ok').result(timeout=5)
+        assert future.result(timeout=5) == 'ok'
+    finally:
+        queue.stop()
+
+    series = HANDLER_OUTBOUND_SECONDS.series()
+    assert series[('test:queued',)][2] == 1
+    # Отправка вне обработчика ни к какой метке не относится
+    assert (None,) not in series
+
+
+def test_async_send_counts_as_telegram_component():
+    outbound = AsyncOutbound()
+
+    async def send():
+        await asyncio.sleep(0.05)
+        return 'ok'
+
+    async def handle():
+        with track_handler('test:async'):
+            return await outbound.call(1, send)
+
+    assert asyncio.run(handle()) == 'ok'
+    _, telegram, count = HANDLER_COMPONENT_SECONDS.series()[('test:async', 'telegram')]
+    assert count == 1
+    assert telegram >= 0.05
@@ -0,0 +1,45 @@
+import asyncio
+
+import pytest
+
+from metrics import track_handler
+from profiling import Profiler, profiler
+
+
+def test_only_one_profile_at_a_time():
+    local = Profiler(mode='threshold', threshold_ms=0)
+    first = local.start()
+    assert first is not None
+    assert local.start() is None
+    local.finish(first, 'test:first', 0.01)
+
+    second = local.start()
+    assert second is not None
+    local.finish(second, 'test:second', 0.02)
+    assert [entry['label'] for entry in local.profiles()] == ['test:second', 'test:first']
+
+
+@pytest.mark.parametrize('sample_rate', [-0.1, 1.5, float('nan')])
+def test_sample_rate_is_validated(sample_rate):
+    local = Profiler(mode='sample', sample_rate=0.5)
+    with pytest.raises(ValueError):
+        local.configure('sample', sample_rate=sample_rate)
+    assert (local.mode, local.sample_rate) == ('sample', 0.5)
+
+
+def test_overlapping_coroutines_profile_one_update():
+    async def handle(label):
+        with track_handler(label):
+            await asyncio.sleep(0.02)
+
+    async def drive():
+        await asyncio.gather(handle('test:overlap_a'), handle('test:overlap_b'))
+
+    profiler.configure('threshold', threshold_ms=0)
+    try:
+        asyncio.run(drive())
+        labels = [entry['label'] for entry in profiler.profiles()]
+    finally:
+        profiler.configure('off')
+        profiler.clear()
+    assert labels == ['test:overlap_a']
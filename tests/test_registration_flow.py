@@ -0,0 +1,139 @@
+"""
+Один и тот же сценарий регистрации через синхронный и асинхронный боты.
+"""
+import asyncio
+import time
+
+import pytest
+from telebot import types
+
+import registration
+from config import TEXTS
+from menus import MENU_PLANS
+
+NAME = 'Иванов Иван'
+UNIVERSITY = 'МГУ'
+
+
+def _message(user_id, text):
+    return {'message': {
+        'message_id': 1,
+        'date': int(time.time()),
+        'chat': {'id': user_id, 'type': 'private'},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': 'Иван'},
+        'text': text,
+        **({'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(text)}]} if text.startswith('/') else {}),
+    }}
+
+
+def _callback(user_id, data):
+    return {'callback_query': {
+        'id': str(user_id),
+        'from': {'id': user_id, 'is_bot': False, 'first_name': 'Иван'},
+        'chat_instance': str(user_id),
+        'data': data,
+        'message': {'message_id': 1, 'date': int(time.time()), 'chat': {'id': user_id, 'type': 'private'},
+                    'text': 'menu'},
+    }}
+
+
+def _flow(user_id):
+    return [
+        _message(user_id, '/start'),
+        _callback(user_id, 'buy_ticket'),
+        _message(user_id, NAME),
+        _message(user_id, UNIVERSITY),
+        _callback(user_id, 'faculty_computer_studies'),
+        _callback(user_id, 'info_source_friends'),
+        _callback(user_id, 'confirm_yes'),
+    ]
+
+
+def _updates(user_id):
+    return [types.Update.de_json(dict(update, update_id=index)) for index, update in enumerate(_flow(user_id), 1)]
+
+
+def _expected_texts():
+    return [
+        MENU_PLANS['main_menu_new'].text.format(first_name='Иван'),
+        TEXTS['payment_instructions'],
+        registration.ASK_UNIVERSITY,
+        MENU_PLANS['faculty_menu'].text,
+        MENU_PLANS['info_source_menu'].text,
+        MENU_PLANS['confirmation_menu'].text.format(
+            name=NAME, university=UNIVERSITY, faculty=registration.FACULTIES['computer_studies'],
+            info_source=registration.INFO_SOURCES['friends']
+        ),
+        MENU_PLANS['main_menu_registered'].text,
+    ]
+
+
+def _run_sync(user_id, monkeypatch):
+    import bot  # noqa: F401  фильтр состояний и обработчики atexit, как при запуске
+    import handlers
+
+    # Обработчики выполняются в вызывающем потоке: состояние меняется до следующего обновления
+    monkeypatch.setattr(handlers.bot, 'threaded', False)
+    for update in _updates(user_id):
+        handlers.bot.process_new_updates([update])
+    return handlers.users[user_id], handlers.bot.get_state(user_id)
+
+
+def _run_async(user_id, monkeypatch):
+    import async_bot  # noqa: F401
+    import async_handlers
+
+    async def drive():
+        for update in _updates(user_id):
+            await async_handlers.bot.process_new_updates([update])
+        state = await async_handlers.bot.get_state(user_id)
+        await async_handlers.bot.close_session()
+        return state
+
+    state = asyncio.run(drive())
+    return async_handlers.users[user_id], state
+
+
+@pytest.mark.parametrize('mode, user_id', [('sync', 3001), ('async', 3002)])
+def test_registration_flow(mock_api, monkeypatch, mode, user_id):
+    sent = []
+    mock_api.listener = lambda method, chat_id, params: chat_id == user_id and sent.append(params.get('text'))
+
+    user, state = (_run_sync if mode == 'sync' else _run_async)(user_id, monkeypatch)
+
+    # Синхронный бот отправляет через фоновую очередь
+    deadline = time.monotonic() + 5
+    while len(sent) < len(_expected_texts()) and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert sent == _expected_texts()
+    assert (user.name, user.university, user.is_registered) == (NAME, UNIVERSITY, True)
+    assert user.faculty == registration.FACULTIES['computer_studies']
+    assert user.info_source == registration.INFO_SOURCES['friends']
+    assert state is None
+
+
+@pytest.mark.parametrize('step, args', [
+    (registration.choose_faculty, ('faculty_unknown',)),
+    (registration.choose_info_source, ('info_source_unknown',)),
+    (registration.confirm, ('confirm_maybe',)),
+])
+def test_unknown_choice_keeps_state(step, args):
+    from models import User
+
+    reply = step(1, User(1, 'u', 'U'), *args)
+    assert reply.alert and reply.state is None and not reply.delete_state and reply.menu is None
+
+
+def test_missing_user_resets_state():
+    reply = registration.enter_name(1, None, NAME)
+    assert reply == registration.Reply(alert=registration.ERROR_RESTART, delete_state=True)
+
+
+def test_entered_values_are_interned():
+    from models import User
+
+    first, second = User(1, 'a', 'A'), User(2, 'b', 'B')
+    # Строки, собранные во время работы, — разные объекты с одинаковым значением
+    registration.enter_university(1, first, ''.join(['Высшая ', 'школа']))
+    registration.enter_university(2, second, ''.join(['Высшая', ' школа']))
+    assert first.university is second.university
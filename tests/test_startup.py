@@ -0,0 +1,26 @@
+from bench_startup import HEAVY_MODULES, measure, parse_importtime
+
+
+def test_reconciliation_modules_are_not_loaded_at_startup():
+    result = measure(eager=False)
+
+    assert result['heavy_loaded'] == []
+
+
+def test_eager_import_is_detected():
+    # Проверка сама по себе замечает модули сверки
+    result = measure(eager=True)
+
+    assert set(result['heavy_loaded']) == set(HEAVY_MODULES)
+
+
+def test_importtime_excludes_benchmark_helpers():
+    stderr = '\n'.join([
+        'import time: self [us] | cumulative | imported package',
+        'import time:        10 |         10 |   mock_bot_api',
+        'import time:         5 |         15 | load_test',
+        'import time:        20 |         20 |   storage',
+        'import time:         7 |         27 | handlers',
+    ])
+
+    assert parse_importtime(stderr) == (27, {'handlers': 27})
@@ -0,0 +1,65 @@
+import json
+import threading
+import time
+import urllib.request
+
+import pytest
+import telebot
+
+from dispatcher import ShardedDispatcher
+from webhook import SECRET_HEADER, WebhookServer
+
+
+def _post(url, update):
+    request = urllib.request.Request(url, data=json.dumps(update).encode(), method='POST', headers={
+        SECRET_HEADER: 'secret', 'Content-Type': 'application/json'
+    })
+    with urllib.request.urlopen(request) as response:
+        return response.status
+
+
+def test_threaded_bot_is_rejected():
+    with pytest.raises(ValueError):
+        WebhookServer(telebot.TeleBot('123:TEST'), 'secret', host='127.0.0.1', port=0)
+
+
+def test_updates_are_ordered_per_user_and_concurrency_is_bounded():
+    bot = telebot.TeleBot('123:TEST', threaded=False)
+    handled = []
+    running = [0, 0]
+    lock = threading.Lock()
+
+    @bot.message_handler(func=lambda message: True)
+    def handle(message):
+        with lock:
+            running[0] += 1
+            running[1] = max(running)
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+            handled.append((message.from_user.id, int(message.text)))
+
+    dispatcher = ShardedDispatcher.install(bot, shards=2, queue_size=100)
+    server = WebhookServer(bot, 'secret', host='127.0.0.1', port=0)
+    serving = threading.Thread(target=server.serve_forever, daemon=True)
+    serving.start()
+    host, port = server.server_address[:2]
+    url = f'http://{host}:{port}{server.path}'
+
+    update_id = 0
+    for seq in range(5):
+        for user_id in (1, 2, 3):
+            update_id += 1
+            assert _post(url, {'update_id': update_id, 'message': {
+                'message_id': update_id, 'date': 0, 'chat': {'id': user_id, 'type': 'private'},
+                'from': {'id': user_id, 'is_bot': False, 'first_name': 'U'}, 'text': str(seq),
+            }}) == 200
+
+    server.shutdown()
+    server.stop()
+    dispatcher.stop()
+
+    assert len(handled) == 15
+    for user_id in (1, 2, 3):
+        assert [seq for uid, seq in handled if uid == user_id] == list(range(5))
+    assert running[1] <= 2
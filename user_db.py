@@ -0,0 +1,166 @@
+import sqlite3
+import threading
+from config import USERS_DB_FILE
+from models import User
+from logger import logger
+
+# Порядок колонок совпадает с ключами User.to_dict()
+COLUMNS = (
+    'user_id',
+    'username',
+    'first_name',
+    'registration_date',
+    'is_registered',
+    'name',
+    'university',
+    'faculty',
+    'info_source',
+    'is_payment_confirmed',
+)
+BOOL_COLUMNS = ('is_registered', 'is_payment_confirmed')
+# Поля, по которым разрешены выборки query_users и iter_user_ids
+QUERY_COLUMNS = ('is_registered', 'is_payment_confirmed', 'university', 'username')
+# Размер страницы iter_user_ids
+QUERY_BATCH_SIZE = 500
+
+# username без объявленного типа: для пользователей без ника в нём хранится числовой user_id
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    username,
+    first_name TEXT,
+    registration_date TEXT,
+    is_registered INTEGER NOT NULL DEFAULT 0,
+    name TEXT,
+    university TEXT,
+    faculty TEXT,
+    info_source TEXT,
+    is_payment_confirmed INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_users_is_registered ON users (is_registered);
+CREATE INDEX IF NOT EXISTS idx_users_is_payment_confirmed ON users (is_payment_confirmed);
+CREATE INDEX IF NOT EXISTS idx_users_university ON users (university);
+CREATE INDEX IF NOT EXISTS idx_users_username ON users (username);
+"""
+
+UPSERT_SQL = (
+    f"INSERT INTO users ({', '.join(COLUMNS)}) VALUES ({', '.join('?' for _ in COLUMNS)}) "
+    f"ON CONFLICT(user_id) DO UPDATE SET "
+    + ', '.join(f"{column} = excluded.{column}" for column in COLUMNS[1:])
+)
+
+_lock = threading.Lock()
+_connection = None
+
+
+def _get_connection():
+    global _connection
+    if _connection is None:
+        connection = sqlite3.connect(USERS_DB_FILE, check_same_thread=False, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.executescript(SCHEMA)
+        _connection = connection
+        logger.info(f"Подключена база пользователей {USERS_DB_FILE}.")
+    return _connection
+
+
+def _to_row(user):
+    data = user.to_dict()
+    return tuple(int(bool(data[column])) if column in BOOL_COLUMNS else data[column] for column in COLUMNS)
+
+
+def _from_row(row):
+    data = dict(row)
+    for column in BOOL_COLUMNS:
+        data[column] = bool(data[column])
+    return User.from_dict(data)
+
+
+def load_users():
+    with _lock:
+        rows = _get_connection().execute('SELECT * FROM users').fetchall()
+    return {row['user_id']: _from_row(row) for row in rows}
+
+
+def save_user(user):
+    with _lock:
+        _get_connection().execute(UPSERT_SQL, _to_row(user))
+
+
+def save_users(users):
+    rows = [_to_row(user) for user in users.values()]
+    with _lock:
+        connection = _get_connection()
+        connection.execute('BEGIN')
+        try:
+            connection.executemany(UPSERT_SQL, rows)
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+
+def _where(filters):
+    unknown = set(filters) - set(QUERY_COLUMNS)
+    if unknown:
+        raise ValueError(f"Недопустимые поля фильтра: {', '.join(sorted(unknown))}")
+    conditions = [f"{column} = ?" for column in filters]
+    params = [int(value) if column in BOOL_COLUMNS else value for column, value in filters.items()]
+    return conditions, params
+
+
+def query_users(**filters):
+    """
+    Возвращает пользователей, подходящих под фильтры, используя индексы.
+
+    :param filters: Значения полей из QUERY_COLUMNS, например is_registered=True
+    :return: Список объектов User
+    """
+    conditions, params = _where(filters)
+    sql = 'SELECT * FROM users' + (f" WHERE {' AND '.join(conditions)}" if conditions else '')
+    with _lock:
+        rows = _get_connection().execute(sql, params).fetchall()
+    return [_from_row(row) for row in rows]
+
+
+def iter_user_ids(batch_size=QUERY_BATCH_SIZE, **filters):
+    """
+    Отдаёт user_id подходящих пользователей по возрастанию.
+
+    Выборка читается страницами по первичному ключу: в памяти не больше
+    batch_size строк, а блокировка соединения не держится между страницами.
+
+    :param batch_size: Строк в одном запросе
+    :param filters: Значения полей из QUERY_COLUMNS
+    """
+    conditions, params = _where(filters)
+    sql = f"SELECT user_id FROM users WHERE {' AND '.join(conditions + ['user_id > ?'])} ORDER BY user_id LIMIT ?"
+    last_id = -1
+    while True:
+        with _lock:
+            rows = _get_connection().execute(sql, params + [last_id, batch_size]).fetchall()
+        for row in rows:
+            yield row['user_id']
+        if len(rows) < batch_size:
+            return
+        last_id = rows[-1]['user_id']
+
+
+def migrate_from_json():
+    """
+    Переносит пользователей из users.json (со всеми записями журнала) в SQLite.
+
+    Повторный запуск безопасен: существующие строки обновляются.
+    """
+    from storage import load_json_users
+
+    users = load_json_users()
+    save_users(users)
+    logger.info(f"В базу {USERS_DB_FILE} перенесено пользователей: {len(users)}.")
+    return len(users)
+
+
+if __name__ == "__main__":
+    migrate_from_json()
@@ -0,0 +1,182 @@
+"""
+Приём обновлений Telegram через вебхук.
+
+Встроенный HTTP-сервер принимает POST-запросы от Telegram, проверяет
+секретный токен и кладёт обновления в ограниченную очередь. Один поток
+передаёт их по порядку в bot.process_new_updates, а обработчики выполняет
+диспетчер обновлений (dispatcher.ShardedDispatcher): число его очередей
+ограничивает одновременные обработчики, а обновления одного пользователя
+обрабатываются по порядку. Бот с threaded=True не подходит: telebot
+вернёт управление сразу и выполнит обработчики в своём пуле.
+
+Локальная проверка без Telegram: оставьте WEBHOOK_URL пустым, запустите
+бота с BOT_MODE = 'webhook' и отправьте сохранённое обновление:
+    curl -X POST http://127.0.0.1:8443/telegram/webhook \\
+         -H 'X-Telegram-Bot-Api-Secret-Token: <WEBHOOK_SECRET_TOKEN>' \\
+         -H 'Content-Type: application/json' -d @update.json
+"""
+import hmac
+import json
+import queue
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from telebot import types
+
+from config import (
+    WEBHOOK_HOST,
+    WEBHOOK_PORT,
+    WEBHOOK_PATH,
+    WEBHOOK_QUEUE_SIZE
+)
+from logger import logger
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+# Telegram не присылает обновления больше нескольких сотен килобайт
+MAX_BODY_SIZE = 1 << 20
+
+
+class _WebhookRequestHandler(BaseHTTPRequestHandler):
+    server_version = 'NightBotWebhook'
+
+    def do_POST(self):
+        webhook = self.server.webhook
+        if self.path != webhook.path:
+            self._respond(404)
+            return
+        token = self.headers.get(SECRET_HEADER, '')
+        if not hmac.compare_digest(token.encode(), webhook.secret_token.encode()):
+            logger.warning(f"Вебхук: запрос с неверным секретным токеном от {self.client_address[0]}.")
+            self._respond(403)
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            length = -1
+        if length <= 0 or length > MAX_BODY_SIZE:
+            self._respond(400)
+            return
+        try:
+            update = types.Update.de_json(json.loads(self.rfile.read(length)))
+        except (ValueError, KeyError, TypeError) as e:
+            logger.error(f"Вебхук: не удалось разобрать обновление: {e}")
+            self._respond(400)
+            return
+        if not webhook.submit(update):
+            # Telegram повторит доставку позже
+            self._respond(503)
+            return
+        self._respond(200)
+
+    def do_GET(self):
+        self._respond(405)
+
+    def _respond(self, status):
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        logger.debug("Вебхук: %s " + format, self.address_string(), *args)
+
+
+class WebhookServer:
+    """
+    HTTP-сервер вебхука с ограниченной очередью.
+
+    Если очередь заполнена, сервер отвечает 503 и Telegram доставит
+    обновление повторно, поэтому память не растёт при всплеске нагрузки.
+
+    :param bot: TeleBot с threaded=False и установленным ShardedDispatcher
+    """
+
+    def __init__(self, bot, secret_token, host=WEBHOOK_HOST, port=WEBHOOK_PORT, path=WEBHOOK_PATH,
+                 queue_size=WEBHOOK_QUEUE_SIZE):
+        if getattr(bot, 'threaded', False):
+            raise ValueError("Вебхуку нужен бот с threaded=False и диспетчером обновлений.")
+        self.bot = bot
+        self.secret_token = secret_token
+        self.path = path
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self._stats = {'received': 0, 'processed': 0, 'rejected': 0, 'errors': 0}
+        self._httpd = ThreadingHTTPServer((host, port), _WebhookRequestHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.webhook = self
+
+    @property
+    def server_address(self):
+        return self._httpd.server_address
+
+    def submit(self, update):
+        """
+        Ставит обновление в очередь.
+
+        :return: False, если очередь заполнена
+        """
+        try:
+            self._queue.put_nowait(update)
+        except queue.Full:
+            with self._stats_lock:
+                self._stats['rejected'] += 1
+            logger.warning(f"Вебхук: очередь заполнена ({self._queue.maxsize}), обновление {update.update_id} отклонено.")
+            return False
+        with self._stats_lock:
+            self._stats['received'] += 1
+        return True
+
+    def _work(self):
+        while True:
+            update = self._queue.get()
+            if update is None:
+                return
+            try:
+                self.bot.process_new_updates([update])
+                with self._stats_lock:
+                    self._stats['processed'] += 1
+            except Exception as e:
+                with self._stats_lock:
+                    self._stats['errors'] += 1
+                logger.error(f"Вебхук: ошибка при обработке обновления {update.update_id}: {e}")
+
+    def start_worker(self):
+        # Один поток: несколько потоков могли бы переставить обновления пользователя до диспетчера
+        self._thread = threading.Thread(target=self._work, name='webhook-worker', daemon=True)
+        self._thread.start()
+
+    def serve_forever(self):
+        """
+        Запускает поток передачи обновлений и обслуживает запросы до остановки.
+        """
+        self.start_worker()
+        host, port = self.server_address[:2]
+        logger.info(f"Вебхук слушает http://{host}:{port}{self.path}.")
+        self._httpd.serve_forever()
+
+    def shutdown(self):
+        """
+        Останавливает приём запросов из другого потока.
+        """
+        self._httpd.shutdown()
+
+    def stop(self):
+        """
+        Закрывает сокет и передаёт диспетчеру уже принятые обновления.
+
+        Обработчики к этому моменту могут ещё выполняться: их дожидается
+        dispatcher.stop, который bot.py вызывает при выходе до записи
+        отложенных изменений.
+        """
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        logger.info(f"Вебхук остановлен: {self.stats()}")
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['queued'] = self._queue.qsize()
+        return stats
@@ -0,0 +1,113 @@
+import threading
+import time
+from logger import logger
+
+
+class WriteBehindFlusher:
+    """
+    Отложенная пакетная запись пользователей.
+
+    Обработчики только помечают пользователя изменённым, а фоновый поток
+    объединяет все изменения за окно interval_ms (или до max_batch пользователей)
+    в одну запись через save_batch.
+    """
+
+    def __init__(self, save_batch, interval_ms, max_batch):
+        self.save_batch = save_batch
+        self.interval = interval_ms / 1000
+        self.max_batch = max_batch
+        self._dirty = {}
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._stopping = False
+        self._stats = {
+            'flushes': 0,
+            'users_flushed': 0,
+            'errors': 0,
+            'last_batch_size': 0,
+            'max_batch_size': 0,
+            'last_flush_ms': 0.0,
+            'max_flush_ms': 0.0,
+            'total_flush_ms': 0.0,
+        }
+
+    def mark_dirty(self, user):
+        with self._condition:
+            stopped = self._stopping
+            if not stopped:
+                self._dirty[user.user_id] = user
+            if self._thread is None and not self._stopping:
+                self._thread = threading.Thread(target=self._run, name='users-write-behind', daemon=True)
+                self._thread.start()
+            if len(self._dirty) >= self.max_batch:
+                self._condition.notify()
+        if stopped:
+            # После остановки фонового потока изменения записываются сразу
+            self.save_batch({user.user_id: user})
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._dirty or self._stopping)
+                if self._stopping:
+                    return
+                # Первое изменение в пакете ждёт не дольше окна долговечности
+                self._condition.wait_for(
+                    lambda: len(self._dirty) >= self.max_batch or self._stopping,
+                    timeout=self.interval
+                )
+                if self._stopping:
+                    return
+            self.flush()
+
+    def flush(self):
+        """
+        Синхронно записывает всех помеченных пользователей одной операцией.
+        """
+        with self._flush_lock:
+            with self._condition:
+                batch, self._dirty = self._dirty, {}
+            if not batch:
+                return
+            started = time.perf_counter()
+            try:
+                self.save_batch(batch)
+            except Exception as e:
+                with self._condition:
+                    # Возвращаем пакет, не затирая более свежие пометки
+                    for user_id, user in batch.items():
+                        self._dirty.setdefault(user_id, user)
+                    self._stats['errors'] += 1
+                logger.error(f"Ошибка при отложенной записи {len(batch)} пользователей: {e}")
+                return
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with self._condition:
+                stats = self._stats
+                stats['flushes'] += 1
+                stats['users_flushed'] += len(batch)
+                stats['last_batch_size'] = len(batch)
+                stats['max_batch_size'] = max(stats['max_batch_size'], len(batch))
+                stats['last_flush_ms'] = elapsed_ms
+                stats['max_flush_ms'] = max(stats['max_flush_ms'], elapsed_ms)
+                stats['total_flush_ms'] += elapsed_ms
+        logger.debug("Записан пакет из %s пользователей за %.1f мс.", len(batch), elapsed_ms)
+
+    def stop(self):
+        """
+        Останавливает фоновый поток и записывает оставшиеся изменения.
+        """
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+        self.flush()
+
+    def stats(self):
+        with self._condition:
+            stats = dict(self._stats)
+            stats['pending'] = len(self._dirty)
+        stats['avg_flush_ms'] = stats['total_flush_ms'] / stats['flushes'] if stats['flushes'] else 0.0
+        return stats